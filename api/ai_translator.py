@@ -148,9 +148,10 @@ Return ONLY a JSON object matching this exact structure:
             "issues": []
         }
 
-def translate_repo_findings(code_context: str, language: str, findings: list, code_indexer=None) -> dict:
+def translate_repo_findings(code_context: str, language: str, findings: list, code_indexer=None, index_namespace: str = "default") -> dict:
     """
     Two-Stage LLM Pipeline for scanning entire repositories.
+    Stage 0: Context enrichment from the repository's symbol index (`index_namespace`)
     Stage 1: gemini-2.5-pro (Deep Scan)
     Stage 2: gemini-2.5-flash (Filter & Format)
     """
@@ -163,10 +164,14 @@ def translate_repo_findings(code_context: str, language: str, findings: list, co
         enriched_context = ""
         if code_indexer:
             print("🔍 Querying Index for relevant symbol definitions...")
-            # Query the indexer for relevant definitions based on the code_context
-            # We take a sample or the whole context if it's not too large
-            query_results = code_indexer.query_context(code_context, n_results=5)
-            if query_results and query_results['documents']:
+            # Prefer callers/callees of the flagged code from the symbol graph; fall back to
+            # lexical search with the flagged code if we have findings, else the whole context
+            query_results = code_indexer.related_definitions(findings, n_results=5, namespace=index_namespace)
+            if not query_results['documents'][0]:
+                finding_snippets = [f.get("code snippet", "") for f in findings if f.get("code snippet")]
+                query_text = "\n".join(finding_snippets) if finding_snippets else code_context
+                query_results = code_indexer.query_context(query_text, n_results=5, namespace=index_namespace)
+            if query_results and query_results['documents'] and query_results['documents'][0]:
                 enriched_context = "\n--- CROSS-FILE SYMBOL DEFINITIONS (INDEX) ---\n"
                 for doc, meta in zip(query_results['documents'][0], query_results['metadatas'][0]):
                     enriched_context += f"File: {meta['file']}\n```\n{doc}\n```\n"
@@ -0,0 +1,99 @@
+"""
+Vouch Archive Filesystem
+Read-only view of an uploaded repository ZIP. Members are listed from the central
+directory, and `extract_scan_targets` writes out only the files the scanners analyze:
+no assets, binaries, oversized files, symbolic links or vendored dependency trees. Every
+target is checked against the real extraction directory before it is written. Later
+stages read the extracted files through a repository manifest (manifest.py).
+
+Set VOUCH_EXTRACT_DIR to a tmpfs mount (e.g. /dev/shm) to keep extracted files in memory.
+"""
+import os
+import posixpath
+import shutil
+import stat
+import zipfile
+
+# Where scan targets are extracted (default: next to the spooled upload)
+EXTRACT_DIR = os.environ.get("VOUCH_EXTRACT_DIR") or None
+# Larger files are not extracted (Semgrep skips files over 1MB by default)
+MAX_SCAN_FILE_BYTES = int(os.environ.get("VOUCH_MAX_SCAN_FILE_BYTES") or 1_000_000)
+
+# Dependency, VCS and build directories that are not the user's code
+SKIPPED_DIRS = {
+    "node_modules", "bower_components", "jspm_packages", "vendor", ".git", ".hg", ".svn",
+    "__pycache__", ".venv", "venv", ".tox", ".mypy_cache", ".pytest_cache", ".next", ".nuxt",
+}
+# Assets and binaries no scanner reads
+SKIPPED_EXTENSIONS = {
+    ".png", ".jpg", ".jpeg", ".gif", ".bmp", ".ico", ".webp", ".tif", ".tiff", ".psd",
+    ".woff", ".woff2", ".ttf", ".otf", ".eot",
+    ".mp3", ".mp4", ".wav", ".ogg", ".mov", ".avi", ".webm", ".flac",
+    ".zip", ".tar", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar", ".jar", ".war",
+    ".exe", ".dll", ".so", ".dylib", ".o", ".a", ".class", ".pyc", ".pyo", ".wasm", ".bin",
+    ".pdf", ".sqlite", ".sqlite3", ".db", ".map",
+}
+# Dependency manifests npm audit needs, extracted whatever their size
+DEPENDENCY_MANIFESTS = {"package.json", "package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml"}
+
+
+def is_scan_target(name: str, size: int) -> bool:
+    """Whether a member (a relative POSIX path) is worth extracting for the scanners."""
+    parts = name.split("/")
+    if any(part in SKIPPED_DIRS for part in parts[:-1]):
+        return False
+    filename = parts[-1]
+    if filename in DEPENDENCY_MANIFESTS:
+        return True
+    if filename.endswith(".min.js") or posixpath.splitext(filename)[1].lower() in SKIPPED_EXTENSIONS:
+        return False
+    return size <= MAX_SCAN_FILE_BYTES
+
+
+def _is_symlink(info: zipfile.ZipInfo) -> bool:
+    return stat.S_ISLNK(info.external_attr >> 16)
+
+
+class ArchiveFS:
+    """Lists the files of a ZIP archive and extracts the ones worth scanning (directories are implied by member paths)."""
+
+    def __init__(self, zip_path: str):
+        self._zip = zipfile.ZipFile(zip_path, 'r')
+        self._members = {info.filename: info for info in self._zip.infolist() if not info.is_dir()}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._zip.close()
+
+    def files(self) -> list:
+        """Relative POSIX paths of every file, in archive order."""
+        return list(self._members)
+
+    def extract_scan_targets(self, dest: str) -> tuple:
+        """
+        Extracts the members selected by `is_scan_target` under `dest`; symbolic links are
+        skipped. Raises ValueError if a member would be written outside of `dest`.
+        Returns (files extracted, bytes extracted).
+        """
+        os.makedirs(dest, exist_ok=True)
+        root = os.path.realpath(dest)
+        count = total = 0
+        for name, info in self._members.items():
+            if _is_symlink(info) or not is_scan_target(name, info.file_size):
+                continue
+            # Resolved against the directory actually written to, including any symlinks in it
+            target = os.path.realpath(os.path.join(root, *name.split("/")))
+            if os.path.isabs(name) or os.path.commonpath([root, target]) != root or target == root:
+                raise ValueError(f"Archive member '{name}' escapes the extraction directory")
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_NOFOLLOW", 0), 0o644)
+            with self._zip.open(info) as src, open(fd, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            count += 1
+            total += info.file_size
+        return count, total
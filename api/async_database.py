@@ -0,0 +1,54 @@
+"""
+Vouch Async Database Access
+Awaitable versions of the database.py functions for async request handlers and
+background tasks. Queries run on a dedicated thread pool sized to the connection
+pool, so the event loop keeps serving other requests while one waits on the database
+and no thread ever queues for a connection it cannot get.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+
+_executor = ThreadPoolExecutor(max_workers=database.DB_POOL_MAX_SIZE, thread_name_prefix="vouch-db")
+
+
+def _run_in_executor(func):
+    """Wraps a blocking database function into a coroutine function with the same signature."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+    return wrapper
+
+
+def shutdown():
+    """Waits for in-flight queries and stops the executor threads."""
+    _executor.shutdown(wait=True)
+
+
+get_or_create_user = _run_in_executor(database.get_or_create_user)
+generate_api_key = _run_in_executor(database.generate_api_key)
+get_user_by_api_key = _run_in_executor(database.get_user_by_api_key)
+link_github_installation = _run_in_executor(database.link_github_installation)
+get_user_by_installation_id = _run_in_executor(database.get_user_by_installation_id)
+get_latest_score_by_installation = _run_in_executor(database.get_latest_score_by_installation)
+increment_scan_count = _run_in_executor(database.increment_scan_count)
+add_credits = _run_in_executor(database.add_credits)
+update_subscription = _run_in_executor(database.update_subscription)
+save_scan = _run_in_executor(database.save_scan)
+get_all_scans = _run_in_executor(database.get_all_scans)
+get_scan_by_id = _run_in_executor(database.get_scan_by_id)
+get_scan_analytics = _run_in_executor(database.get_scan_analytics)
+delete_scan = _run_in_executor(database.delete_scan)
+archive_old_scans = _run_in_executor(database.archive_old_scans)
+ignore_finding = _run_in_executor(database.ignore_finding)
+ignore_findings = _run_in_executor(database.ignore_findings)
+get_ignored_findings = _run_in_executor(database.get_ignored_findings)
+is_finding_ignored = _run_in_executor(database.is_finding_ignored)
+create_job = _run_in_executor(database.create_job)
+get_job = _run_in_executor(database.get_job)
+claim_job_by_id = _run_in_executor(database.claim_job_by_id)
+get_job_stats = _run_in_executor(database.get_job_stats)
+get_pool_stats = _run_in_executor(database.get_pool_stats)
@@ -0,0 +1,68 @@
+"""
+Vouch Badges
+Pre-rendered SVG security badges. Every possible score (0-100) is rendered once at
+import, so serving a badge is a dictionary lookup.
+"""
+import hashlib
+import re
+
+# Cache for 1 hour so GitHub doesn't hammer our API when viewers look at READMEs
+BADGE_CACHE_CONTROL = "public, max-age=3600"
+# One entity tag of an If-None-Match list (opaque tags may contain commas)
+_ENTITY_TAG_RE = re.compile(r'(?:W/)?("[^"]*")')
+
+_TEMPLATE = '''<svg xmlns="http://www.w3.org/2000/svg" width="130" height="20">
+  <linearGradient id="b" x2="0" y2="100%">
+    <stop offset="0" stop-color="#bbb" stop-opacity=".1"/>
+    <stop offset="1" stop-opacity=".1"/>
+  </linearGradient>
+  <mask id="a">
+    <rect width="130" height="20" rx="3" fill="#fff"/>
+  </mask>
+  <g mask="url(#a)">
+    <path fill="#555" d="M0 0h75v20H0z"/>
+    <path fill="{color}" d="M75 0h55v20H75z"/>
+    <path fill="url(#b)" d="M0 0h130v20H0z"/>
+  </g>
+  <g fill="#fff" text-anchor="middle" font-family="DejaVu Sans,Verdana,Geneva,sans-serif" font-size="11">
+    <text x="37.5" y="15" fill="#010101" fill-opacity=".3">Vouch</text>
+    <text x="37.5" y="14">Vouch</text>
+    <text x="101.5" y="15" fill="#010101" fill-opacity=".3">Score {score}</text>
+    <text x="101.5" y="14">Score {score}</text>
+  </g>
+</svg>'''
+
+
+def badge_color(score: int) -> str:
+    """Tailwind palette colour for a score."""
+    if score >= 90:
+        return "#4ade80"  # Green
+    elif score >= 70:
+        return "#facc15"  # Yellow
+    return "#f87171"  # Red
+
+
+def _render(score: int) -> tuple:
+    svg = _TEMPLATE.format(color=badge_color(score), score=score).encode("utf-8")
+    etag = '"' + hashlib.sha256(svg).hexdigest()[:16] + '"'
+    return svg, etag
+
+
+_BADGES = {score: _render(score) for score in range(101)}
+
+
+def get_badge(score: int) -> tuple:
+    """Returns (svg bytes, ETag) for a score, clamped to 0-100."""
+    return _BADGES[max(0, min(100, int(score)))]
+
+
+def etag_matches(if_none_match, etag: str) -> bool:
+    """
+    Whether an If-None-Match header value matches `etag`: "*", or a list of entity tags
+    compared weakly (a W/ prefix is ignored), as RFC 9110 specifies for GET.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in _ENTITY_TAG_RE.findall(if_none_match)
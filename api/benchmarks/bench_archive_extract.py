@@ -0,0 +1,87 @@
+"""
+Upload extraction benchmark. Builds a ZIP shaped like a typical JavaScript repository
+upload (source files, a node_modules tree, images and a large lockfile), then times the
+steps before the scanners run, and reports the bytes written to disk:
+  full      extract everything, then detect the language and read the LLM context
+            by walking the extracted tree (the pipeline before scan-target extraction)
+  targets   extract only the scanner targets (ArchiveFS.extract_scan_targets), then
+            detect the language and read the context through a manifest (current pipeline)
+
+Usage (from the api/ directory):
+    python benchmarks/bench_archive_extract.py [--rounds 3]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pipeline  # noqa: E402
+from archive_fs import ArchiveFS  # noqa: E402
+from manifest import build_manifest  # noqa: E402
+
+
+def _build_upload(path: str):
+    random.seed(1)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        for i in range(100):
+            z.writestr(f"src/m{i}.py", ("def f%d(x):\n    return x\n" % i) * 400)
+        for i in range(300):
+            z.writestr(f"node_modules/pkg{i}/index.js", "module.exports = function(){return 1};\n" * 500)
+        for i in range(60):
+            z.writestr(f"assets/img{i}.png", random.randbytes(1_500_000))
+        z.writestr("package.json", '{"name": "bench"}')
+        z.writestr("package-lock.json", "{}" + " " * 2_000_000)
+
+
+def _bytes_under(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(directory) for f in files)
+
+
+def full(zip_path: str, dest: str) -> tuple:
+    with zipfile.ZipFile(zip_path) as z:
+        z.extractall(dest)
+    language = pipeline.detect_language(directory=dest)
+    pipeline.get_repo_context(dest)
+    return language, _bytes_under(dest)
+
+
+def targets(zip_path: str, dest: str) -> tuple:
+    with ArchiveFS(zip_path) as archive:
+        archive.extract_scan_targets(dest)
+    manifest = build_manifest(dest)
+    language = pipeline.detect_language(files=manifest.paths())
+    pipeline.get_repo_context(manifest=manifest)
+    return language, manifest.total_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rounds", type=int, default=3, help="runs per variant (the fastest is reported)")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        zip_path = os.path.join(work_dir, "upload.zip")
+        _build_upload(zip_path)
+        print(f"Upload: {os.path.getsize(zip_path) / 1e6:.1f}MB")
+        for variant in (full, targets):
+            best = None
+            for _ in range(args.rounds):
+                dest = tempfile.mkdtemp(dir=work_dir)
+                started = time.perf_counter()
+                language, written = variant(zip_path, dest)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+                shutil.rmtree(dest)
+            print(f"{variant.__name__:>8}: {best:.2f}s, {written / 1e6:.1f}MB written, language {language}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
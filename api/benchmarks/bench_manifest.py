@@ -0,0 +1,112 @@
+"""
+Repository manifest benchmark. Generates an extracted repository (3,200 text files,
+about 21MB, a tenth with CRLF line endings or non-ASCII text) and its ZIP, then times
+the reads that follow extraction, with a warm page cache:
+  walks      language detection and the LLM context read from the archive, and the
+             indexer's own os.walk, read and hash of every source file (before the manifest)
+  manifest   one build_manifest pass, with language detection, the LLM context and the
+             indexer's candidates and hashes all served from it
+Both variants must produce the same language and index hashes.
+
+Usage (from the api/ directory):
+    python benchmarks/bench_manifest.py [--rounds 5]
+"""
+import argparse
+import hashlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pipeline  # noqa: E402
+from archive_fs import ArchiveFS  # noqa: E402
+from manifest import build_manifest  # noqa: E402
+from symbol_extractor import LANGUAGE_BY_EXTENSION  # noqa: E402
+
+
+def _build_repository(source: str, zip_path: str, extract_dir: str):
+    random.seed(1)
+    for d in range(80):
+        directory = os.path.join(source, f"pkg{d}", "mod")
+        os.makedirs(directory)
+        for i in range(40):
+            ext = random.choice([".py", ".js", ".ts", ".md", ".json", ".tsx"])
+            newline = "\r\n" if random.random() < 0.1 else "\n"
+            letter = "é" if random.random() < 0.1 else "e"
+            body = "".join(f"def f{j}(x):{newline}    return x  # {letter}{newline}" for j in range(random.randint(20, 400)))
+            with open(os.path.join(directory, f"f{i}{ext}"), "w", newline="", encoding="utf-8") as f:
+                f.write(body)
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as z:
+        for root, _, files in os.walk(source):
+            for file in files:
+                path = os.path.join(root, file)
+                z.write(path, os.path.relpath(path, source).replace(os.sep, "/"))
+    with ArchiveFS(zip_path) as archive:
+        archive.extract_scan_targets(extract_dir)
+
+
+def walks(zip_path: str, root: str) -> tuple:
+    with zipfile.ZipFile(zip_path) as z:
+        names = [info.filename for info in z.infolist() if not info.is_dir()]
+        language = pipeline.detect_language(files=names)
+        context = []
+        for name in names[:50]:
+            with io.TextIOWrapper(z.open(name), encoding="utf-8") as f:
+                context.append(pipeline._redact_sensitive_lines(f.read(50000)))
+    hashes = {}
+    for directory, _, files in os.walk(root):
+        for file in files:
+            if file.endswith(tuple(LANGUAGE_BY_EXTENSION)):
+                path = os.path.join(directory, file)
+                with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                    content = f.read()
+                hashes[os.path.relpath(path, root).replace(os.sep, "/")] = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    return language, hashes
+
+
+def manifest(zip_path: str, root: str) -> tuple:
+    repo = build_manifest(root)
+    language = pipeline.detect_language(files=repo.paths())
+    pipeline.get_repo_context(manifest=repo)
+    hashes = {}
+    for path in repo.paths():
+        if path.endswith(tuple(LANGUAGE_BY_EXTENSION)):
+            content = repo.read_text(path, errors='ignore')
+            hashes[path] = repo.text_sha256(path, content)
+    return language, hashes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rounds", type=int, default=5, help="runs per variant (the fastest is reported)")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        zip_path = os.path.join(work_dir, "upload.zip")
+        root = os.path.join(work_dir, "extracted")
+        _build_repository(os.path.join(work_dir, "source"), zip_path, root)
+        repo = build_manifest(root)
+        print(f"Repository: {len(repo)} files, {repo.total_bytes / 1e6:.1f}MB")
+
+        results = {}
+        for variant in (walks, manifest):
+            best = None
+            for _ in range(args.rounds):
+                started = time.perf_counter()
+                results[variant.__name__] = variant(zip_path, root)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{variant.__name__:>8}: {best * 1000:.0f}ms")
+        assert results["walks"] == results["manifest"], "language or index hashes differ"
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
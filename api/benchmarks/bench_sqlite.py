@@ -0,0 +1,97 @@
+"""
+SQLite local-mode load benchmark. Threads (optionally in several processes) each loop
+save_scan (10 issues), a history page, the scan detail and ignore_finding against a fresh
+database file, and report throughput and failed operations.
+
+Usage (from the api/ directory):
+    python benchmarks/bench_sqlite.py                        # 1 process x 8 threads
+    python benchmarks/bench_sqlite.py --processes 4 --threads 4 --iterations 40
+    python benchmarks/bench_sqlite.py --api /path/to/other/checkout/api   # compare revisions
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _database(api_dir: str, db_path: str):
+    sys.path.insert(0, api_dir)
+    import database
+    database.SQLITE_PATH = db_path
+    database.DATABASE_URL = None
+    return database
+
+
+def _run_threads(database, process_index: int, threads: int, iterations: int) -> int:
+    failures = [0]
+    issues = [{"title": f"Issue {j}", "description": "d" * 200} for j in range(10)]
+
+    def worker(i):
+        user_id = f"bench-user-{i}"
+        for n in range(iterations):
+            scan_id = database.save_scan("repo", "python", {"score": n, "issues": issues}, user_id)
+            if not scan_id:
+                failures[0] += 1
+            database.get_all_scans(user_id=user_id)
+            if scan_id:
+                database.get_scan_by_id(scan_id)
+            if not database.ignore_finding(user_id, f"repo-{process_index}", f"file-{n}", "hash"):
+                failures[0] += 1
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return failures[0]
+
+
+def _process_main(api_dir, db_path, process_index, threads, iterations, results):
+    database = _database(api_dir, db_path)
+    results.put(_run_threads(database, process_index, threads, iterations))
+    database.close_pool()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=60)
+    parser.add_argument("--api", default=API_DIR, help="api/ directory whose database module is measured")
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    database = _database(args.api, db_path)
+    database.init_db()
+    for i in range(args.threads):
+        database.get_or_create_user(f"bench-user-{i}")
+
+    started = time.perf_counter()
+    if args.processes == 1:
+        failures = _run_threads(database, 0, args.threads, args.iterations)
+    else:
+        database.close_pool()
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=_process_main, args=(args.api, db_path, k, args.threads, args.iterations, results))
+            for k in range(args.processes)
+        ]
+        for p in processes:
+            p.start()
+        failures = sum(results.get() for _ in processes)
+        for p in processes:
+            p.join()
+    elapsed = time.perf_counter() - started
+
+    ops = args.processes * args.threads * args.iterations * 4
+    print(f"{args.processes} process(es) x {args.threads} threads, {ops} ops: "
+          f"{elapsed:.2f}s ({ops / elapsed:.0f} ops/s), {failures} failed")
+
+
+if __name__ == "__main__":
+    main()
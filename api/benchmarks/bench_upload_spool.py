@@ -0,0 +1,80 @@
+"""
+Upload spooling benchmark. Copies, hashes and validates a generated ZIP upload the way
+/scan-repo does (api._spool_upload, fixed-size chunks) and the way it did before
+(one file.read() of the whole upload), reporting time and peak Python allocation
+(tracemalloc). Also checks that an upload over MAX_UPLOAD_SIZE_MB is cut off early.
+
+Usage (from the api/ directory):
+    python benchmarks/bench_upload_spool.py [--size-mb 42]
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main as api  # noqa: E402
+
+
+def _read_whole(source, zip_path: str, extract_dir: str) -> str:
+    """The handler before streaming: the whole upload in memory at once."""
+    contents = source.read()
+    with open(zip_path, 'wb') as f:
+        f.write(contents)
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        api._validate_zip_safety(zip_ref, extract_dir)
+    return hashlib.sha256(contents).hexdigest()
+
+
+def _measure(spool, source, work_dir: str, name: str) -> tuple:
+    source.seek(0)
+    tracemalloc.start()
+    started = time.perf_counter()
+    digest = spool(source, os.path.join(work_dir, f"{name}.zip"), os.path.join(work_dir, "extracted"))
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return digest, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size-mb", type=int, default=42, help="size of the generated upload")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        # Random (incompressible) members, so the ZIP is as large as its contents
+        source = tempfile.TemporaryFile()
+        with zipfile.ZipFile(source, "w", zipfile.ZIP_STORED) as z:
+            for i in range(args.size_mb):
+                z.writestr(f"data/file{i}.bin", os.urandom(1024 * 1024))
+        source.seek(0, os.SEEK_END)
+        print(f"Upload: {source.tell() / 2**20:.1f}MiB")
+
+        before = _measure(_read_whole, source, work_dir, "before")
+        after = _measure(api._spool_upload, source, work_dir, "after")
+        assert before[0] == after[0], "digests differ"
+        for label, (_, elapsed, peak) in (("read whole", before), ("chunked", after)):
+            print(f"{label:>10}: {elapsed:.2f}s, peak allocation {peak / 2**20:.1f}MiB")
+
+        limit = api.MAX_UPLOAD_SIZE_MB * 1024 * 1024
+        oversized = tempfile.TemporaryFile()
+        oversized.write(b"\0" * (limit + 1024 * 1024))
+        oversized.seek(0)
+        oversized_path = os.path.join(work_dir, "oversized.zip")
+        try:
+            api._spool_upload(oversized, oversized_path, os.path.join(work_dir, "extracted"))
+        except api.HTTPException as e:
+            print(f"Oversized upload rejected ({e.detail}) after copying {os.path.getsize(oversized_path) / 2**20:.1f}MiB")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,374 @@
 """
 Vouch Database Module
 Handles PostgreSQL persistence for scan history via Supabase, with SQLite fallback for local development.
+Connections are pooled: a bounded, health-checked pool for PostgreSQL and one persistent
+connection per thread for SQLite.
 """
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import sqlite3
 import uuid
+import base64
 import json
 import os
 import secrets
 import hashlib
-from datetime import datetime, timezone
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
 from typing import Optional
+from ttl_cache import TTLCache
+import migrations
+import scan_archive
 
 # Connection string for Supabase PostgreSQL (Pooler for IPv4 compatibility)
 DATABASE_URL = os.environ.get("DATABASE_URL")
+SQLITE_PATH = "vibe-code-security.db"
+# Local storage profile: WAL lets readers run alongside the single writer, NORMAL sync is
+# durable across application crashes in WAL mode, and a 64MB page cache keeps history hot
+SQLITE_BUSY_TIMEOUT = 30
+SQLITE_CACHED_STATEMENTS = 256
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA temp_store=MEMORY",
+    f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT * 1000}",
+)
 
-def _get_connection():
-    """Get a database connection (PostgreSQL or SQLite)."""
+# PostgreSQL pool sizing. Connections are opened lazily up to DB_POOL_MAX_SIZE; callers
+# wait up to DB_POOL_TIMEOUT seconds for a free one before failing.
+DB_POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE") or 1)
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE") or 10)
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT") or 10)
+# Idle connections older than this are pinged before reuse (the Supabase pooler drops idle clients)
+DB_POOL_HEALTHCHECK_AFTER = float(os.environ.get("DB_POOL_HEALTHCHECK_AFTER") or 30)
+
+# Issues of scans older than this many days move to compressed cold storage (0 disables)
+SCAN_ARCHIVE_AFTER_DAYS = int(os.environ.get("SCAN_ARCHIVE_AFTER_DAYS") or 90)
+
+# The caches below are per process. Writes that make an entry stale also log it in
+# cache_invalidations, and every process (API or job worker) drops the logged entries
+# before serving from its caches, at most CACHE_SYNC_INTERVAL seconds after the write.
+CACHE_SYNC_INTERVAL = float(os.environ.get("CACHE_SYNC_INTERVAL") or 1)
+# Logged invalidations are re-read for this long (slow commits, clock skew between hosts)
+CACHE_SYNC_LOOKBACK = 60
+# Per-(user, repo) ignored finding sets, kept in memory between scans
+IGNORED_FINDINGS_CACHE_TTL = float(os.environ.get("IGNORED_FINDINGS_CACHE_TTL") or 300)
+_ignored_cache = TTLCache(maxsize=2048, ttl=IGNORED_FINDINGS_CACHE_TTL)
+# Latest badge score per (installation_id, repo); refreshed in place when this process saves a scan
+LATEST_SCORE_CACHE_TTL = float(os.environ.get("LATEST_SCORE_CACHE_TTL") or 300)
+_latest_score_cache = TTLCache(maxsize=10000, ttl=LATEST_SCORE_CACHE_TTL)
+# Hashed API key -> user record ({} for keys that matched no user)
+API_KEY_CACHE_TTL = float(os.environ.get("API_KEY_CACHE_TTL") or 60)
+INVALID_API_KEY_CACHE_TTL = 10
+_api_key_cache = TTLCache(maxsize=4096, ttl=API_KEY_CACHE_TTL)
+# Supabase UID -> user record, for dashboard endpoints
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL") or 60)
+_user_cache = TTLCache(maxsize=4096, ttl=USER_CACHE_TTL)
+_cache_sync_lock = threading.Lock()
+_cache_sync = {"at": None, "since": None, "seen": {}}
+
+
+class PostgresPool:
+    """Thread-safe, bounded pool of psycopg2 connections."""
+
+    def __init__(self, dsn: str, min_size: int, max_size: int, timeout: float):
+        self.dsn = dsn
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = deque()  # (connection, returned_at), most recently used last
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._open = 0
+        self._in_use = 0
+        self._stats = {"acquired": 0, "created": 0, "discarded": 0, "health_check_failures": 0,
+                       "timeouts": 0, "wait_seconds": 0.0}
+        for _ in range(self.min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn)
+        with self._lock:
+            self._open += 1
+            self._stats["created"] += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._open -= 1
+            self._stats["discarded"] += 1
+
+    def _healthy(self, conn, idle_for: float) -> bool:
+        if conn.closed:
+            return False
+        if idle_for < DB_POOL_HEALTHCHECK_AFTER:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            with self._lock:
+                self._stats["health_check_failures"] += 1
+            return False
+
+    def acquire(self):
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise TimeoutError(f"No database connection available within {self.timeout}s")
+        try:
+            conn = None
+            while conn is None:
+                with self._lock:
+                    entry = self._idle.pop() if self._idle else None
+                if entry is None:
+                    conn = self._connect()
+                elif self._healthy(entry[0], time.monotonic() - entry[1]):
+                    conn = entry[0]
+                else:
+                    self._discard(entry[0])
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._in_use += 1
+            self._stats["acquired"] += 1
+            self._stats["wait_seconds"] += time.monotonic() - started
+        return conn
+
+    def release(self, conn, broken: bool = False):
+        try:
+            if not broken and not conn.closed:
+                try:
+                    # Never hand out a connection with an open transaction
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            if broken or conn.closed:
+                self._discard(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"backend": "postgresql", "max_size": self.max_size, "open": self._open,
+                    "in_use": self._in_use, "idle": len(self._idle), **self._stats}
+
+
+class _WriterQueue:
+    """Re-entrant FIFO lock: SQLite allows one writer, so writers queue up in arrival order."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._next_ticket = 0
+        self._serving = 0
+        self._owner = None
+        self._depth = 0
+
+    def acquire(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._owner == me:
+                self._depth += 1
+                return
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            while self._serving != ticket:
+                self._cond.wait()
+            self._owner, self._depth = me, 1
+
+    def release(self):
+        with self._cond:
+            self._depth -= 1
+            if self._depth == 0:
+                self._owner = None
+                self._serving += 1
+                self._cond.notify_all()
+
+    def waiting(self) -> int:
+        with self._cond:
+            return self._next_ticket - self._serving
+
+
+class _ThreadConnection:
+    """A thread's SQLite connection and its borrow depth, held in the pool's thread-local."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.depth = 0
+        self.writes = 0
+
+
+class SQLitePool:
+    """
+    One persistent SQLite connection per thread, reused across calls on that thread.
+    Connections run in WAL mode so readers never block on the writer, and writes go
+    through a single FIFO writer queue with BEGIN IMMEDIATE instead of racing for the
+    database lock. A thread's connection is closed when the thread exits.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writer = _WriterQueue()
+        self._connections = set()
+        self._stats = {"acquired": 0, "created": 0, "closed": 0, "writes": 0}
+
+    def _connect(self):
+        # Only the owning thread uses the connection; the flag lets the exit finalizer close it
+        conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT, cached_statements=SQLITE_CACHED_STATEMENTS,
+                               check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _state(self) -> _ThreadConnection:
+        state = getattr(self._local, "state", None)
+        if state is None:
+            conn = self._connect()
+            state = _ThreadConnection(conn)
+            self._local.state = state
+            with self._lock:
+                self._connections.add(conn)
+                self._stats["created"] += 1
+            # The thread-local drops the holder when the thread exits, which closes its connection
+            weakref.finalize(state, self._close_connection, conn)
+        return state
+
+    def _close_connection(self, conn):
+        with self._lock:
+            if conn not in self._connections:
+                return
+            self._connections.discard(conn)
+            self._stats["closed"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self, write: bool = False):
+        state = self._state()
+        conn = state.conn
+        if write:
+            self._writer.acquire()
+            state.writes += 1
+            if not conn.in_transaction:
+                # Take the write lock up front; a deferred read->write upgrade can fail with SQLITE_BUSY
+                conn.execute("BEGIN IMMEDIATE")
+        state.depth += 1
+        with self._lock:
+            self._stats["acquired"] += 1
+            self._stats["writes"] += write
+        return conn
+
+    def release(self, conn, broken: bool = False, write: bool = False):
+        # Nested borrows on the same thread share the connection; only the outermost cleans up
+        state = self._local.state
+        state.depth -= 1
+        if state.depth == 0 and conn.in_transaction:
+            conn.rollback()
+        if write:
+            state.writes -= 1
+            if state.writes == 0 and conn.in_transaction:
+                conn.rollback()
+            self._writer.release()
+
+    def close(self):
+        with self._lock:
+            connections = list(self._connections)
+        for conn in connections:
+            self._close_connection(conn)
+        self._local = threading.local()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"backend": "sqlite", "open": len(self._connections),
+                    "writers_waiting": self._writer.waiting(), **self._stats}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """Returns the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if DATABASE_URL:
+                    _pool = PostgresPool(DATABASE_URL, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT)
+                else:
+                    _pool = SQLitePool(SQLITE_PATH)
+    return _pool
+
+
+@contextmanager
+def _connection(write: bool = False):
+    """
+    Borrows a pooled connection. Uncommitted work is rolled back when it is returned.
+    Pass `write=True` for borrows that modify data (on SQLite they queue for the single writer).
+    """
+    pool = _get_pool()
     if DATABASE_URL:
-        return psycopg2.connect(DATABASE_URL)
-    return sqlite3.connect("vibe-code-security.db")
+        conn = pool.acquire()
+    else:
+        conn = pool.acquire(write=write)
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.InterfaceError, psycopg2.OperationalError):
+        broken = True
+        raise
+    finally:
+        if DATABASE_URL:
+            pool.release(conn, broken=broken)
+        else:
+            pool.release(conn, write=write)
+
+
+def get_pool_stats() -> dict:
+    """Returns connection pool metrics (sizes and cumulative counters)."""
+    return _get_pool().stats()
+
+
+def close_pool() -> None:
+    """Closes every pooled connection (on shutdown)."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
 
 def _get_cursor(conn):
     """Returns a cursor that returns dictionary-like results."""
     if DATABASE_URL:
         return conn.cursor(cursor_factory=RealDictCursor)
-    conn.row_factory = sqlite3.Row
     return conn.cursor()
 
 def _get_placeholder():
@@ -34,410 +376,994 @@ def _get_placeholder():
     return "%s" if DATABASE_URL else "?"
 
 def init_db():
-    """Create tables if they don't exist."""
-    conn = _get_connection()
+    """Create tables and indexes by applying pending schema migrations."""
     try:
-        cur = conn.cursor()
-        serial_type = "SERIAL PRIMARY KEY" if DATABASE_URL else "INTEGER PRIMARY KEY AUTOINCREMENT"
-        if DATABASE_URL:
-            cur.execute(f"""
-                CREATE TABLE IF NOT EXISTS users (
-                    id              TEXT PRIMARY KEY,
-                    api_key         TEXT UNIQUE,
-                    github_installation_id TEXT UNIQUE,
-                    tier            TEXT DEFAULT 'free',
-                    scan_count      INTEGER DEFAULT 0,
-                    additional_credits INTEGER DEFAULT 0,
-                    stripe_customer_id TEXT,
-                    stripe_subscription_id TEXT,
-                    created_at      TEXT NOT NULL
-                );
-
-                CREATE TABLE IF NOT EXISTS scans (
-                    id          TEXT PRIMARY KEY,
-                    user_id     TEXT REFERENCES users(id) ON DELETE SET NULL,
-                    scan_type   TEXT NOT NULL,
-                    language    TEXT NOT NULL,
-                    score       INTEGER NOT NULL,
-                    summary     TEXT NOT NULL,
-                    created_at  TEXT NOT NULL
-                );
-
-                CREATE TABLE IF NOT EXISTS issues (
-                    id          {serial_type},
-                    scan_id     TEXT NOT NULL REFERENCES scans(id) ON DELETE CASCADE,
-                    title       TEXT NOT NULL,
-                    severity    TEXT NOT NULL,
-                    file        TEXT,
-                    description TEXT,
-                    how_to_fix  TEXT,
-                    fixed_code_snippet TEXT
-                );
-
-                CREATE TABLE IF NOT EXISTS ignored_findings (
-                    id          {serial_type},
-                    user_id     TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                    repo_name   TEXT NOT NULL,
-                    file_path   TEXT NOT NULL,
-                    snippet_hash TEXT NOT NULL,
-                    created_at  TEXT NOT NULL,
-                    UNIQUE(user_id, repo_name, file_path, snippet_hash)
-                );
-            """)
-        else:
-            cur.executescript(f"""
-                CREATE TABLE IF NOT EXISTS users (
-                    id              TEXT PRIMARY KEY,
-                    api_key         TEXT UNIQUE,
-                    github_installation_id TEXT UNIQUE,
-                    tier            TEXT DEFAULT 'free',
-                    scan_count      INTEGER DEFAULT 0,
-                    additional_credits INTEGER DEFAULT 0,
-                    stripe_customer_id TEXT,
-                    stripe_subscription_id TEXT,
-                    created_at      TEXT NOT NULL
-                );
-
-                CREATE TABLE IF NOT EXISTS scans (
-                    id          TEXT PRIMARY KEY,
-                    user_id     TEXT REFERENCES users(id) ON DELETE SET NULL,
-                    scan_type   TEXT NOT NULL,
-                    language    TEXT NOT NULL,
-                    score       INTEGER NOT NULL,
-                    summary     TEXT NOT NULL,
-                    created_at  TEXT NOT NULL
-                );
-
-                CREATE TABLE IF NOT EXISTS issues (
-                    id          {serial_type},
-                    scan_id     TEXT NOT NULL REFERENCES scans(id) ON DELETE CASCADE,
-                    title       TEXT NOT NULL,
-                    severity    TEXT NOT NULL,
-                    file        TEXT,
-                    description TEXT,
-                    how_to_fix  TEXT,
-                    fixed_code_snippet TEXT
-                );
-
-                CREATE TABLE IF NOT EXISTS ignored_findings (
-                    id          {serial_type},
-                    user_id     TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                    repo_name   TEXT NOT NULL,
-                    file_path   TEXT NOT NULL,
-                    snippet_hash TEXT NOT NULL,
-                    created_at  TEXT NOT NULL,
-                    UNIQUE(user_id, repo_name, file_path, snippet_hash)
-                );
-            """)
-        conn.commit()
+        with _connection(write=True) as conn:
+            migrations.apply_migrations(conn, postgres=bool(DATABASE_URL))
         print(f"✅ Vouch {'PostgreSQL' if DATABASE_URL else 'SQLite'} DB initialized.")
     except Exception as e:
         print(f"❌ Error initializing DB: {e}")
-    finally:
-        conn.close()
+
+def peek_user(supabase_uid: str) -> Optional[dict]:
+    """Returns the cached user record for a Supabase UID without querying (None if not cached)."""
+    if _cache_sync_due():
+        return None
+    user = _user_cache.get(supabase_uid)
+    return dict(user) if user is not None else None
 
 def get_or_create_user(supabase_uid: str) -> dict:
     """Get an existing user by Supabase UID, or create one if they don't exist."""
-    conn = _get_connection()
-    try:
+    _sync_caches()
+    user = _user_cache.get(supabase_uid)
+    if user is not None:
+        return dict(user)
+    p = _get_placeholder()
+    with _connection() as conn:
         cur = _get_cursor(conn)
-        p = _get_placeholder()
         cur.execute(f"SELECT * FROM users WHERE id = {p}", (supabase_uid,))
         user = cur.fetchone()
-        if user:
-            return dict(user)
-        
-        # Create new user — id IS the Supabase auth UUID
+    if not user:
+        # Create new user — id IS the Supabase auth UUID (a concurrent request may have won)
         created_at = datetime.now(timezone.utc).isoformat()
-        cur.execute(
-            f"INSERT INTO users (id, created_at) VALUES ({p}, {p})",
-            (supabase_uid, created_at)
-        )
-        conn.commit()
-        
-        cur.execute(f"SELECT * FROM users WHERE id = {p}", (supabase_uid,))
-        return dict(cur.fetchone())
-    finally:
-        conn.close()
+        if DATABASE_URL:
+            insert_sql = "INSERT INTO users (id, created_at) VALUES (%s, %s) ON CONFLICT (id) DO NOTHING"
+        else:
+            insert_sql = "INSERT OR IGNORE INTO users (id, created_at) VALUES (?, ?)"
+        with _connection(write=True) as conn:
+            cur = _get_cursor(conn)
+            cur.execute(insert_sql, (supabase_uid, created_at))
+            conn.commit()
+            cur.execute(f"SELECT * FROM users WHERE id = {p}", (supabase_uid,))
+            user = cur.fetchone()
+    user = dict(user)
+    _user_cache.set(supabase_uid, user)
+    return dict(user)
 
 def generate_api_key(supabase_uid: str) -> str:
     """Generate a new API key for the user, replacing the old one. Returns the raw key."""
     raw_key = "vouch_" + secrets.token_urlsafe(32)
-    hashed_key = hashlib.sha256(raw_key.encode()).hexdigest()
-    conn = _get_connection()
-    try:
-        get_or_create_user(supabase_uid)
+    hashed_key = _hash_api_key(raw_key)
+    get_or_create_user(supabase_uid)
+    with _connection(write=True) as conn:
         cur = conn.cursor()
         p = _get_placeholder()
         cur.execute(
             f"UPDATE users SET api_key = {p} WHERE id = {p}",
             (hashed_key, supabase_uid)
         )
+        cur.execute(*_invalidation_statement("user", supabase_uid))
         conn.commit()
-        return raw_key
-    finally:
-        conn.close()
+    # The old key stops working immediately here, and within CACHE_SYNC_INTERVAL elsewhere
+    _invalidate_user(supabase_uid)
+    return raw_key
+
+def _invalidation_statement(cache: str, key) -> tuple:
+    """(sql, params) logging a stale cache entry; run it in the transaction of the write."""
+    p = _get_placeholder()
+    return (
+        f"INSERT INTO cache_invalidations (cache, cache_key, created_at) VALUES ({p}, {p}, {p})",
+        (cache, json.dumps(key), datetime.now(timezone.utc).isoformat()),
+    )
+
+def _cache_sync_due() -> bool:
+    synced_at = _cache_sync["at"]
+    return synced_at is None or time.monotonic() - synced_at >= CACHE_SYNC_INTERVAL
+
+def _clear_caches() -> None:
+    for cache in (_ignored_cache, _latest_score_cache, _api_key_cache, _user_cache):
+        cache.clear()
+
+def _sync_caches() -> None:
+    """Drops the cache entries that writes in any process logged since the last sync."""
+    if not _cache_sync_due():
+        return
+    with _cache_sync_lock:
+        if not _cache_sync_due():
+            return
+        now = datetime.now(timezone.utc)
+        since, seen = _cache_sync["since"], _cache_sync["seen"]
+        try:
+            rows = []
+            if since is not None:
+                with _connection() as conn:
+                    cur = conn.cursor()
+                    p = _get_placeholder()
+                    cur.execute(
+                        f"SELECT id, cache, cache_key FROM cache_invalidations WHERE created_at >= {p}",
+                        (since.isoformat(),)
+                    )
+                    rows = cur.fetchall()
+        except Exception as e:
+            print(f"Error syncing caches: {e}")
+            rows = []
+        if since is None:
+            # Nothing cached before the first sync was checked against the log
+            _clear_caches()
+        for row_id, cache, cache_key in rows:
+            if row_id in seen:
+                continue
+            seen[row_id] = now
+            key = json.loads(cache_key)
+            if cache == "user":
+                _invalidate_user(key)
+            elif cache == "latest_score":
+                _latest_score_cache.invalidate(tuple(key))
+            elif cache == "ignored":
+                _ignored_cache.invalidate(tuple(key))
+        cutoff = now - timedelta(seconds=CACHE_SYNC_LOOKBACK)
+        for row_id in [row_id for row_id, at in seen.items() if at < cutoff]:
+            del seen[row_id]
+        _cache_sync["since"] = cutoff
+        _cache_sync["at"] = time.monotonic()
+
+def prune_cache_invalidations() -> int:
+    """Deletes logged cache invalidations every process has had time to apply."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=CACHE_SYNC_LOOKBACK * 10)
+    with _connection(write=True) as conn:
+        cur = conn.cursor()
+        p = _get_placeholder()
+        cur.execute(f"DELETE FROM cache_invalidations WHERE created_at < {p}", (cutoff.isoformat(),))
+        deleted = cur.rowcount
+        conn.commit()
+    return deleted
+
+def _hash_api_key(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+def _invalidate_user(user_id: str) -> None:
+    """Drops cached records of a user after their key, tier, credits or scan count changed."""
+    _user_cache.invalidate(user_id)
+    _api_key_cache.invalidate_where(lambda user: user.get("id") == user_id)
+
+def peek_user_by_api_key(api_key: str) -> Optional[dict]:
+    """
+    Returns the cached user for an API key without querying: None if not cached,
+    an empty dict if the key is cached as invalid.
+    """
+    if _cache_sync_due():
+        return None
+    user = _api_key_cache.get(_hash_api_key(api_key))
+    return dict(user) if user is not None else None
 
 def get_user_by_api_key(api_key: str) -> Optional[dict]:
     """Retrieve a user by their API key (hashed) for authentication."""
-    hashed_key = hashlib.sha256(api_key.encode()).hexdigest()
-    conn = _get_connection()
-    try:
+    hashed_key = _hash_api_key(api_key)
+    _sync_caches()
+    user = _api_key_cache.get(hashed_key)
+    if user is not None:
+        return dict(user) if user else None
+    with _connection() as conn:
         cur = _get_cursor(conn)
         p = _get_placeholder()
         cur.execute(f"SELECT * FROM users WHERE api_key = {p}", (hashed_key,))
         user = cur.fetchone()
-        return dict(user) if user else None
-    finally:
-        conn.close()
+    if not user:
+        _api_key_cache.set(hashed_key, {}, ttl=INVALID_API_KEY_CACHE_TTL)
+        return None
+    user = dict(user)
+    _api_key_cache.set(hashed_key, user)
+    return dict(user)
 
 def link_github_installation(supabase_uid: str, installation_id: str) -> bool:
     """Links a GitHub App Installation ID to a Vouch User."""
-    conn = _get_connection()
     try:
+        # Resolve the user before borrowing a connection so one call never holds two
         get_or_create_user(supabase_uid)
-        cur = conn.cursor()
-        p = _get_placeholder()
-        cur.execute(
-            f"UPDATE users SET github_installation_id = {p}, tier = 'free', scan_count = 1 WHERE id = {p}",
-            (str(installation_id), supabase_uid)
-        )
-        conn.commit()
+        with _connection(write=True) as conn:
+            cur = conn.cursor()
+            p = _get_placeholder()
+            cur.execute(
+                f"UPDATE users SET github_installation_id = {p}, tier = 'free', scan_count = 1 WHERE id = {p}",
+                (str(installation_id), supabase_uid)
+            )
+            cur.execute(*_invalidation_statement("user", supabase_uid))
+            conn.commit()
+        _invalidate_user(supabase_uid)
         return True
     except Exception as e:
         print(f"Error linking installation: {e}")
         return False
-    finally:
-        conn.close()
 
 def get_user_by_installation_id(installation_id: str) -> Optional[dict]:
     """Retrieve a user by their GitHub Installation ID (for Webhooks)."""
-    conn = _get_connection()
-    try:
+    with _connection() as conn:
         cur = _get_cursor(conn)
         p = _get_placeholder()
         cur.execute(f"SELECT * FROM users WHERE github_installation_id = {p}", (str(installation_id),))
         user = cur.fetchone()
         return dict(user) if user else None
-    finally:
-        conn.close()
 
-def get_latest_score_by_installation(installation_id: str) -> int:
-    """Returns the most recent security score for a given GitHub installation."""
-    conn = _get_connection()
+def peek_latest_score(installation_id: str, repo: str = "") -> Optional[int]:
+    """Returns the cached latest score for an installation (or one of its repos) without querying."""
+    if _cache_sync_due():
+        return None
+    return _latest_score_cache.get((str(installation_id), repo))
+
+def get_latest_score_by_installation(installation_id: str, repo: str = "") -> int:
+    """
+    Returns the most recent security score for a GitHub installation, or for one of its
+    repositories ("owner/name"). Reads the latest_scores row maintained by save_scan.
+    """
+    key = (str(installation_id), repo)
+    _sync_caches()
+    score = _latest_score_cache.get(key)
+    if score is not None:
+        return score
     try:
-        cur = _get_cursor(conn)
-        p = _get_placeholder()
-        cur.execute(
-            f"""
-            SELECT s.score FROM scans s
-            JOIN users u ON u.id = s.user_id
-            WHERE u.github_installation_id = {p}
-            ORDER BY s.created_at DESC LIMIT 1
-            """,
-            (str(installation_id),)
-        )
-        row = cur.fetchone()
-        return row["score"] if row else 100
+        with _connection() as conn:
+            cur = _get_cursor(conn)
+            p = _get_placeholder()
+            cur.execute(
+                f"SELECT score FROM latest_scores WHERE installation_id = {p} AND repo = {p}",
+                key
+            )
+            row = cur.fetchone()
+            score = row["score"] if row else 100
     except Exception as e:
         print(f"Error getting latest score: {e}")
         return 100
-    finally:
-        conn.close()
+    _latest_score_cache.set(key, score)
+    return score
 
 def increment_scan_count(user_id: str) -> None:
     """Increment the total scan count for a user."""
-    conn = _get_connection()
-    try:
+    with _connection(write=True) as conn:
         cur = conn.cursor()
         p = _get_placeholder()
         cur.execute(f"UPDATE users SET scan_count = scan_count + 1 WHERE id = {p}", (user_id,))
+        cur.execute(*_invalidation_statement("user", user_id))
         conn.commit()
-    finally:
-        conn.close()
+    _invalidate_user(user_id)
 
 def add_credits(user_id: str, credits: int, customer_id: str) -> bool:
     """Add additional credits to a user balance."""
-    conn = _get_connection()
     try:
-        cur = conn.cursor()
-        p = _get_placeholder()
-        cur.execute(
-            f"UPDATE users SET additional_credits = additional_credits + {p}, stripe_customer_id = {p} WHERE id = {p}",
-            (credits, customer_id, user_id)
-        )
-        conn.commit()
+        with _connection(write=True) as conn:
+            cur = conn.cursor()
+            p = _get_placeholder()
+            cur.execute(
+                f"UPDATE users SET additional_credits = additional_credits + {p}, stripe_customer_id = {p} WHERE id = {p}",
+                (credits, customer_id, user_id)
+            )
+            cur.execute(*_invalidation_statement("user", user_id))
+            conn.commit()
+        _invalidate_user(user_id)
         return True
     except Exception as e:
         print(f"Error adding credits: {e}")
         return False
-    finally:
-        conn.close()
 
 def update_subscription(user_id: str, tier: str, customer_id: str, subscription_id: str) -> bool:
     """Update user's subscription tier and IDs."""
-    conn = _get_connection()
     try:
-        cur = conn.cursor()
-        p = _get_placeholder()
-        cur.execute(
-            f"UPDATE users SET tier = {p}, stripe_customer_id = {p}, stripe_subscription_id = {p} WHERE id = {p}",
-            (tier, customer_id, subscription_id, user_id)
-        )
-        conn.commit()
+        with _connection(write=True) as conn:
+            cur = conn.cursor()
+            p = _get_placeholder()
+            cur.execute(
+                f"UPDATE users SET tier = {p}, stripe_customer_id = {p}, stripe_subscription_id = {p} WHERE id = {p}",
+                (tier, customer_id, subscription_id, user_id)
+            )
+            cur.execute(*_invalidation_statement("user", user_id))
+            conn.commit()
+        _invalidate_user(user_id)
         return True
     except Exception as e:
         print(f"Error updating subscription: {e}")
         return False
-    finally:
-        conn.close()
 
-def save_scan(scan_type: str, language: str, result: dict, user_id: Optional[str] = None) -> str:
-    """Persist a scan result to the database."""
+def save_scan(scan_type: str, language: str, result: dict, user_id: Optional[str] = None, count_scan: bool = True,
+              installation_id: Optional[str] = None, repo: Optional[str] = None) -> str:
+    """
+    Persist a scan result to the database.
+    The scan row, all of its issues and (with `count_scan`) the user's scan counter are
+    written in one transaction; on PostgreSQL they are sent as a single batch.
+    With `installation_id`, the badge scores of the installation (and of `repo`) are
+    updated in the same transaction, as is the user's daily rollup (scan_rollups_daily).
+    Returns the scan id, or "" on failure.
+    """
     scan_id = str(uuid.uuid4())
     created_at = datetime.now(timezone.utc).isoformat()
     score = result.get("score", 0)
     summary = result.get("summary", "No summary.")
-    issues = result.get("issues", [])
-
-    conn = _get_connection()
-    try:
-        cur = conn.cursor()
-        p = _get_placeholder()
-        cur.execute(
-            f"INSERT INTO scans (id, user_id, scan_type, language, score, summary, created_at) VALUES ({p}, {p}, {p}, {p}, {p}, {p}, {p})",
-            (scan_id, user_id, scan_type, language, score, summary, created_at),
+    issue_rows = [
+        (
+            scan_id,
+            issue.get("title", "Untitled"),
+            issue.get("severity", "MEDIUM"),
+            issue.get("file"),
+            issue.get("description"),
+            issue.get("how_to_fix"),
+            issue.get("fixed_code_snippet"),
         )
+        for issue in result.get("issues", [])
+    ]
+    p = _get_placeholder()
+    count_scan = count_scan and user_id is not None
+    statements = [(
+        f"INSERT INTO scans (id, user_id, scan_type, language, score, summary, created_at, repo) VALUES ({p}, {p}, {p}, {p}, {p}, {p}, {p}, {p})",
+        (scan_id, user_id, scan_type, language, score, summary, created_at, repo or None),
+    )]
+    if count_scan:
+        statements.append((f"UPDATE users SET scan_count = scan_count + 1 WHERE id = {p}", (user_id,)))
+        statements.append(_invalidation_statement("user", user_id))
 
-        for issue in issues:
-            cur.execute(
-                f"""INSERT INTO issues (scan_id, title, severity, file, description, how_to_fix, fixed_code_snippet)
-                   VALUES ({p}, {p}, {p}, {p}, {p}, {p}, {p})""",
-                (
-                    scan_id,
-                    issue.get("title", "Untitled"),
-                    issue.get("severity", "MEDIUM"),
-                    issue.get("file"),
-                    issue.get("description"),
-                    issue.get("how_to_fix"),
-                    issue.get("fixed_code_snippet"),
-                ),
-            )
-        conn.commit()
-        return scan_id
+    score_keys = []
+    if installation_id:
+        score_keys.append((str(installation_id), ""))
+        if repo:
+            score_keys.append((str(installation_id), repo))
+    for inst, r in score_keys:
+        statements.append((
+            f"INSERT INTO latest_scores (installation_id, repo, score, scan_id, updated_at) VALUES ({p}, {p}, {p}, {p}, {p}) "
+            "ON CONFLICT (installation_id, repo) DO UPDATE SET "
+            "score = excluded.score, scan_id = excluded.scan_id, updated_at = excluded.updated_at",
+            (inst, r, score, scan_id, created_at),
+        ))
+        statements.append(_invalidation_statement("latest_score", (inst, r)))
+
+    if user_id is not None:
+        severities = [str(row[2]).upper() for row in issue_rows]
+        least = "LEAST" if DATABASE_URL else "MIN"
+        statements.append((
+            f"""INSERT INTO scan_rollups_daily (user_id, repo, day, scan_count, score_sum, min_score, last_score,
+                                                last_scan_at, critical_issues, high_issues, medium_issues, low_issues)
+                VALUES ({p}, {p}, {p}, 1, {p}, {p}, {p}, {p}, {p}, {p}, {p}, {p})
+                ON CONFLICT (user_id, repo, day) DO UPDATE SET
+                    scan_count = scan_rollups_daily.scan_count + 1,
+                    score_sum = scan_rollups_daily.score_sum + excluded.score_sum,
+                    min_score = {least}(scan_rollups_daily.min_score, excluded.min_score),
+                    last_score = excluded.last_score,
+                    last_scan_at = excluded.last_scan_at,
+                    critical_issues = scan_rollups_daily.critical_issues + excluded.critical_issues,
+                    high_issues = scan_rollups_daily.high_issues + excluded.high_issues,
+                    medium_issues = scan_rollups_daily.medium_issues + excluded.medium_issues,
+                    low_issues = scan_rollups_daily.low_issues + excluded.low_issues""",
+            (user_id, repo or "", created_at[:10], score, score, score, created_at,
+             *(severities.count(level) for level in ("CRITICAL", "HIGH", "MEDIUM", "LOW"))),
+        ))
+
+    issues_sql = "INSERT INTO issues (scan_id, title, severity, file, description, how_to_fix, fixed_code_snippet) VALUES "
+    try:
+        with _connection(write=True) as conn:
+            cur = conn.cursor()
+            if DATABASE_URL:
+                batch = [cur.mogrify(sql, params) for sql, params in statements]
+                if issue_rows:
+                    values = b",".join(cur.mogrify("(%s, %s, %s, %s, %s, %s, %s)", row) for row in issue_rows)
+                    batch.append(issues_sql.encode() + values)
+                cur.execute(b";\n".join(batch))
+            else:
+                for sql, params in statements:
+                    cur.execute(sql, params)
+                cur.executemany(issues_sql + "(?, ?, ?, ?, ?, ?, ?)", issue_rows)
+            conn.commit()
     except Exception as e:
         print(f"Error saving scan: {e}")
         return ""
-    finally:
-        conn.close()
+    for key in score_keys:
+        _latest_score_cache.set(key, score)
+    if count_scan:
+        _invalidate_user(user_id)
+    return scan_id
+
+SCAN_FIELDS = ("id", "scan_type", "language", "score", "summary", "created_at")
+ISSUE_FIELDS = ("title", "severity", "file", "description", "how_to_fix", "fixed_code_snippet")
 
-def get_all_scans(limit: int = 20, user_id: Optional[str] = None) -> list:
-    """Return a list of recent scans, optionally filtered by user_id."""
-    conn = _get_connection()
+def encode_cursor(*values) -> str:
+    """Packs keyset values into an opaque, URL-safe pagination cursor."""
+    values = [v.isoformat() if isinstance(v, (datetime, date)) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """Unpacks a cursor made by encode_cursor. Raises ValueError if it is malformed."""
     try:
-        cur = _get_cursor(conn)
-        p = _get_placeholder()
-        if user_id:
-            cur.execute(
-                f"SELECT id, scan_type, language, score, summary, created_at FROM scans WHERE user_id = {p} ORDER BY created_at DESC LIMIT {p}",
-                (user_id, limit),
-            )
-        else:
-            cur.execute(
-                f"SELECT id, scan_type, language, score, summary, created_at FROM scans ORDER BY created_at DESC LIMIT {p}",
-                (limit,),
-            )
-        rows = cur.fetchall()
-        return [dict(row) for row in rows]
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+def _project(fields: Optional[list], allowed: tuple, required: tuple = ()) -> list:
+    """Validates requested columns against `allowed` (all of them if None), always including `required`."""
+    if not fields:
+        return list(allowed)
+    unknown = set(fields) - set(allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return [f for f in allowed if f in fields or f in required]
+
+def get_all_scans(limit: int = 20, user_id: Optional[str] = None, cursor: Optional[str] = None,
+                  fields: Optional[list] = None) -> tuple:
+    """
+    Return a page of recent scans (newest first), optionally filtered by user_id.
+    Pages are keyed on (created_at, id): pass the returned cursor to get the next page.
+    Returns (scans, next_cursor); next_cursor is None on the last page.
+    """
+    columns = _project(fields, SCAN_FIELDS, required=("id", "created_at"))
+    after = decode_cursor(cursor, 2) if cursor else None
+    p = _get_placeholder()
+    where, params = [], []
+    if user_id:
+        where.append(f"user_id = {p}")
+        params.append(user_id)
+    if after:
+        where.append(f"(created_at, id) < ({p}, {p})")
+        params.extend(after)
+    sql = f"SELECT {', '.join(columns)} FROM scans"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY created_at DESC, id DESC LIMIT {p}"
+    params.append(limit + 1)
+    try:
+        with _connection() as conn:
+            cur = _get_cursor(conn)
+            cur.execute(sql, params)
+            rows = [dict(row) for row in cur.fetchall()]
     except Exception as e:
         print(f"Error getting scans: {e}")
-        return []
-    finally:
-        conn.close()
+        return [], None
 
-def get_scan_by_id(scan_id: str) -> Optional[dict]:
-    """Return a full scan with nested issues."""
-    conn = _get_connection()
-    try:
-        cur = _get_cursor(conn)
-        p = _get_placeholder()
-        cur.execute(
-            f"SELECT id, scan_type, language, score, summary, created_at FROM scans WHERE id = {p}",
-            (scan_id,),
-        )
-        scan_row = cur.fetchone()
-        if not scan_row:
-            return None
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+    if fields:
+        rows = [{k: row[k] for k in columns if k in fields or k == "id"} for row in rows]
+    return rows, next_cursor
 
-        scan = dict(scan_row)
+def _archived_issues(cur, scan_id: str, issue_columns: list) -> Optional[list]:
+    """Loads an archived scan's issues (ordered by id), or None if the scan is not archived."""
+    p = _get_placeholder()
+    cur.execute(f"SELECT codec, issues FROM scan_archive WHERE scan_id = {p}", (scan_id,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    issues = scan_archive.unpack_issues(row["issues"], row["codec"])
+    wanted = [f for f in scan_archive.TEXT_FIELDS if f in issue_columns]
+    hashes = sorted({issue[f] for issue in issues for f in wanted if issue.get(f)})
+    texts = {}
+    if hashes:
         cur.execute(
-            f"SELECT title, severity, file, description, how_to_fix, fixed_code_snippet FROM issues WHERE scan_id = {p}",
-            (scan_id,),
+            f"SELECT hash, codec, body FROM issue_texts WHERE hash IN ({', '.join([p] * len(hashes))})",
+            hashes
         )
-        issue_rows = cur.fetchall()
-        scan["issues"] = [dict(row) for row in issue_rows]
-        return scan
+        texts = {r["hash"]: (r["codec"], r["body"]) for r in cur.fetchall()}
+    return sorted(scan_archive.restore_texts(issues, texts), key=lambda issue: issue["id"])
+
+def get_scan_by_id(scan_id: str, fields: Optional[list] = None, issue_fields: Optional[list] = None,
+                   issue_limit: Optional[int] = None, issue_cursor: Optional[str] = None) -> Optional[dict]:
+    """
+    Return a scan with nested issues.
+    `fields` selects scan columns (plus "issues"), `issue_fields` selects issue columns.
+    With `issue_limit`, issues are paged in insertion order and `next_issue_cursor` is set
+    while more remain.
+    """
+    include_issues = not fields or "issues" in fields
+    columns = _project([f for f in fields or () if f != "issues"] or None, SCAN_FIELDS, required=("id",))
+    issue_columns = _project(issue_fields, ISSUE_FIELDS)
+    after_issue = decode_cursor(issue_cursor, 1)[0] if issue_cursor else None
+    try:
+        with _connection() as conn:
+            cur = _get_cursor(conn)
+            p = _get_placeholder()
+            cur.execute(
+                f"SELECT {', '.join(columns)} FROM scans WHERE id = {p}",
+                (scan_id,),
+            )
+            scan_row = cur.fetchone()
+            if not scan_row:
+                return None
+
+            scan = dict(scan_row)
+            if not include_issues:
+                return scan
+
+            sql = f"SELECT id, {', '.join(issue_columns)} FROM issues WHERE scan_id = {p}"
+            params = [scan_id]
+            if after_issue is not None:
+                sql += f" AND id > {p}"
+                params.append(after_issue)
+            sql += " ORDER BY id"
+            if issue_limit is not None:
+                sql += f" LIMIT {p}"
+                params.append(issue_limit + 1)
+            cur.execute(sql, params)
+            issue_rows = [dict(row) for row in cur.fetchall()]
+            if not issue_rows:
+                # Old scans keep their issues in cold storage
+                archived = _archived_issues(cur, scan_id, issue_columns)
+                if archived is not None:
+                    issue_rows = [row for row in archived if after_issue is None or row["id"] > after_issue]
+                    if issue_limit is not None:
+                        issue_rows = issue_rows[:issue_limit + 1]
     except Exception as e:
         print(f"Error getting scan by id: {e}")
         return None
-    finally:
-        conn.close()
+
+    if issue_limit is not None:
+        has_more = len(issue_rows) > issue_limit
+        issue_rows = issue_rows[:issue_limit]
+        scan["next_issue_cursor"] = encode_cursor(issue_rows[-1]["id"]) if has_more else None
+    scan["issues"] = [{k: row[k] for k in issue_columns} for row in issue_rows]
+    return scan
+
+def get_scan_analytics(user_id: str, days: int = 30, repo: Optional[str] = None) -> list:
+    """
+    Returns daily scan statistics for a user over the last `days` UTC days, oldest first,
+    read from scan_rollups_daily only. Without `repo`, every repository is included.
+    """
+    since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).date().isoformat()
+    p = _get_placeholder()
+    sql = f"SELECT * FROM scan_rollups_daily WHERE user_id = {p} AND day >= {p}"
+    params = [user_id, since]
+    if repo is not None:
+        sql += f" AND repo = {p}"
+        params.append(repo)
+    sql += " ORDER BY day, repo"
+    try:
+        with _connection() as conn:
+            cur = _get_cursor(conn)
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+    except Exception as e:
+        print(f"Error getting scan analytics: {e}")
+        return []
+    return [
+        {
+            "day": str(row["day"]),
+            "repo": row["repo"],
+            "scans": row["scan_count"],
+            "avg_score": round(row["score_sum"] / row["scan_count"], 1),
+            "min_score": row["min_score"],
+            "last_score": row["last_score"],
+            "issues": {
+                "critical": row["critical_issues"],
+                "high": row["high_issues"],
+                "medium": row["medium_issues"],
+                "low": row["low_issues"],
+            },
+        }
+        for row in rows
+    ]
+
+# Arbitrary key for pg_advisory_xact_lock, held while issue_texts rows are added or removed:
+# under READ COMMITTED, delete_scan could otherwise drop a text that a concurrent
+# archive_old_scans batch is about to reference (SQLite already runs one writer at a time)
+_ISSUE_TEXTS_LOCK_KEY = 0x5465787473  # "Texts"
+
+def archive_old_scans(older_than_days: Optional[int] = None, batch_size: int = 200) -> int:
+    """
+    Moves the issues of scans older than `older_than_days` (default SCAN_ARCHIVE_AFTER_DAYS)
+    into cold storage: one compressed blob per scan in scan_archive, long texts deduplicated
+    in issue_texts (referenced through scan_archive_texts). Scan rows stay in place. Returns the number of scans archived.
+    """
+    days = SCAN_ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    p = _get_placeholder()
+    codec = scan_archive.DEFAULT_CODEC
+    if DATABASE_URL:
+        insert_text_sql = "INSERT INTO issue_texts (hash, codec, body) VALUES (%s, %s, %s) ON CONFLICT DO NOTHING"
+    else:
+        insert_text_sql = "INSERT OR IGNORE INTO issue_texts (hash, codec, body) VALUES (?, ?, ?)"
+    archived = 0
+    while True:
+        try:
+            with _connection(write=True) as conn:
+                cur = _get_cursor(conn)
+                cur.execute(
+                    f"""SELECT s.id FROM scans s
+                        WHERE s.created_at < {p} AND EXISTS (SELECT 1 FROM issues i WHERE i.scan_id = s.id)
+                        LIMIT {p}""" + (" FOR UPDATE SKIP LOCKED" if DATABASE_URL else ""),
+                    (cutoff, batch_size)
+                )
+                scan_ids = [row["id"] for row in cur.fetchall()]
+                if not scan_ids:
+                    return archived
+                in_clause = ", ".join([p] * len(scan_ids))
+                cur.execute(
+                    f"""SELECT id, scan_id, title, severity, file, description, how_to_fix, fixed_code_snippet
+                        FROM issues WHERE scan_id IN ({in_clause}) ORDER BY id""",
+                    scan_ids
+                )
+                issues_by_scan = {}
+                for row in cur.fetchall():
+                    issue = dict(row)
+                    issues_by_scan.setdefault(issue.pop("scan_id"), []).append(issue)
+
+                archived_at = datetime.now(timezone.utc).isoformat()
+                texts, archive_rows, text_refs = {}, [], []
+                for scan_id, issues in issues_by_scan.items():
+                    blob, scan_texts = scan_archive.pack_issues(issues, codec)
+                    texts.update(scan_texts)
+                    archive_rows.append((scan_id, codec, len(issues), blob, archived_at))
+                    text_refs.extend((scan_id, h) for h in scan_texts)
+                if DATABASE_URL:
+                    cur.execute("SELECT pg_advisory_xact_lock(%s)", (_ISSUE_TEXTS_LOCK_KEY,))
+                cur.executemany(insert_text_sql, [(h, codec, body) for h, body in texts.items()])
+                cur.executemany(f"INSERT INTO scan_archive_texts (scan_id, hash) VALUES ({p}, {p})", text_refs)
+                cur.executemany(
+                    f"INSERT INTO scan_archive (scan_id, codec, issue_count, issues, archived_at) VALUES ({p}, {p}, {p}, {p}, {p})",
+                    archive_rows
+                )
+                cur.execute(f"DELETE FROM issues WHERE scan_id IN ({in_clause})", scan_ids)
+                conn.commit()
+        except Exception as e:
+            print(f"Error archiving scans: {e}")
+            return archived
+        archived += len(scan_ids)
+        print(f"🧊 Archived {len(scan_ids)} scans older than {days} days")
 
 def delete_scan(scan_id: str) -> bool:
-    """Delete a scan and its issues."""
-    conn = _get_connection()
+    """Delete a scan, its issues (live or archived) and the archived texts only it referenced."""
     try:
-        cur = conn.cursor()
-        p = _get_placeholder()
-        cur.execute(f"DELETE FROM scans WHERE id = {p}", (scan_id,))
-        conn.commit()
-        return cur.rowcount > 0
+        with _connection(write=True) as conn:
+            cur = conn.cursor()
+            p = _get_placeholder()
+            cur.execute(f"SELECT installation_id, repo FROM latest_scores WHERE scan_id = {p}", (scan_id,))
+            score_keys = [(row[0], row[1]) for row in cur.fetchall()]
+            cur.execute(f"DELETE FROM scans WHERE id = {p}", (scan_id,))
+            deleted = cur.rowcount > 0
+            # SQLite does not enforce the ON DELETE CASCADE
+            cur.execute(f"SELECT hash FROM scan_archive_texts WHERE scan_id = {p}", (scan_id,))
+            text_hashes = [row[0] for row in cur.fetchall()]
+            cur.execute(f"DELETE FROM scan_archive_texts WHERE scan_id = {p}", (scan_id,))
+            cur.execute(f"DELETE FROM scan_archive WHERE scan_id = {p}", (scan_id,))
+            if text_hashes:
+                # Archived texts no other scan references, also counting archive batches
+                # that committed while this transaction waited for the lock
+                if DATABASE_URL:
+                    cur.execute("SELECT pg_advisory_xact_lock(%s)", (_ISSUE_TEXTS_LOCK_KEY,))
+                cur.execute(
+                    f"""DELETE FROM issue_texts WHERE hash IN ({', '.join([p] * len(text_hashes))})
+                        AND NOT EXISTS (SELECT 1 FROM scan_archive_texts t WHERE t.hash = issue_texts.hash)""",
+                    text_hashes
+                )
+            if score_keys:
+                # Each badge falls back to the installation's (or repository's) previous scan;
+                # repository badges of scans saved before scans.repo existed are just removed
+                cur.execute(f"DELETE FROM latest_scores WHERE scan_id = {p}", (scan_id,))
+                for installation_id, repo in score_keys:
+                    cur.execute(
+                        f"""
+                        INSERT INTO latest_scores (installation_id, repo, score, scan_id, updated_at)
+                        SELECT u.github_installation_id, {p}, s.score, s.id, s.created_at
+                        FROM users u JOIN scans s ON s.user_id = u.id
+                        WHERE u.github_installation_id = {p}""" + (f" AND s.repo = {p}" if repo else "") + """
+                        ORDER BY s.created_at DESC, s.id DESC LIMIT 1
+                        """,
+                        (repo, installation_id, repo) if repo else (repo, installation_id)
+                    )
+                    cur.execute(*_invalidation_statement("latest_score", (installation_id, repo)))
+            conn.commit()
     except Exception as e:
         print(f"Error deleting scan: {e}")
         return False
-    finally:
-        conn.close()
+    for key in score_keys:
+        _latest_score_cache.invalidate(key)
+    return deleted
+
+def _insert_ignored_sql() -> str:
+    p = _get_placeholder()
+    columns = "(user_id, repo_name, file_path, snippet_hash, created_at)"
+    values = f"VALUES ({p}, {p}, {p}, {p}, {p})"
+    if DATABASE_URL:
+        return f"INSERT INTO ignored_findings {columns} {values} ON CONFLICT DO NOTHING"
+    return f"INSERT OR IGNORE INTO ignored_findings {columns} {values}"
 
 def ignore_finding(supabase_uid: str, repo_name: str, file_path: str, snippet_hash: str) -> bool:
     """Saves a finding hash to the ignored_findings table."""
+    return ignore_findings(supabase_uid, repo_name, [(file_path, snippet_hash)])
+
+def ignore_findings(supabase_uid: str, repo_name: str, findings: list) -> bool:
+    """Saves many (file_path, snippet_hash) pairs for one repository in a single transaction."""
     user = get_or_create_user(supabase_uid)
     if not user:
         return False
-    conn = _get_connection()
+    created_at = datetime.now(timezone.utc).isoformat()
     try:
-        cur = conn.cursor()
-        p = _get_placeholder()
-        conflict_clause = "ON CONFLICT DO NOTHING" if DATABASE_URL else "OR IGNORE"
-        cur.execute(
-            f"""INSERT {conflict_clause} INTO ignored_findings (user_id, repo_name, file_path, snippet_hash, created_at) 
-               VALUES ({p}, {p}, {p}, {p}, {p})""",
-            (user["id"], repo_name, file_path, snippet_hash, datetime.now(timezone.utc).isoformat()),
-        )
-        conn.commit()
+        with _connection(write=True) as conn:
+            cur = conn.cursor()
+            cur.executemany(
+                _insert_ignored_sql(),
+                [(user["id"], repo_name, file_path, snippet_hash, created_at) for file_path, snippet_hash in findings],
+            )
+            cur.execute(*_invalidation_statement("ignored", (supabase_uid, repo_name)))
+            conn.commit()
         return True
     except Exception as e:
-        print(f"Error ignoring finding: {e}")
+        print(f"Error ignoring findings: {e}")
         return False
     finally:
-        conn.close()
+        _ignored_cache.invalidate((supabase_uid, repo_name))
+
+def get_ignored_findings(supabase_uid: str, repo_name: str) -> frozenset:
+    """
+    Returns the set of ignored (file_path, snippet_hash) pairs for a user's repository.
+    Cached in memory; ignoring a finding drops the entry in every process (API and job
+    workers) within CACHE_SYNC_INTERVAL seconds.
+    """
+    key = (supabase_uid, repo_name)
+    _sync_caches()
+    ignored = _ignored_cache.get(key)
+    if ignored is not None:
+        return ignored
+    try:
+        with _connection() as conn:
+            cur = _get_cursor(conn)
+            p = _get_placeholder()
+            cur.execute(
+                f"SELECT file_path, snippet_hash FROM ignored_findings WHERE user_id = {p} AND repo_name = {p}",
+                (supabase_uid, repo_name)
+            )
+            ignored = frozenset((row["file_path"], row["snippet_hash"]) for row in cur.fetchall())
+    except Exception as e:
+        print(f"Error loading ignored findings: {e}")
+        return frozenset()
+    _ignored_cache.set(key, ignored)
+    return ignored
 
 def is_finding_ignored(supabase_uid: str, repo_name: str, file_path: str, snippet_hash: str) -> bool:
     """Checks if a finding is marked as ignored."""
-    conn = _get_connection()
-    try:
-        cur = _get_cursor(conn)
-        p = _get_placeholder()
+    return (file_path, snippet_hash) in get_ignored_findings(supabase_uid, repo_name)
+
+# --- Jobs ---
+
+JOB_FIELDS = ("id", "kind", "lane", "tier", "status", "user_id", "result", "error", "attempts", "worker_id",
+              "created_at", "started_at", "heartbeat_at", "finished_at")
+JOB_FINISHED_STATUSES = ("done", "failed")
+# Arbitrary key for the per-lane claim lock (pg_advisory_xact_lock(key, hashtext(lane)))
+_JOB_CLAIM_LOCK_KEY = 0x4A6F6273  # "Jobs"
+
+def _job_from_row(row) -> dict:
+    job = dict(row)
+    for field in ("payload", "result"):
+        if job.get(field) is not None:
+            job[field] = json.loads(job[field])
+    return job
+
+def create_job(kind: str, payload: dict, user_id: Optional[str] = None, lane: str = "repo",
+               tier: str = "free", weight: float = 1.0, dedup_key: Optional[str] = None) -> tuple:
+    """
+    Queues a job for the worker processes of `lane`. Returns (job id, True), or the id of the
+    queued or running job with the same `dedup_key` and False, in which case nothing is queued.
+    The job's fair tag is its user's previous tag in the lane (or the lane's virtual time,
+    whichever is later) plus 1/weight, so heavier tiers advance more slowly and a user with a
+    long backlog cannot push newcomers behind it.
+    """
+    job_id = str(uuid.uuid4())
+    p = _get_placeholder()
+    find_duplicate_sql = f"SELECT id FROM jobs WHERE dedup_key = {p} AND status IN ('queued', 'running')"
+    with _connection(write=True) as conn:
+        cur = conn.cursor()
+        if dedup_key:
+            cur.execute(find_duplicate_sql, (dedup_key,))
+            row = cur.fetchone()
+            if row:
+                return row[0], False
         cur.execute(
-            f"""
-            SELECT 1 FROM ignored_findings i
-            JOIN users u ON u.id = i.user_id
-            WHERE u.id = {p} AND i.repo_name = {p} AND i.file_path = {p} AND i.snippet_hash = {p}
-            """,
-            (supabase_uid, repo_name, file_path, snippet_hash)
+            f"""SELECT MIN(CASE WHEN status = 'queued' THEN fair_tag END),
+                       MAX(CASE WHEN status = 'running' THEN fair_tag END),
+                       MAX(CASE WHEN COALESCE(user_id, '') = {p} THEN fair_tag END)
+                FROM jobs WHERE lane = {p} AND status IN ('queued', 'running')""",
+            (user_id or "", lane)
         )
+        head, in_service, user_last = cur.fetchone()
+        # Virtual time: the head of the queue, else the job in service (self-clocked fair queuing)
+        virtual_time = head if head is not None else (in_service or 0)
+        fair_tag = max(virtual_time, user_last or 0) + 1.0 / weight
+        insert_sql = f"""INSERT {'' if DATABASE_URL else 'OR IGNORE '}INTO jobs
+                (id, kind, status, user_id, payload, created_at, lane, tier, fair_tag, dedup_key)
+            VALUES ({p}, {p}, 'queued', {p}, {p}, {p}, {p}, {p}, {p}, {p})""" + (" ON CONFLICT DO NOTHING" if DATABASE_URL else "")
+        params = (job_id, kind, user_id, json.dumps(payload), datetime.now(timezone.utc).isoformat(), lane, tier,
+                  fair_tag, dedup_key)
+        while True:
+            cur.execute(insert_sql, params)
+            created = cur.rowcount > 0
+            if created:
+                break
+            if not dedup_key:
+                raise RuntimeError(f"Job {job_id} was not queued")
+            # A concurrent identical submission won (unique index on active dedup keys). If it
+            # finished before we could read it, its key is free again and the insert is retried.
+            cur.execute(find_duplicate_sql, (dedup_key,))
+            row = cur.fetchone()
+            if row:
+                job_id = row[0]
+                break
+        conn.commit()
+    return job_id, created
+
+def get_job(job_id: str, include_payload: bool = False) -> Optional[dict]:
+    """Returns a job with its decoded result, or None if it does not exist."""
+    columns = JOB_FIELDS + (("payload",) if include_payload else ())
+    with _connection() as conn:
+        cur = _get_cursor(conn)
+        cur.execute(f"SELECT {', '.join(columns)} FROM jobs WHERE id = {_get_placeholder()}", (job_id,))
+        row = cur.fetchone()
+    return _job_from_row(row) if row else None
+
+def has_queued_jobs(lane: str) -> bool:
+    """Cheap read-only check that lets idle workers skip the claim transaction."""
+    p = _get_placeholder()
+    with _connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT 1 FROM jobs WHERE lane = {p} AND status = 'queued' LIMIT 1", (lane,))
         return cur.fetchone() is not None
-    except Exception as e:
-        print(f"Error checking ignored finding: {e}")
-        return False
-    finally:
-        conn.close()
+
+def claim_job(worker_id: str, lane: str = "repo", user_limits: Optional[dict] = None,
+              tier_limits: Optional[dict] = None) -> Optional[dict]:
+    """
+    Marks the queued job of `lane` with the lowest fair tag as running for `worker_id` and
+    returns it with its payload, or None when nothing can run. Jobs of users or tiers that
+    already have their limit of running jobs in the lane (`user_limits`/`tier_limits` map
+    tier -> max running, 0 = unlimited) are skipped. Claims in a lane are serialized.
+    """
+    now = datetime.now(timezone.utc).isoformat()
+    p = _get_placeholder()
+    user_limits, tier_limits = user_limits or {}, tier_limits or {}
+    with _connection(write=True) as conn:
+        cur = _get_cursor(conn)
+        if DATABASE_URL:
+            # Held until commit; on SQLite the write borrow already holds the database lock
+            cur.execute("SELECT pg_advisory_xact_lock(%s, hashtext(%s))", (_JOB_CLAIM_LOCK_KEY, lane))
+        cur.execute(
+            f"""SELECT COALESCE(user_id, '') AS user_key, tier, COUNT(*) AS running FROM jobs
+                WHERE lane = {p} AND status = 'running' GROUP BY COALESCE(user_id, ''), tier""",
+            (lane,)
+        )
+        running_by_tier = {}
+        busy_users = []
+        for row in cur.fetchall():
+            running_by_tier[row["tier"]] = running_by_tier.get(row["tier"], 0) + row["running"]
+            if 0 < user_limits.get(row["tier"], 0) <= row["running"]:
+                busy_users.append(row["user_key"])
+        busy_tiers = [tier for tier, running in running_by_tier.items() if 0 < tier_limits.get(tier, 0) <= running]
+
+        sql = f"SELECT id FROM jobs WHERE lane = {p} AND status = 'queued'"
+        params = [lane]
+        if busy_tiers:
+            sql += f" AND tier NOT IN ({', '.join([p] * len(busy_tiers))})"
+            params += busy_tiers
+        if busy_users:
+            sql += f" AND COALESCE(user_id, '') NOT IN ({', '.join([p] * len(busy_users))})"
+            params += busy_users
+        cur.execute(sql + " ORDER BY fair_tag, created_at LIMIT 1", params)
+        row = cur.fetchone()
+        if row:
+            cur.execute(
+                f"""UPDATE jobs SET status = 'running', worker_id = {p}, attempts = attempts + 1,
+                           started_at = {p}, heartbeat_at = {p}
+                    WHERE id = {p}""",
+                (worker_id, now, now, row["id"])
+            )
+            cur.execute(f"SELECT {', '.join(JOB_FIELDS + ('payload',))} FROM jobs WHERE id = {p}", (row["id"],))
+            row = cur.fetchone()
+        conn.commit()
+    return _job_from_row(row) if row else None
+
+def claim_job_by_id(job_id: str, worker_id: str) -> Optional[dict]:
+    """
+    Marks one queued job as running for `worker_id` and returns it with its payload, or None
+    if it is no longer queued (a lane worker claimed it first). Bypasses the lane's scheduling.
+    """
+    now = datetime.now(timezone.utc).isoformat()
+    p = _get_placeholder()
+    with _connection(write=True) as conn:
+        cur = _get_cursor(conn)
+        cur.execute(
+            f"""UPDATE jobs SET status = 'running', worker_id = {p}, attempts = attempts + 1,
+                       started_at = {p}, heartbeat_at = {p}
+                WHERE id = {p} AND status = 'queued'""",
+            (worker_id, now, now, job_id)
+        )
+        row = None
+        if cur.rowcount > 0:
+            cur.execute(f"SELECT {', '.join(JOB_FIELDS + ('payload',))} FROM jobs WHERE id = {p}", (job_id,))
+            row = cur.fetchone()
+        conn.commit()
+    return _job_from_row(row) if row else None
+
+def heartbeat_job(job_id: str, worker_id: str) -> bool:
+    """Extends a running job's lease. Returns False if the worker no longer owns the job."""
+    p = _get_placeholder()
+    with _connection(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute(
+            f"UPDATE jobs SET heartbeat_at = {p} WHERE id = {p} AND worker_id = {p} AND status = 'running'",
+            (datetime.now(timezone.utc).isoformat(), job_id, worker_id)
+        )
+        owned = cur.rowcount > 0
+        conn.commit()
+    return owned
+
+def finish_job(job_id: str, worker_id: str, result: Optional[dict] = None, error: Optional[str] = None) -> bool:
+    """Records a job's result (or error). Ignored if the job was requeued to another worker."""
+    p = _get_placeholder()
+    with _connection(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute(
+            f"""UPDATE jobs SET status = {p}, result = {p}, error = {p}, finished_at = {p}
+                WHERE id = {p} AND worker_id = {p} AND status = 'running'""",
+            ("failed" if error is not None else "done", json.dumps(result) if result is not None else None,
+             error, datetime.now(timezone.utc).isoformat(), job_id, worker_id)
+        )
+        owned = cur.rowcount > 0
+        conn.commit()
+    return owned
+
+def requeue_stale_jobs(lease_seconds: float, max_attempts: int) -> tuple:
+    """
+    Returns running jobs whose worker stopped heartbeating to the queue, or fails them once
+    they have been attempted `max_attempts` times. Returns (requeued, failed).
+    """
+    now = datetime.now(timezone.utc)
+    cutoff = (now - timedelta(seconds=lease_seconds)).isoformat()
+    p = _get_placeholder()
+    with _connection(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute(
+            f"""UPDATE jobs SET status = 'queued', worker_id = NULL
+                WHERE status = 'running' AND heartbeat_at < {p} AND attempts < {p}""",
+            (cutoff, max_attempts)
+        )
+        requeued = cur.rowcount
+        cur.execute(
+            f"""UPDATE jobs SET status = 'failed', error = 'Worker lost', finished_at = {p}
+                WHERE status = 'running' AND heartbeat_at < {p}""",
+            (now.isoformat(), cutoff)
+        )
+        failed = cur.rowcount
+        conn.commit()
+    return requeued, failed
+
+def release_jobs(worker_ids: list) -> int:
+    """Returns the running jobs of stopped workers to the queue. Returns how many."""
+    if not worker_ids:
+        return 0
+    p = _get_placeholder()
+    with _connection(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute(
+            f"""UPDATE jobs SET status = 'queued', worker_id = NULL
+                WHERE status = 'running' AND worker_id IN ({', '.join([p] * len(worker_ids))})""",
+            list(worker_ids)
+        )
+        released = cur.rowcount
+        conn.commit()
+    return released
+
+def delete_finished_jobs(older_than_days: float) -> int:
+    """Deletes finished jobs created more than `older_than_days` ago. Returns how many."""
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).isoformat()
+    p = _get_placeholder()
+    with _connection(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute(
+            f"DELETE FROM jobs WHERE status IN ({p}, {p}) AND created_at < {p}",
+            JOB_FINISHED_STATUSES + (cutoff,)
+        )
+        deleted = cur.rowcount
+        conn.commit()
+    return deleted
+
+def get_job_stats() -> dict:
+    """
+    Returns, per lane, the number of jobs per status and the age in seconds of the oldest
+    queued job.
+    """
+    with _connection() as conn:
+        cur = _get_cursor(conn)
+        cur.execute("SELECT lane, status, COUNT(*) AS count, MIN(created_at) AS oldest FROM jobs GROUP BY lane, status")
+        rows = cur.fetchall()
+    now = datetime.now(timezone.utc)
+    stats = {}
+    for row in rows:
+        lane = stats.setdefault(row["lane"], {"oldest_queued_seconds": 0})
+        lane[row["status"]] = row["count"]
+        if row["status"] == "queued":
+            oldest = row["oldest"]
+            if isinstance(oldest, str):
+                oldest = datetime.fromisoformat(oldest)
+            lane["oldest_queued_seconds"] = (now - oldest).total_seconds()
+    return stats
@@ -0,0 +1,172 @@
+"""
+Vouch Index Snapshots
+Compact, versioned, memory-mappable export of the code index so new workers can
+start warm. Layout:
+
+    header    8s magic | u32 version | u32 flags | u64 manifest offset | u64 manifest length
+    per namespace:
+      blobs   UTF-8 symbol snippets, back to back
+      table   zlib-compressed JSON lines: {"files": {rel_path: hash}}, then one
+              [doc_id, blob offset, blob length, metadata] line per symbol
+    manifest  zlib-compressed JSON: {created_at, namespaces: {key: {namespace, symbols, table}}}
+
+Opening a snapshot reads only the manifest. A namespace's table is decompressed in chunks
+when its file hashes or symbols are needed (the file hashes of recently used namespaces
+stay cached), and symbol snippets are sliced from the mmap as they are yielded, so memory
+is bounded by the namespaces in use rather than by the size of the snapshot. Exports
+stream the same way: only one namespace's compressed table is buffered, in a temp file.
+
+Usage (from the api/ directory):
+    python index_snapshot.py export snapshot.vidx
+"""
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+MAGIC = b"VOUCHIDX"
+FORMAT_VERSION = 2
+_HEADER = struct.Struct("<8sIIQQ")
+# Namespaces whose file hashes are kept in memory
+CACHED_FILE_HASHES = 16
+# Bytes read (and written) per step when streaming a namespace table
+_CHUNK_SIZE = 1024 * 1024
+
+
+def _json_line(value) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode("utf8") + b"\n"
+
+
+class IndexSnapshot:
+    """Read-only view of a snapshot file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, _, manifest_offset, manifest_length = _HEADER.unpack_from(self._mm, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a Vouch index snapshot")
+            if version != FORMAT_VERSION:
+                raise ValueError(f"Unsupported snapshot version {version} (expected {FORMAT_VERSION}); export it again")
+            manifest = json.loads(zlib.decompress(self._mm[manifest_offset:manifest_offset + manifest_length]))
+        except Exception:
+            self._file.close()
+            raise
+        self.created_at = manifest.get("created_at")
+        self.namespaces = manifest["namespaces"]
+        self._file_hashes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def has_namespace(self, key):
+        return key in self.namespaces
+
+    def namespace_name(self, key):
+        return self.namespaces[key]["namespace"]
+
+    def _table(self, key):
+        """Yields the decoded lines of a namespace's table, decompressing it chunk by chunk."""
+        entry = self.namespaces.get(key)
+        if entry is None:
+            return
+        start, length = entry["table"]
+        decompressor = zlib.decompressobj()
+        pending = b""
+        for position in range(start, start + length, _CHUNK_SIZE):
+            pending += decompressor.decompress(self._mm[position:min(position + _CHUNK_SIZE, start + length)])
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                yield json.loads(line)
+        pending += decompressor.flush()
+        for line in pending.split(b"\n"):
+            if line:
+                yield json.loads(line)
+
+    def file_hashes(self, key):
+        """Returns {rel_path: content hash} of a namespace ({} if unknown)."""
+        with self._lock:
+            files = self._file_hashes.get(key)
+            if files is not None:
+                self._file_hashes.move_to_end(key)
+                return files
+        table = self._table(key)
+        files = next(table, {}).get("files", {})
+        table.close()
+        with self._lock:
+            self._file_hashes[key] = files
+            while len(self._file_hashes) > CACHED_FILE_HASHES:
+                self._file_hashes.popitem(last=False)
+        return files
+
+    def symbols(self, key, exclude_files=()):
+        """Yields (doc_id, content, metadata) for a namespace, skipping files in `exclude_files`."""
+        table = self._table(key)
+        next(table, None)  # File hashes
+        for doc_id, offset, length, metadata in table:
+            if metadata.get("file") in exclude_files:
+                continue
+            yield doc_id, self._mm[offset:offset + length].decode("utf8", errors="ignore"), metadata
+
+
+def write_snapshot(path, namespaces):
+    """
+    Writes a snapshot file atomically and returns its manifest.
+    `namespaces` yields (key, namespace, files, symbols) where `files` maps rel_path -> hash
+    and `symbols` yields (doc_id, content, metadata).
+    """
+    tmp_path = f"{path}.tmp"
+    manifest = {"created_at": time.time(), "namespaces": {}}
+    with open(tmp_path, "wb") as f, tempfile.TemporaryFile() as table:
+        f.write(b"\0" * _HEADER.size)
+        offset = _HEADER.size
+        for key, namespace, files, symbols in namespaces:
+            # Blobs go straight to the snapshot; the table is compressed into a temp file meanwhile
+            table.seek(0)
+            table.truncate()
+            compressor = zlib.compressobj(6)
+            table.write(compressor.compress(_json_line({"files": files})))
+            count = 0
+            for doc_id, content, metadata in symbols:
+                blob = (content or "").encode("utf8")
+                f.write(blob)
+                table.write(compressor.compress(_json_line([doc_id, offset, len(blob), metadata])))
+                offset += len(blob)
+                count += 1
+            table.write(compressor.flush())
+            table_length = table.tell()
+            table.seek(0)
+            shutil.copyfileobj(table, f, _CHUNK_SIZE)
+            manifest["namespaces"][key] = {"namespace": namespace, "symbols": count, "table": [offset, table_length]}
+            offset += table_length
+
+        compressed = zlib.compress(json.dumps(manifest, separators=(",", ":")).encode("utf8"), 6)
+        f.write(compressed)
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, 0, offset, len(compressed)))
+    os.replace(tmp_path, path)
+    return manifest
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "export":
+        print("Usage: python index_snapshot.py export <snapshot path>")
+        sys.exit(1)
+    from indexer import CodeIndexer
+    indexer = CodeIndexer(
+        db_path=os.environ.get("VOUCH_INDEX_PATH", "./chroma_db"),
+        snapshot_path=os.environ.get("VOUCH_INDEX_SNAPSHOT")
+    )
+    written = indexer.export_snapshot(sys.argv[2])
+    print(f"✅ Exported {len(written['namespaces'])} index namespaces to {sys.argv[2]}")
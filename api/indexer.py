@@ -1,157 +1,623 @@
 import os
+import time
 import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 import chromadb
 from chromadb.utils import embedding_functions
+from search_index import BM25Index
+from symbol_graph import SymbolGraph
+from index_snapshot import IndexSnapshot, write_snapshot
+from symbol_extractor import (
+    LANGUAGE_BY_EXTENSION, extract_definitions, extract_definitions_task,
+    parse_source, definitions_from_tree, reparse_incremental, tree_edits, changed_rows,
+    definitions_in_rows, update_definitions
+)
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # No cross-process write lock (Windows): run a single indexing process
+
+# Below this many changed files, process-pool startup costs more than it saves
+PARALLEL_INDEX_MIN_FILES = 32
+# Worker processes for parallel parsing (defaults to the number of CPU cores)
+INDEX_WORKERS = int(os.environ.get("VOUCH_INDEX_WORKERS") or 0) or os.cpu_count() or 1
+# Max records per ChromaDB call (stays below SQLite's bound-variable limits)
+CHROMA_BATCH_SIZE = 5000
+# Total symbols kept on disk across all repositories; cold repos are evicted beyond this
+MAX_INDEXED_SYMBOLS = int(os.environ.get("VOUCH_INDEX_MAX_SYMBOLS") or 200000)
+# Repositories whose BM25 index is kept in memory at the same time
+MAX_LOADED_NAMESPACES = 32
+# Syntax trees kept for incremental re-parsing of PR files
+MAX_CACHED_TREES = int(os.environ.get("VOUCH_INDEX_CACHED_TREES") or 256)
+# Queries record namespace use in memory; it is written to the registry at most this often (seconds)
+NAMESPACE_USE_FLUSH_INTERVAL = 60
+
+# Held (flock) by the process writing to the index directory
+WRITE_LOCK_FILE = "vouch-index.lock"
+
+DEFAULT_NAMESPACE = "default"
+# Pre-sharding collections that mixed every tenant's files together
+LEGACY_COLLECTIONS = ("vouch_codebase", "vouch_metadata")
+
+
+def _batched(items, size):
+    """Yields consecutive slices of at most `size` items."""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _namespace_key(namespace):
+    """Collection-safe identifier for a namespace (ChromaDB names are limited to 63 chars)."""
+    return hashlib.sha256(namespace.encode("utf-8")).hexdigest()[:24]
+
 
 class FakeEmbeddingFunction(embedding_functions.EmbeddingFunction):
     def __call__(self, input: chromadb.Documents) -> chromadb.Embeddings:
-        # Return dummy embeddings (list of lists of floats)
+        # Return dummy embeddings (list of lists of floats).
+        # ChromaDB is only used as persistent storage; retrieval goes through the BM25 index.
         return [[0.1] * 384 for _ in input]
 
-try:
-    from tree_sitter_languages import get_parser, get_language
-except ImportError:
-    print("⚠️ tree_sitter_languages not found. Indexing features will be disabled.")
-    get_parser = None
-    get_language = None
+
+class IndexShard:
+    """The symbol and file-hash collections of one repository, plus its in-memory BM25 index and symbol graph."""
+
+    def __init__(self, namespace, symbols, files):
+        self.namespace = namespace
+        self.key = _namespace_key(namespace)
+        self.symbols = symbols
+        self.files = files
+        self.search_index = None
+        self.graph = None
+        # Registry generation the in-memory state was loaded at (None: not indexed locally)
+        self.generation = None
+
 
 class CodeIndexer:
-    def __init__(self, db_path="./chroma_db"):
+    """
+    Indexes repository symbols, sharded per namespace (one namespace per installation/repo).
+    Each namespace gets its own collections so tenants never see or overwrite each other's
+    files, and least recently used namespaces are evicted once MAX_INDEXED_SYMBOLS is exceeded.
+
+    Processes on one host may share a db_path (e.g. several job workers), but ChromaDB's
+    local store allows a single writer: every write holds an exclusive lock on
+    WRITE_LOCK_FILE, and bumps the namespace's generation in the registry so the other
+    processes reload their in-memory BM25 index and symbol graph. Never share db_path
+    between hosts; where fcntl is unavailable, only one process may index.
+    """
+
+    def __init__(self, db_path="./chroma_db", snapshot_path=None):
         self.client = chromadb.PersistentClient(path=db_path)
         # Using a fake embedding function to avoid downloading models and permission issues
         self.ef = FakeEmbeddingFunction()
-        self.collection = self.client.get_or_create_collection(
-            name="vouch_codebase",
+        # One entry per namespace: {namespace, last_used, symbols, generation}
+        self.registry = self.client.get_or_create_collection(
+            name="vouch_namespaces",
             embedding_function=self.ef
         )
-        self.index_metadata_collection = self.client.get_or_create_collection(
-            name="vouch_metadata",
-            embedding_function=self.ef
+        self._shards = OrderedDict()
+        # (namespace key, rel_path) -> (content bytes, syntax tree) of the last indexed revision
+        self._trees = OrderedDict()
+        # namespace key -> last query time not yet written to the registry
+        self._pending_uses = {}
+        self._uses_flushed_at = time.monotonic()
+        self._pool = None
+        # Cross-process write lock (flock on the lock file) plus its in-process reentrancy
+        self._lock_file = open(os.path.join(db_path, WRITE_LOCK_FILE), "a")
+        self._thread_lock = threading.RLock()
+        self._write_depth = 0
+        with self._write_lock():
+            self._drop_legacy_collections()
+        # Optional read-only base layer; local collections hold the deltas on top of it
+        self.snapshot = None
+        if snapshot_path:
+            try:
+                self.snapshot = IndexSnapshot(snapshot_path)
+                print(f"📦 Loaded index snapshot with {len(self.snapshot.namespaces)} namespaces.")
+            except Exception as e:
+                print(f"⚠️ Could not load index snapshot '{snapshot_path}': {e}")
+
+    @contextmanager
+    def _write_lock(self, blocking=True):
+        """
+        Holds the index directory's write lock; reentrant within the process. Yields False
+        (without the lock) if `blocking` is off and another writer holds it.
+        """
+        if not self._thread_lock.acquire(blocking=blocking):
+            yield False
+            return
+        try:
+            if self._write_depth == 0 and fcntl is not None:
+                try:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    yield False
+                    return
+            self._write_depth += 1
+            try:
+                yield True
+            finally:
+                self._write_depth -= 1
+                if self._write_depth == 0 and fcntl is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        finally:
+            self._thread_lock.release()
+
+    def _drop_legacy_collections(self):
+        """Removes the old global collections; they are a cache and would never be reclaimed."""
+        existing = {getattr(c, "name", c) for c in self.client.list_collections()}
+        for name in LEGACY_COLLECTIONS:
+            if name in existing:
+                self.client.delete_collection(name)
+                print(f"🧹 Dropped legacy index collection '{name}'.")
+
+    def _get_shard(self, namespace, create=True):
+        """
+        Returns the shard for a namespace, opening its collections on first use and again
+        whenever another process has written to the namespace since (its generation changed).
+        With `create=False`, returns None for namespaces that are neither indexed locally
+        nor part of the snapshot.
+        """
+        key = _namespace_key(namespace)
+        entry = self.registry.get(ids=[key], include=["metadatas"])
+        generation = (entry["metadatas"][0] or {}).get("generation", 0) if entry["ids"] else None
+        if not create and generation is None and not (self.snapshot is not None and self.snapshot.has_namespace(key)):
+            self._shards.pop(key, None)
+            return None
+        shard = self._shards.get(key)
+        if shard is None or shard.generation != generation:
+            shard = IndexShard(
+                namespace,
+                symbols=self.client.get_or_create_collection(name=f"vouch_code_{key}", embedding_function=self.ef),
+                files=self.client.get_or_create_collection(name=f"vouch_files_{key}", embedding_function=self.ef)
+            )
+            shard.generation = generation
+            self._shards[key] = shard
+            # Only keep the BM25 indexes of recently used repositories in memory
+            while len(self._shards) > MAX_LOADED_NAMESPACES:
+                self._shards.popitem(last=False)
+        self._shards.move_to_end(key)
+        return shard
+
+    def _get_search_index(self, shard):
+        """Returns the shard's BM25 index, rebuilding it from the persisted symbols if needed."""
+        if shard.search_index is None:
+            shard.search_index = BM25Index()
+            for doc_id, doc, meta in self._iter_symbols(shard):
+                shard.search_index.add_document(doc_id, doc or "", meta or {}, name=(meta or {}).get("name"))
+        return shard.search_index
+
+    def _iter_symbols(self, shard, page_size=None):
+        """
+        Yields (doc_id, content, metadata) of the shard's current symbols: snapshot symbols
+        of files that were not re-indexed locally, followed by the local symbols (read
+        `page_size` at a time if given; only page under the write lock).
+        """
+        if self.snapshot is not None:
+            local_files = set(shard.files.get(include=[])["ids"])
+            yield from self.snapshot.symbols(shard.key, exclude_files=local_files)
+        if page_size is None:
+            stored = shard.symbols.get(include=["documents", "metadatas"])
+            yield from zip(stored["ids"], stored["documents"], stored["metadatas"])
+            return
+        offset = 0
+        while True:
+            stored = shard.symbols.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            yield from zip(stored["ids"], stored["documents"], stored["metadatas"])
+            if len(stored["ids"]) < page_size:
+                return
+            offset += page_size
+
+    def _touch(self, shard, changed=True):
+        """
+        Records a write to a namespace (its use and symbol count) for LRU eviction. If it
+        `changed`, its generation moves on so other processes reload it. Call with the write lock.
+        """
+        self._pending_uses.pop(shard.key, None)
+        if changed or shard.generation is None:
+            # A write timestamp rather than a counter: it never repeats after an eviction
+            shard.generation = max(time.time_ns(), (shard.generation or 0) + 1)
+        self.registry.upsert(
+            ids=[shard.key],
+            metadatas=[{"namespace": shard.namespace, "last_used": time.time(), "symbols": shard.symbols.count(),
+                        "generation": shard.generation}],
+            documents=[""]
         )
 
+    def _record_use(self, shard):
+        """Records a query of a namespace in memory, so reads never write to the index store."""
+        self._pending_uses[shard.key] = time.time()
+        if time.monotonic() - self._uses_flushed_at >= NAMESPACE_USE_FLUSH_INTERVAL:
+            # Queries never wait for an indexing process; the uses are flushed later instead
+            self._flush_uses(blocking=False)
+
+    def _flush_uses(self, blocking=True):
+        """Writes the last-use times of queried namespaces to the registry in one batch."""
+        with self._write_lock(blocking=blocking) as locked:
+            if not locked:
+                return
+            pending, self._pending_uses = self._pending_uses, {}
+            self._uses_flushed_at = time.monotonic()
+            if not pending:
+                return
+            # Only locally indexed namespaces are registered (snapshot-only ones have nothing to evict)
+            keys = self.registry.get(ids=list(pending), include=[])["ids"]
+            if keys:
+                self.registry.update(ids=keys, metadatas=[{"last_used": pending[key]} for key in keys])
+
+    def _enforce_capacity(self, keep_key):
+        """Evicts the least recently used namespaces until the symbol budget is met."""
+        self._flush_uses()
+        entries = self.registry.get(include=["metadatas"])
+        namespaces = sorted(
+            zip(entries["ids"], entries["metadatas"]),
+            key=lambda item: (item[1] or {}).get("last_used", 0)
+        )
+        total = sum((meta or {}).get("symbols", 0) for _, meta in namespaces)
+        for key, meta in namespaces:
+            if total <= MAX_INDEXED_SYMBOLS:
+                break
+            if key == keep_key:
+                continue
+            self.evict_namespace_key(key)
+            total -= (meta or {}).get("symbols", 0)
+            print(f"🧹 Evicted cold index namespace '{(meta or {}).get('namespace', key)}'.")
+
+    def evict_namespace_key(self, key):
+        """Deletes all persisted and in-memory index data for a namespace key."""
+        with self._write_lock():
+            for name in (f"vouch_code_{key}", f"vouch_files_{key}"):
+                try:
+                    self.client.delete_collection(name)
+                except Exception:
+                    pass  # Already gone
+            self.registry.delete(ids=[key])
+        self._shards.pop(key, None)
+        self._pending_uses.pop(key, None)
+
     def _calculate_file_hash(self, content):
         return hashlib.sha256(content.encode('utf-8')).hexdigest()
 
-    def index_repository(self, repo_path):
-        """Walks through the repository and indexes files."""
-        indexed_files = []
-        for root, _, files in os.walk(repo_path):
-            for file in files:
-                if file.endswith(('.py', '.js', '.jsx', '.ts', '.tsx')):
-                    file_path = os.path.join(root, file)
-                    rel_path = os.path.relpath(file_path, repo_path)
-                    
-                    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                        content = f.read()
-                    
-                    file_hash = self._calculate_file_hash(content)
-                    
-                    # Check if file has changed
-                    existing_meta = self.index_metadata_collection.get(ids=[rel_path])
-                    if existing_meta['ids'] and existing_meta['metadatas'][0]['hash'] == file_hash:
-                        continue
-                    
-                    # Index symbols and update metadata
-                    self._index_file_symbols(rel_path, content)
-                    self.index_metadata_collection.upsert(
-                        ids=[rel_path],
-                        metadatas=[{"hash": file_hash, "path": rel_path}],
-                        documents=[""] # ChromaDB requires at least one of documents or images
-                    )
-                    indexed_files.append(rel_path)
+    def index_repository(self, repo_path, namespace=DEFAULT_NAMESPACE, prune=True, parallel=None, manifest=None):
+        """
+        Walks through the repository and indexes changed files into the namespace's shard.
+        With `prune=True` the directory is treated as the complete repository and files that
+        disappeared are removed from the index; pass `prune=False` for partial checkouts (PR diffs).
+        Parsing runs in a process pool when many files changed (or `parallel=True`);
+        pass `parallel=False` to force in-process parsing.
+        Pass the repository's `manifest` (manifest.py) to read files from it instead of walking the directory.
+        """
+        candidates = []
+        if manifest is not None:
+            for path in manifest.paths():
+                if path.endswith(tuple(LANGUAGE_BY_EXTENSION)):
+                    content = manifest.read_text(path, errors='ignore')
+                    # Same hash as _calculate_file_hash, without rehashing unchanged files
+                    candidates.append((path, content, manifest.text_sha256(path, content)))
+        else:
+            for root, _, files in os.walk(repo_path):
+                for file in files:
+                    if file.endswith(tuple(LANGUAGE_BY_EXTENSION)):
+                        file_path = os.path.join(root, file)
+                        rel_path = os.path.relpath(file_path, repo_path)
+
+                        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                            content = f.read()
+
+                        candidates.append((rel_path, content, self._calculate_file_hash(content)))
+
+        with self._write_lock():
+            return self._index_candidates(candidates, namespace, prune, parallel)
+
+    def _index_candidates(self, candidates, namespace, prune, parallel):
+        """Indexes the changed ones of (rel_path, content, hash) candidates. Call with the write lock."""
+        shard = self._get_shard(namespace)
+        # Check which files have changed with one metadata lookup per batch instead of per file
+        known_hashes = self._get_file_hashes(shard)
+        changed = [c for c in candidates if known_hashes.get(c[0]) != c[2]]
+
+        if parallel is None:
+            parallel = INDEX_WORKERS > 1 and len(changed) >= PARALLEL_INDEX_MIN_FILES
+
+        if parallel:
+            results = self._extract_parallel([(rel_path, content) for rel_path, content, _ in changed])
+        else:
+            results = ((rel_path, extract_definitions(rel_path, content)) for rel_path, content, _ in changed)
+
+        hashes = {rel_path: file_hash for rel_path, _, file_hash in changed}
+        definitions_by_file = {
+            rel_path: definitions for rel_path, definitions in results if definitions is not None
+        }
+
+        removed = []
+        if prune:
+            present = {rel_path for rel_path, _, _ in candidates}
+            removed = [rel_path for rel_path in known_hashes if rel_path not in present]
+            self._remove_files(shard, removed)
+
+        # Index symbols and update metadata in bulk
+        self._store_definitions_bulk(shard, definitions_by_file)
+        indexed_files = list(definitions_by_file)
+        for batch in _batched(indexed_files, CHROMA_BATCH_SIZE):
+            shard.files.upsert(
+                ids=batch,
+                metadatas=[{"hash": hashes[rel_path], "path": rel_path} for rel_path in batch],
+                documents=[""] * len(batch) # ChromaDB requires at least one of documents or images
+            )
+
+        self._touch(shard, changed=bool(indexed_files or removed))
+        self._enforce_capacity(keep_key=shard.key)
         return indexed_files
 
-    def _index_file_symbols(self, file_path, content):
-        """Parses a file with tree-sitter and indexes function/class definitions."""
-        ext = os.path.splitext(file_path)[1]
-        lang_name = {
-            '.py': 'python',
-            '.js': 'javascript',
-            '.jsx': 'javascript',
-            '.ts': 'typescript',
-            '.tsx': 'tsx'
-        }.get(ext)
-        
-        if not lang_name:
-            return
+    def _get_file_hashes(self, shard, rel_paths=None):
+        """
+        Returns {rel_path: content hash} for the given files (default: every file) indexed in
+        the shard. Local entries override the snapshot; local tombstones hide snapshot files.
+        """
+        hashes = {}
+        if self.snapshot is not None:
+            snapshot_hashes = self.snapshot.file_hashes(shard.key)
+            if rel_paths is None:
+                hashes.update(snapshot_hashes)
+            else:
+                hashes.update((p, snapshot_hashes[p]) for p in rel_paths if p in snapshot_hashes)
 
-        if not get_parser or not get_language:
-            print(f"Skipping indexing for {file_path} (missing dependency)")
+        if rel_paths is not None:
+            existing = shard.files.get(ids=list(rel_paths), include=["metadatas"])
+        else:
+            existing = shard.files.get(include=["metadatas"])
+        for doc_id, meta in zip(existing['ids'], existing['metadatas']):
+            if (meta or {}).get('deleted'):
+                hashes.pop(doc_id, None)
+            else:
+                hashes[doc_id] = (meta or {}).get('hash')
+        return hashes
+
+    def _remove_files(self, shard, rel_paths):
+        """Removes the symbols and hashes of files that no longer exist."""
+        if not rel_paths:
             return
+        self._store_definitions_bulk(shard, {rel_path: [] for rel_path in rel_paths})
+        # Files from the read-only snapshot can only be hidden, with a local tombstone
+        snapshot_hashes = self.snapshot.file_hashes(shard.key) if self.snapshot is not None else {}
+        tombstones = [rel_path for rel_path in rel_paths if rel_path in snapshot_hashes]
+        deleted = [rel_path for rel_path in rel_paths if rel_path not in snapshot_hashes]
+        for batch in _batched(tombstones, CHROMA_BATCH_SIZE):
+            shard.files.upsert(
+                ids=batch,
+                metadatas=[{"hash": "", "path": rel_path, "deleted": True} for rel_path in batch],
+                documents=[""] * len(batch)
+            )
+        for batch in _batched(deleted, CHROMA_BATCH_SIZE):
+            shard.files.delete(ids=batch)
 
-        try:
-            parser = get_parser(lang_name)
-            tree = parser.parse(bytes(content, "utf8"))
-            
-            # Simple queries for definitions
-            query_str = ""
-            if lang_name == 'python':
-                query_str = """
-                (function_definition
-                    name: (identifier) @name) @def
-                (class_definition
-                    name: (identifier) @name) @def
-                """
-            elif lang_name in ['javascript', 'typescript', 'tsx']:
-                query_str = """
-                (function_declaration
-                    name: (identifier) @name) @def
-                (method_definition
-                    name: (property_identifier) @name) @def
-                (class_declaration
-                    name: (identifier) @name) @def
-                (variable_declarator
-                    name: (identifier) @name
-                    value: (arrow_function)) @def
-                """
-
-            if not query_str:
-                return
+    def _get_pool(self):
+        """Returns the indexing process pool, starting it on first use."""
+        if self._pool is None:
+            # 'spawn' keeps workers independent of the server's threads and ChromaDB state;
+            # the pool is reused so each worker's parser and query caches stay warm.
+            self._pool = ProcessPoolExecutor(
+                max_workers=INDEX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
 
-            language = get_language(lang_name)
-            if not language:
-                return
-            query = language.query(query_str)
-            captures = query.captures(tree.root_node)
-            
-            # Group by @def and @name
-            definitions = []
-            for node, tag in captures:
-                if tag == 'def':
-                    start_byte = node.start_byte
-                    end_byte = node.end_byte
-                    code_snippet = content[start_byte:end_byte]
-                    
-                    # Find the corresponding name (usually the next capture or part of this node)
-                    # For simplicity, we'll just store the snippet and the whole thing
-                    definitions.append({
-                        "id": f"{file_path}:{node.start_point[0]}",
-                        "content": code_snippet,
-                        "metadata": {
-                            "file": file_path,
-                            "line": node.start_point[0],
-                            "type": node.type
-                        }
-                    })
-
-            if definitions:
-                # Clear old entries for this file
-                # ChromaDB filtering by file metadata
-                self.collection.delete(where={"file": file_path})
-                
-                self.collection.add(
-                    ids=[d["id"] for d in definitions],
-                    documents=[d["content"] for d in definitions],
-                    metadatas=[d["metadata"] for d in definitions]
-                )
-
-        except Exception as e:
-            print(f"Error indexing {file_path}: {e}")
-
-    def query_context(self, code_snippet, n_results=3):
-        """Finds relevant symbol definitions for a given piece of code."""
-        results = self.collection.query(
-            query_texts=[code_snippet],
-            n_results=n_results
-        )
-        return results
+    def _extract_parallel(self, tasks):
+        """Parses files across the process pool. Yields (file_path, definitions)."""
+        chunksize = max(1, len(tasks) // (INDEX_WORKERS * 4))
+        return self._get_pool().map(extract_definitions_task, tasks, chunksize=chunksize)
+
+    def _store_definitions_bulk(self, shard, definitions_by_file):
+        """
+        Replaces the stored symbols of many files at once.
+        Old entries are cleared for every file, also when all its definitions were removed.
+        """
+        file_paths = list(definitions_by_file)
+        for batch in _batched(file_paths, CHROMA_BATCH_SIZE):
+            # ChromaDB filtering by file metadata
+            shard.symbols.delete(where={"file": {"$in": batch}})
+
+        # De-duplicate defensively: a duplicate id would make ChromaDB reject the whole batch
+        definitions = list({d["id"]: d for defs in definitions_by_file.values() for d in defs}.values())
+        for batch in _batched(definitions, CHROMA_BATCH_SIZE):
+            shard.symbols.add(
+                ids=[d["id"] for d in batch],
+                documents=[d["content"] for d in batch],
+                metadatas=[d["metadata"] for d in batch]
+            )
+
+        # Keep the in-memory index in sync if it is loaded; otherwise it is rebuilt lazily
+        shard.graph = None
+        if shard.search_index is not None:
+            for file_path in file_paths:
+                shard.search_index.remove_file(file_path)
+            for d in definitions:
+                shard.search_index.add_document(d["id"], d["content"], d["metadata"], name=d["metadata"]["name"])
+
+    def index_changed_files(self, files, namespace=DEFAULT_NAMESPACE):
+        """
+        Incrementally indexes individual changed files (e.g. from a PR) without a checkout.
+        `files` is a list of (rel_path, content, patch) tuples; `patch` is the unified diff
+        from GitHub and may be None. If the previous revision's syntax tree is cached, the
+        changes are applied as tree edits, the file is reparsed incrementally, only the
+        definitions around the edits are extracted again, and only symbols whose content or
+        position changed are rewritten.
+        Returns the list of files whose symbols were updated.
+        """
+        files = [f for f in files if f[0].endswith(tuple(LANGUAGE_BY_EXTENSION))]
+        with self._write_lock():
+            return self._index_changed(files, namespace)
+
+    def _index_changed(self, files, namespace):
+        """Indexes (rel_path, content, patch) files of index_changed_files. Call with the write lock."""
+        shard = self._get_shard(namespace)
+        known_hashes = self._get_file_hashes(shard, [rel_path for rel_path, _, _ in files])
+
+        indexed_files = []
+        for rel_path, content, patch in files:
+            file_hash = self._calculate_file_hash(content)
+            if known_hashes.get(rel_path) == file_hash:
+                continue
+
+            new_bytes = bytes(content, "utf8")
+            cached = self._trees.pop((shard.key, rel_path), None)
+            if cached is not None and self._calculate_file_hash(cached[0].decode("utf8")) != known_hashes.get(rel_path):
+                # Another process indexed a newer revision since this tree was parsed
+                cached = None
+            stored = self._stored_definitions(shard, rel_path)
+            try:
+                if cached is not None:
+                    edits = tree_edits(cached[0], new_bytes, patch)
+                    tree = reparse_incremental(rel_path, cached[0], cached[1], new_bytes, edits=edits)
+                else:
+                    tree = parse_source(rel_path, new_bytes)
+                if tree is None:
+                    continue
+                if cached is not None and stored:
+                    # Only the definitions around the edits are extracted again
+                    rows = changed_rows(edits)
+                    changed = definitions_in_rows(rel_path, new_bytes, tree, rows)
+                    definitions = update_definitions(rel_path, stored, changed, rows) if changed is not None else None
+                else:
+                    definitions = definitions_from_tree(rel_path, new_bytes, tree)
+            except Exception as e:
+                print(f"Error indexing {rel_path}: {e}")
+                continue
+            if definitions is None:
+                continue
+
+            self._trees[(shard.key, rel_path)] = (new_bytes, tree)
+            while len(self._trees) > MAX_CACHED_TREES:
+                self._trees.popitem(last=False)
+
+            self._apply_definition_changes(shard, rel_path, definitions, stored)
+            shard.files.upsert(
+                ids=[rel_path],
+                metadatas=[{"hash": file_hash, "path": rel_path}],
+                documents=[""]
+            )
+            indexed_files.append(rel_path)
+
+        self._touch(shard, changed=bool(indexed_files))
+        self._enforce_capacity(keep_key=shard.key)
+        return indexed_files
+
+    def _stored_definitions(self, shard, file_path):
+        """The symbols of a file in the local index, as definition dicts."""
+        stored = shard.symbols.get(where={"file": file_path}, include=["documents", "metadatas"])
+        return [
+            {"id": doc_id, "content": doc, "metadata": meta}
+            for doc_id, doc, meta in zip(stored["ids"], stored["documents"], stored["metadatas"])
+        ]
+
+    def _apply_definition_changes(self, shard, file_path, definitions, stored):
+        """
+        Writes only the difference between a file's `stored` symbols and its new definitions:
+        new or edited symbols are upserted, removed ones deleted, and symbols that merely
+        moved (code above them changed) get a metadata-only update.
+        """
+        old = {d["id"]: (d["content"], d["metadata"]) for d in stored}
+        new = {d["id"]: d for d in definitions}
+
+        removed = [doc_id for doc_id in old if doc_id not in new]
+        changed = [d for doc_id, d in new.items() if doc_id not in old or old[doc_id][0] != d["content"]]
+        moved = [
+            d for doc_id, d in new.items()
+            if doc_id in old and old[doc_id][0] == d["content"] and old[doc_id][1] != d["metadata"]
+        ]
+
+        if removed:
+            shard.symbols.delete(ids=removed)
+        if changed:
+            shard.symbols.upsert(
+                ids=[d["id"] for d in changed],
+                documents=[d["content"] for d in changed],
+                metadatas=[d["metadata"] for d in changed]
+            )
+        if moved:
+            shard.symbols.update(ids=[d["id"] for d in moved], metadatas=[d["metadata"] for d in moved])
+
+        if removed or changed or moved:
+            shard.graph = None
+            if shard.search_index is not None:
+                if not old:
+                    # The file came from the snapshot (or is new): replace it wholesale
+                    shard.search_index.remove_file(file_path)
+                for doc_id in removed:
+                    shard.search_index.remove_document(doc_id)
+                for d in changed:
+                    shard.search_index.add_document(d["id"], d["content"], d["metadata"], name=d["metadata"]["name"])
+                for d in moved:
+                    shard.search_index.update_metadata(d["id"], d["metadata"])
+
+    def query_context(self, code_snippet, n_results=3, namespace=DEFAULT_NAMESPACE):
+        """
+        Finds relevant symbol definitions for a given piece of code using BM25 ranking.
+        Only the given namespace is searched.
+        Returns the same shape as a ChromaDB query result (one result list per query).
+        """
+        hits = []
+        shard = self._get_shard(namespace, create=False)
+        if shard is not None:
+            hits = self._get_search_index(shard).query(code_snippet, n_results=n_results)
+            self._record_use(shard)
+        return {
+            "ids": [[doc_id for doc_id, _, _, _ in hits]],
+            "documents": [[doc for _, _, doc, _ in hits]],
+            "metadatas": [[meta for _, _, _, meta in hits]],
+            "distances": [[-score for _, score, _, _ in hits]]
+        }
+
+    def related_definitions(self, findings, n_results=5, namespace=DEFAULT_NAMESPACE):
+        """
+        Returns the callee/caller definitions most relevant to the findings' locations,
+        ranked over the namespace's symbol graph. Findings need `file` and a 1-based `line`.
+        Returns the same shape as query_context (empty if no finding falls inside a definition).
+        """
+        locations = [
+            (f["file"], int(f["line"]) - 1)
+            for f in findings if f.get("file") and isinstance(f.get("line"), int) and f["line"] > 0
+        ]
+        doc_ids = []
+        documents = {}
+        shard = self._get_shard(namespace, create=False) if locations else None
+        if shard is not None:
+            documents = self._get_search_index(shard).documents
+            if shard.graph is None:
+                shard.graph = SymbolGraph(documents)
+            doc_ids = shard.graph.related(locations, n_results=n_results)
+            self._record_use(shard)
+        return {
+            "ids": [doc_ids],
+            "documents": [[documents[doc_id][0] for doc_id in doc_ids]],
+            "metadatas": [[documents[doc_id][1] for doc_id in doc_ids]]
+        }
+
+    def export_snapshot(self, path):
+        """
+        Writes every namespace (snapshot base with local deltas applied) to a new snapshot file.
+        Other workers can load it read-only via `CodeIndexer(snapshot_path=...)`.
+        Holds the write lock, so the export is consistent and creates no collections.
+        """
+        with self._write_lock():
+            names = {}
+            if self.snapshot is not None:
+                names.update((key, self.snapshot.namespace_name(key)) for key in self.snapshot.namespaces)
+            entries = self.registry.get(include=["metadatas"])
+            local = {key: (meta or {}).get("namespace", key) for key, meta in zip(entries["ids"], entries["metadatas"])}
+            names.update(local)
+
+            def namespaces():
+                for key, namespace in names.items():
+                    if key not in local:
+                        # Only in the snapshot: copied as is, without opening local collections
+                        yield key, namespace, self.snapshot.file_hashes(key), self.snapshot.symbols(key)
+                        continue
+                    shard = self._get_shard(namespace, create=False)
+                    yield key, namespace, self._get_file_hashes(shard), self._iter_symbols(shard, CHROMA_BATCH_SIZE)
+
+            return write_snapshot(path, namespaces())
@@ -0,0 +1,341 @@
+"""
+Vouch Job Queue
+Durable background jobs for scans: code snippets, repository uploads and GitHub pull
+request analysis. Jobs are rows in the `jobs` table. The web process submits them, a pool
+of worker processes claims and runs them one at a time each, and clients poll
+`/jobs/{id}` for the result. Workers heartbeat while a job runs; jobs whose worker stops
+heartbeating (crash, deploy) go back to the queue, so no accepted scan is lost.
+
+Scheduling: every job kind runs in a lane with its own workers, so snippets never wait
+behind repository scans. Within a lane, each user and each tier may only have a limited
+number of jobs running, and queued jobs are claimed in weighted fair queuing order:
+a job's fair tag advances its user's virtual clock by 1/weight of its tier, so a pro
+user's backlog is served four times as fast as a free user's, and a user's first scan is
+queued next to the head of the lane instead of behind another user's bulk upload.
+
+Uploaded archives are handed to workers through JOB_SPOOL_DIR, which must be shared
+with the workers when they run on another host. The code index (VOUCH_INDEX_PATH) is
+not: each host keeps its own, and the workers on a host write to it one at a time.
+
+A web process that starts no snippet workers runs its own snippet scans (SNIPPET_INLINE),
+so /scan answers without a worker; disable it when snippet workers run separately.
+
+Usage (from the api/ directory):
+    python jobs.py [lane=workers,...]   # standalone worker pool; set VOUCH_JOB_LANES=
+                                        # (empty) or "snippet=0,repo=0" and
+                                        # VOUCH_SNIPPET_INLINE=0 on web nodes
+"""
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from typing import Optional
+
+import async_database
+import database
+import pipeline
+
+
+def parse_limits(value: str) -> dict:
+    """Parses "name=count,..." settings (e.g. "free=1,micro=2,pro=4")."""
+    limits = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, count = item.split("=", 1)
+            limits[name.strip()] = int(count)
+    return limits
+
+
+# Lane of each job kind
+JOB_LANES = {
+    "snippet_scan": "snippet",
+    "repo_scan": "repo",
+    "github_pr": "repo",
+}
+# Worker processes per lane started next to each web process (0 = run `python jobs.py` separately)
+JOB_LANE_WORKERS = parse_limits(os.environ.get("VOUCH_JOB_LANES", "snippet=2,repo=2"))
+# Run snippet scans in the submitting web process (default: when it starts no snippet workers)
+SNIPPET_INLINE = (os.environ.get("VOUCH_SNIPPET_INLINE") or ("0" if JOB_LANE_WORKERS.get("snippet", 0) > 0 else "1")) == "1"
+# Scheduling weight per tier (share of a lane's throughput when several users are queued)
+TIER_WEIGHTS = {"free": 1, "micro": 2, "pro": 4}
+# Max running jobs per user, and per tier in total, in each lane (0 = unlimited)
+JOB_USER_LIMITS = parse_limits(os.environ.get("VOUCH_JOB_USER_LIMITS") or "free=1,micro=2,pro=4")
+JOB_TIER_LIMITS = parse_limits(os.environ.get("VOUCH_JOB_TIER_LIMITS") or "free=2,micro=4,pro=0")
+# Idle workers check for new jobs this often (seconds)
+JOB_POLL_INTERVAL = float(os.environ.get("VOUCH_JOB_POLL_INTERVAL") or 0.5)
+# A running job whose worker has not heartbeat for JOB_LEASE_SECONDS is requeued
+JOB_HEARTBEAT_INTERVAL = 15
+JOB_LEASE_SECONDS = float(os.environ.get("VOUCH_JOB_LEASE_SECONDS") or 120)
+JOB_MAX_ATTEMPTS = 3
+# Finished jobs (and abandoned uploads) are deleted after this many days
+JOB_RETENTION_DAYS = float(os.environ.get("VOUCH_JOB_RETENTION_DAYS") or 7)
+JOB_MAINTENANCE_INTERVAL = 30
+# How long /scan and /scan-repo wait for their job before answering 202 with the job id
+JOB_WAIT_TIMEOUT = float(os.environ.get("VOUCH_JOB_WAIT_TIMEOUT") or 600)
+JOB_SPOOL_DIR = os.environ.get("VOUCH_JOB_SPOOL_DIR") or os.path.join(tempfile.gettempdir(), "vouch-jobs")
+
+# Job kind -> async handler(payload, user_id) returning a JSON-serializable result
+HANDLERS = {
+    "snippet_scan": pipeline.run_snippet_scan_job,
+    "repo_scan": pipeline.run_repo_scan_job,
+    "github_pr": pipeline.run_github_pr_job,
+}
+
+
+def new_spool_dir() -> str:
+    """Creates a private directory for the files of one job."""
+    os.makedirs(JOB_SPOOL_DIR, exist_ok=True)
+    return tempfile.mkdtemp(dir=JOB_SPOOL_DIR)
+
+
+def tier_of(user: dict) -> str:
+    """The scheduling tier of an authenticated user (unknown tiers are scheduled as free)."""
+    tier = user.get("tier") or user.get("plan") or "free"
+    return tier if tier in TIER_WEIGHTS else "free"
+
+
+def dedup_key(kind: str, user_id: Optional[str], *parts) -> str:
+    """
+    Single-flight key of a job: identical work (same kind, user and content parts, e.g. the
+    upload's SHA-256 and language) submitted while a job is queued or running attaches to it.
+    """
+    digest = hashlib.sha256()
+    for part in (kind, user_id or "") + parts:
+        value = part if isinstance(part, bytes) else str(part or "").encode("utf-8")
+        # Length-prefixed so that part boundaries cannot collide
+        digest.update(len(value).to_bytes(8, "big") + value)
+    return digest.hexdigest()
+
+
+async def submit(kind: str, payload: dict, user_id: Optional[str] = None, tier: str = "free",
+                 dedup_parts: Optional[tuple] = None) -> tuple:
+    """
+    Queues a job in the lane of its kind. Returns (job id, True), or (id of the identical
+    in-flight job, False) when `dedup_parts` match a queued or running job of the same user.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    key = dedup_key(kind, user_id, *dedup_parts) if dedup_parts is not None else None
+    job_id, created = await async_database.create_job(
+        kind, payload, user_id=user_id, lane=JOB_LANES[kind], tier=tier,
+        weight=TIER_WEIGHTS.get(tier, 1), dedup_key=key
+    )
+    if not created:
+        print(f"🔁 Attached duplicate {kind} request to in-flight job {job_id}")
+    return job_id, created
+
+
+async def wait_for_job(job_id: str, timeout: float) -> Optional[dict]:
+    """Polls until the job has finished or `timeout` seconds have passed, then returns it."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    delay = 0.05
+    while True:
+        job = await async_database.get_job(job_id)
+        if job is None or job["status"] in database.JOB_FINISHED_STATUSES:
+            return job
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return job
+        await asyncio.sleep(min(delay, remaining))
+        delay = min(delay * 2, JOB_POLL_INTERVAL)
+
+
+async def run_inline(job_id: str) -> bool:
+    """
+    Claims a queued job and runs it in this process, off the event loop. Returns False if a
+    lane worker claimed it first.
+    """
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-inline-{uuid.uuid4().hex[:6]}"
+    job = await async_database.claim_job_by_id(job_id, worker_id)
+    if job is None:
+        return False
+    await asyncio.to_thread(run_job, job, worker_id)
+    return True
+
+
+# --- Workers ---
+
+class Heartbeats:
+    """
+    Extends the leases of the jobs running in this process from one long-lived thread (and
+    so one database connection), however many jobs the process runs over its lifetime.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._active = {}
+        self._thread = None
+
+    def add(self, job_id: str, worker_id: str):
+        with self._lock:
+            self._active[job_id] = worker_id
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="vouch-job-heartbeat", daemon=True)
+                self._thread.start()
+
+    def remove(self, job_id: str):
+        with self._lock:
+            self._active.pop(job_id, None)
+
+    def active(self) -> dict:
+        with self._lock:
+            return dict(self._active)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            for job_id, worker_id in self.active().items():
+                try:
+                    if not database.heartbeat_job(job_id, worker_id):
+                        print(f"⚠️ Job {job_id} was requeued away from worker {worker_id}")
+                        self.remove(job_id)
+                except Exception as e:
+                    print(f"Error extending job lease: {e}")
+
+
+heartbeats = Heartbeats(JOB_HEARTBEAT_INTERVAL)
+
+
+def run_job(job: dict, worker_id: str):
+    """Runs one claimed job and records its result or error."""
+    heartbeats.add(job["id"], worker_id)
+    started = time.monotonic()
+    try:
+        handler = HANDLERS.get(job["kind"])
+        if handler is None:
+            raise ValueError(f"Unknown job kind: {job['kind']}")
+        result = asyncio.run(handler(job["payload"], job["user_id"]))
+        database.finish_job(job["id"], worker_id, result=result)
+        print(f"✅ Job {job['id']} ({job['kind']}) finished in {time.monotonic() - started:.1f}s")
+    except Exception as e:
+        traceback.print_exc()
+        database.finish_job(job["id"], worker_id, error=str(e) or type(e).__name__)
+        print(f"❌ Job {job['id']} ({job['kind']}) failed: {e}")
+    finally:
+        heartbeats.remove(job["id"])
+
+
+def worker_main(worker_id: str, lane: str, stop):
+    """Entry point of a worker process: claims and runs jobs of `lane` until `stop` is set."""
+    # Ctrl-C is handled by the supervising process, which stops workers between jobs
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    print(f"👷 Job worker {worker_id} started")
+    while not stop.is_set():
+        try:
+            job = None
+            if database.has_queued_jobs(lane):
+                job = database.claim_job(worker_id, lane, JOB_USER_LIMITS, JOB_TIER_LIMITS)
+        except Exception as e:
+            print(f"Error claiming job: {e}")
+            job = None
+        if job is None:
+            stop.wait(JOB_POLL_INTERVAL)
+            continue
+        run_job(job, worker_id)
+    database.close_pool()
+
+
+def _prune_spool():
+    cutoff = time.time() - JOB_RETENTION_DAYS * 86400
+    try:
+        entries = list(os.scandir(JOB_SPOOL_DIR))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+def maintain():
+    """
+    Requeues the jobs of lost workers and prunes finished jobs, abandoned uploads and old
+    cache invalidations.
+    """
+    try:
+        requeued, failed = database.requeue_stale_jobs(JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS)
+        if requeued or failed:
+            print(f"♻️ Requeued {requeued} jobs of lost workers ({failed} failed after {JOB_MAX_ATTEMPTS} attempts)")
+        database.delete_finished_jobs(JOB_RETENTION_DAYS)
+        database.prune_cache_invalidations()
+    except Exception as e:
+        print(f"Error maintaining job queue: {e}")
+    _prune_spool()
+
+
+class WorkerPool:
+    """Runs `lanes[lane]` worker processes per lane, restarts any that die, and maintains the queue."""
+
+    def __init__(self, lanes: dict):
+        self.lanes = {lane: count for lane, count in lanes.items() if count > 0}
+        # Spawned, not forked: workers open their own database connections and code index
+        self._context = multiprocessing.get_context("spawn")
+        self._stop = self._context.Event()
+        self._processes = []
+        self._worker_ids = []
+        self._supervisor = None
+        self._prefix = f"{socket.gethostname()}-{os.getpid()}"
+
+    def _spawn(self, lane: str, index: int):
+        worker_id = f"{self._prefix}-{lane}-{index}-{uuid.uuid4().hex[:6]}"
+        # Not a daemon: workers start their own process pools for indexing
+        process = self._context.Process(
+            target=worker_main, args=(worker_id, lane, self._stop), name=f"vouch-job-{lane}-{index}"
+        )
+        process.start()
+        self._worker_ids.append(worker_id)
+        return lane, index, process
+
+    def start(self):
+        self._processes = [self._spawn(lane, i) for lane, count in self.lanes.items() for i in range(count)]
+        self._supervisor = threading.Thread(target=self._supervise, name="vouch-job-supervisor", daemon=True)
+        self._supervisor.start()
+        print(f"👷 Started job workers: {', '.join(f'{lane}={count}' for lane, count in self.lanes.items())}")
+
+    def _supervise(self):
+        maintain()
+        while not self._stop.wait(JOB_MAINTENANCE_INTERVAL):
+            for i, (lane, index, process) in enumerate(self._processes):
+                if not process.is_alive() and not self._stop.is_set():
+                    print(f"⚠️ Job worker {process.name} exited with code {process.exitcode}; restarting")
+                    self._processes[i] = self._spawn(lane, index)
+            maintain()
+
+    def stop(self, timeout: float = 10):
+        """Lets workers finish their current job for up to `timeout` seconds, then kills them."""
+        self._stop.set()
+        deadline = time.monotonic() + timeout
+        for _, _, process in self._processes:
+            process.join(max(0, deadline - time.monotonic()))
+        killed = [process for _, _, process in self._processes if process.is_alive()]
+        for process in killed:
+            process.terminate()
+            process.join()
+        if killed:
+            # Hand their jobs to the next worker right away instead of waiting for the lease
+            requeued = database.release_jobs(self._worker_ids)
+            print(f"♻️ Stopped {len(killed)} busy job workers; requeued {requeued} jobs")
+
+
+if __name__ == "__main__":
+    database.init_db()
+    pool = WorkerPool(parse_limits(sys.argv[1]) if len(sys.argv) > 1 else JOB_LANE_WORKERS)
+    pool.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pool.stop()
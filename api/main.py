@@ -1,15 +1,15 @@
+import asyncio
 import hmac
 import hashlib
-from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Request, BackgroundTasks, Header, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Request, Header, Form, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel, Field
 import uvicorn
 import zipfile
-import tempfile
 import os
 import shutil
-import re
+import time
 import jwt
 import httpx
 import stripe
@@ -22,17 +22,19 @@ from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from typing import Optional, List, Dict, Any, Union
 
-from scanner import run_semgrep, run_semgrep_on_dir, extract_findings_summary, run_npm_audit, extract_npm_audit_summary, run_gitleaks, extract_gitleaks_summary
-from ai_translator import translate_findings, translate_repo_findings
 import database
+import async_database
 import github_app
-from indexer import CodeIndexer
-
-# Initialize CodeIndexer
-code_indexer = CodeIndexer()
+import badges
+import jobs
+import pipeline
+from pipeline import detect_language
+from ttl_cache import TTLCache
 
 # --- Security Config ---
 VOUCH_API_KEY = os.environ.get("VOUCH_API_KEY")
+# Without VOUCH_API_KEY the API is open unless dev mode is explicitly turned off
+API_KEY_DEV_MODE = os.environ.get("VOUCH_DEV_MODE", "true").lower() == "true"
 STRIPE_API_KEY = os.environ.get("STRIPE_API_KEY")
 STRIPE_WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET")
 # Frontend URL for redirects and CORS (set to your Vercel/production domain in prod)
@@ -46,57 +48,15 @@ STRIPE_PRICE_PRO = "price_1TA8YRCYfut0t43YB5M2gsil"
 STRIPE_PRICE_CREDITS = "price_1TA8YQCYfut0t43YDjnAFnu4"
 
 MAX_UPLOAD_SIZE_MB = 50
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # bytes buffered at a time while copying an upload
 MAX_UNCOMPRESSED_SIZE_MB = 200
 MAX_ZIP_FILE_COUNT = 500
 MAX_CODE_SNIPPET_BYTES = 500_000  # 500KB
-
-# Files that should NEVER be sent to the LLM
-SENSITIVE_FILE_PATTERNS = {
-    ".env", ".env.local", ".env.production", ".env.development",
-    "id_rsa", "id_ed25519", "id_dsa",
-    ".pem", ".key", ".p12", ".pfx",
-    "credentials.json", "service-account.json",
-    ".npmrc", ".pypirc", ".netrc",
-}
-
-# Patterns to redact from file contents before LLM analysis
-SENSITIVE_LINE_PATTERNS = re.compile(
-    r'(password|passwd|secret|api_key|apikey|auth_token|access_token|private_key|'
-    r'db_password|database_url|connection_string|credentials|'
-    r'sh_key|sk_live|sk_test|pk_live|pk_test)\s*[:=]\s*["\']?([^"\']+)["\']?',
-    re.IGNORECASE
-)
-
-def detect_language(directory: Optional[str] = None, code: Optional[str] = None) -> str:
-    """Detects the primary language of a directory or code snippet."""
-    if code:
-        if "import React" in code or "export default" in code or "className=" in code:
-            return "javascript"
-        if "package main" in code or "func " in code:
-            return "go"
-        if "def " in code or "import " in code:
-            return "python"
-    
-    if directory:
-        ext_counts = {}
-        for root, _, files in os.walk(directory):
-            for file in files:
-                ext = os.path.splitext(file)[1].lower()
-                if ext in ['.py', '.js', '.jsx', '.ts', '.tsx', '.go', '.java', '.c', '.cpp']:
-                    ext_counts[ext] = ext_counts.get(ext, 0) + 1
-        
-        if not ext_counts:
-            return "python"
-            
-        # top_ext = max(ext_counts, key=ext_counts.get)
-        top_ext = max(ext_counts.items(), key=lambda x: x[1])[0]
-        if top_ext in ['.js', '.jsx', '.ts', '.tsx']:
-            return "javascript"
-        if top_ext == '.go':
-            return "go"
-        return "python"
-        
-    return "python"
+MAX_IGNORE_BATCH = 1000  # findings per bulk ignore request
+MAX_SCAN_PAGE_SIZE = 100  # scans or issues per history page
+MAX_ANALYTICS_DAYS = 365
+MAX_JOB_POLL_WAIT = 60  # seconds a /jobs/{job_id} long-poll may hold the request
+SCAN_ARCHIVE_INTERVAL_HOURS = float(os.environ.get("SCAN_ARCHIVE_INTERVAL_HOURS") or 6)
 
 # --- Rate Limiter ---
 limiter = Limiter(key_func=get_remote_address)
@@ -133,23 +93,22 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 
 # --- Auth Dependency ---
-def verify_api_key(request: Request) -> dict:
+async def verify_api_key(request: Request) -> dict:
     """
     Verify API key from X-API-Key header.
-    Looks up the user in the SQLite database.
+    Looks up the user in the database (cached briefly, including unknown keys).
     If VOUCH_API_KEY is not set (local dev mode testing), authentication is skipped (returns dummy user).
     """
     api_key = request.headers.get("X-API-Key")
-    expected_local_key = os.environ.get("VOUCH_API_KEY")
 
-    if not expected_local_key:
+    if not VOUCH_API_KEY:
         # Default to True for local development if key is missing
-        is_dev_mode = os.environ.get("VOUCH_DEV_MODE", "true").lower() == "true"
-        if not is_dev_mode:
+        if not API_KEY_DEV_MODE:
             print("❌ ERROR: VOUCH_API_KEY not set and VOUCH_DEV_MODE is false. Blocking request.")
             raise HTTPException(status_code=500, detail="Server Configuration Error: API Authentication is disabled.")
         
@@ -160,11 +119,13 @@ def verify_api_key(request: Request) -> dict:
         raise HTTPException(status_code=401, detail="X-API-Key header missing")
     
     # Check if it's the admin/local key
-    if api_key == expected_local_key:
-        return {"id": None, "plan": "pro", "api_key": expected_local_key}
+    if hmac.compare_digest(api_key.encode(), VOUCH_API_KEY.encode()):
+        return {"id": None, "plan": "pro", "api_key": VOUCH_API_KEY}
 
-    # Check database for user API key
-    user = database.get_user_by_api_key(api_key)
+    # Check the auth cache, then the database, for a user API key
+    user = database.peek_user_by_api_key(api_key)
+    if user is None:
+        user = await async_database.get_user_by_api_key(api_key)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid API Key")
         
@@ -202,16 +163,28 @@ def _build_es256_public_key():
 
 SUPABASE_ES256_KEY = _build_es256_public_key()
 
+# Token digest -> (verified user ID, token exp), each entry expiring with its token
+_verified_tokens = TTLCache(maxsize=4096, ttl=3600)
+
 def verify_supabase_token(token: str) -> str:
     """
     Verifies a Supabase JWT using the JWT Secret (HS256) or JWKS EC key (ES256).
     Returns the user ID (sub claim) on success.
+    Verified tokens are cached by digest with their `exp`, so dashboard polling skips
+    signature verification; `exp` is checked against the wall clock on every hit.
     """
+    token_digest = hashlib.sha256(token.encode()).hexdigest()
+    cached = _verified_tokens.get(token_digest)
+    if cached is not None:
+        cached_uid, expires_at = cached
+        if time.time() < expires_at:
+            return cached_uid
+        _verified_tokens.invalidate(token_digest)
+
     # Determine the algorithm from the token header
     try:
         unverified_header = jwt.get_unverified_header(token)
         alg = unverified_header.get("alg", "HS256")
-        print(f"🔍 Received Token Header: {unverified_header}")
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Cannot parse token header: {e}")
 
@@ -242,6 +215,10 @@ def verify_supabase_token(token: str) -> str:
         user_id = payload.get("sub")
         if not user_id:
             raise HTTPException(status_code=401, detail="Token missing 'sub' claim.")
+        expires_at = payload.get("exp", 0)
+        expires_in = expires_at - time.time()
+        if expires_in > 0:
+            _verified_tokens.set(token_digest, (user_id, expires_at), ttl=expires_in)
         return user_id
 
     except jwt.ExpiredSignatureError:
@@ -255,20 +232,6 @@ def verify_supabase_token(token: str) -> str:
 
 # --- Helpers ---
 
-def _is_sensitive_file(filename: str) -> bool:
-    """Check if a filename matches known sensitive file patterns."""
-    lower = filename.lower()
-    for pattern in SENSITIVE_FILE_PATTERNS:
-        if lower.endswith(pattern) or lower == pattern:
-            return True
-    return False
-
-
-def _redact_sensitive_lines(content: str) -> str:
-    """Redact lines containing passwords, keys, or secrets."""
-    return SENSITIVE_LINE_PATTERNS.sub("[REDACTED BY VOUCH]", content)
-
-
 def _validate_zip_safety(zip_ref: zipfile.ZipFile, extract_dir: str):
     """
     Validate a ZIP file for Zip Slip and Zip Bomb attacks.
@@ -320,7 +283,7 @@ async def generate_user_api_key(request: Request):
     if not supabase_uid:
         raise HTTPException(status_code=401, detail="Invalid Supabase Token")
         
-    api_key = database.generate_api_key(supabase_uid)
+    api_key = await async_database.generate_api_key(supabase_uid)
     return {"api_key": api_key}
 
 
@@ -345,7 +308,7 @@ async def link_github_installation(request: Request, req: GithubLinkRequest):
     if not supabase_uid:
         raise HTTPException(status_code=401, detail="Invalid Supabase Token")
         
-    success = database.link_github_installation(
+    success = await async_database.link_github_installation(
         supabase_uid=supabase_uid,
         installation_id=req.installation_id
     )
@@ -373,7 +336,7 @@ async def create_checkout_session(request: Request, body: CheckoutRequest):
     if not supabase_uid:
         raise HTTPException(status_code=401, detail="Invalid Supabase Token")
 
-    user = database.get_or_create_user(supabase_uid)
+    user = database.peek_user(supabase_uid) or await async_database.get_or_create_user(supabase_uid)
     
     # Map tier to Price ID
     tier_map = {
@@ -448,7 +411,7 @@ async def stripe_webhook(request: Request):
             amount_total = session.get("amount_total", 0)
             
             if amount_total == 1000: # Credits Payment ($10)
-                database.add_credits(user_id, 100, customer_id)
+                await async_database.add_credits(user_id, 100, customer_id)
                 print(f"Stripe Webhook: Added 100 credits to user {user_id}.")
             else:
                 # Subscription logic
@@ -458,7 +421,7 @@ async def stripe_webhook(request: Request):
                 elif amount_total >= 700: # micro
                     new_tier = "micro"
                 
-                database.update_subscription(user_id, new_tier, customer_id, subscription_id)
+                await async_database.update_subscription(user_id, new_tier, customer_id, subscription_id)
                 print(f"Stripe Webhook: Successfully upgraded user {user_id} to {new_tier}.")
 
     return {"status": "success"}
@@ -479,7 +442,7 @@ async def get_developer_profile(request: Request):
     if not supabase_uid:
         raise HTTPException(status_code=401, detail="Invalid Supabase Token")
         
-    user = database.get_or_create_user(supabase_uid)
+    user = database.peek_user(supabase_uid) or await async_database.get_or_create_user(supabase_uid)
     if not user.get("api_key"):
         raise HTTPException(status_code=404, detail="No API Key generated yet")
         
@@ -514,23 +477,39 @@ async def ignore_finding_endpoint(req: IgnoreFindingRequest, request: Request):
     if not supabase_uid:
         raise HTTPException(status_code=401, detail="Invalid Supabase Token")
         
-    success = database.ignore_finding(supabase_uid, req.repo_name, req.file_path, req.snippet_hash)
+    success = await async_database.ignore_finding(supabase_uid, req.repo_name, req.file_path, req.snippet_hash)
     if not success:
         raise HTTPException(status_code=500, detail="Failed to ignore finding")
     return {"status": "success", "ignored": True}
 
 
-def filter_ignored_findings(findings: list, supabase_uid: str, repo_name: str) -> list:
-    """Removes findings that the user has previously ignored for this repository."""
-    filtered = []
-    for f in findings:
-        h = f.get("snippet_hash")
-        # Optimization: only check DB if hash is present
-        if h and database.is_finding_ignored(supabase_uid, repo_name, f.get("file", "unknown_file"), h):
-            print(f"🔇 Muting ignored finding: {f.get('rule_id')} in {f.get('file')}")
-            continue
-        filtered.append(f)
-    return filtered
+class IgnoredFinding(BaseModel):
+    file_path: str
+    snippet_hash: str
+
+
+class IgnoreFindingsRequest(BaseModel):
+    repo_name: str
+    findings: List[IgnoredFinding] = Field(..., max_length=MAX_IGNORE_BATCH)
+
+
+@app.post("/developer/ignore-findings")
+async def ignore_findings_endpoint(req: IgnoreFindingsRequest, request: Request):
+    """Ignores many findings of one repository at once."""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Missing Bearer Token")
+
+    token = auth_header.split(" ")[1]
+    supabase_uid = verify_supabase_token(token)
+    if not supabase_uid:
+        raise HTTPException(status_code=401, detail="Invalid Supabase Token")
+
+    pairs = [(f.file_path, f.snippet_hash) for f in req.findings]
+    success = await async_database.ignore_findings(supabase_uid, req.repo_name, pairs)
+    if not success:
+        raise HTTPException(status_code=500, detail="Failed to ignore findings")
+    return {"status": "success", "ignored": len(pairs)}
 
 
 @app.get("/")
@@ -548,239 +527,316 @@ def startup_event():
         print("⚠️  API Key authentication is DISABLED (VOUCH_API_KEY not set).")
 
 
-@app.post("/scan")
-@limiter.limit("10/minute")
-async def scan_code(scan_req: ScanRequest, request: Request, user: dict = Depends(verify_api_key)):
-    """
-    Accepts a code snippet, runs Semgrep statically, and translates
-    the findings into actionable advice via the Gemini AI API.
-    """
-    if not scan_req.code.strip():
-        raise HTTPException(status_code=400, detail="Code snippet cannot be empty.")
+async def _archive_scans_periodically():
+    """Moves old scan issues to cold storage every SCAN_ARCHIVE_INTERVAL_HOURS."""
+    while True:
+        await asyncio.sleep(SCAN_ARCHIVE_INTERVAL_HOURS * 3600)
+        await async_database.archive_old_scans()
 
-    # 0. Detect language if not explicitly provided or if it's the default
-    if not scan_req.language or scan_req.language == "python":
-        scan_req.language = detect_language(code=scan_req.code)
 
-    # 1. Run local Semgrep rules
-    semgrep_output = run_semgrep(scan_req.code, scan_req.language)
+@app.on_event("startup")
+async def start_scan_archiver():
+    if database.SCAN_ARCHIVE_AFTER_DAYS > 0:
+        asyncio.create_task(_archive_scans_periodically())
 
-    # 2. Extract the summary for the LLM
-    findings_summary = extract_findings_summary(semgrep_output)
 
-    # Filter out muted findings
-    if user and user.get("id"):
-        findings_summary = filter_ignored_findings(findings_summary, user["id"], "unknown_repo")
+_job_pool = None
+# Snippet scans running in this process (SNIPPET_INLINE); referenced so they are not garbage collected
+_inline_jobs = set()
 
-    # 3. Use LLM to translate findings into human-readable patches
-    # We ALWAYS call LLM now to do a "Vouch Deep Check" even if Semgrep found nothing
-    translated_report = translate_findings(
-        code_snippet=scan_req.code,
-        language=scan_req.language,
-        findings=findings_summary
-    )
 
-    # 4. Save to database
-    scan_id = database.save_scan("snippet", scan_req.language, translated_report, user_id=user.get("id"))
-    if user.get("id"):
-        database.increment_scan_count(user.get("id"))
-    translated_report["scan_id"] = scan_id
+@app.on_event("startup")
+def start_job_workers():
+    """Starts the VOUCH_JOB_LANES scan worker processes (none if workers run separately)."""
+    global _job_pool
+    if any(count > 0 for count in jobs.JOB_LANE_WORKERS.values()):
+        _job_pool = jobs.WorkerPool(jobs.JOB_LANE_WORKERS)
+        _job_pool.start()
 
-    return translated_report
 
+@app.on_event("shutdown")
+def shutdown_event():
+    """Stop job workers, finish in-flight queries and close pooled database connections."""
+    if _job_pool:
+        _job_pool.stop()
+    async_database.shutdown()
+    database.close_pool()
 
-def get_repo_context(directory: str, max_files: int = 50) -> str:
-    """Read up to `max_files` text files from the directory, filtering sensitive data."""
-    context = []
-    files_read: int = 0
 
-    for root, _, files in os.walk(directory):
-        for file in files:
-            if files_read >= max_files:
-                break
+@app.get("/health/db")
+async def database_health():
+    """Reports database connection pool metrics."""
+    return await async_database.get_pool_stats()
 
-            # Skip hidden files or common non-source directories/files
-            if file.startswith('.') or file.endswith(('.pyc', '.png', '.jpg', '.zip', '.sqlite3')):
-                continue
 
-            # --- Fix 2: Skip sensitive files ---
-            if _is_sensitive_file(file):
-                print(f"🚫 Skipping sensitive file: {file}")
-                continue
+@app.post("/scan")
+@limiter.limit("10/minute")
+async def scan_code(scan_req: ScanRequest, request: Request, wait: bool = Query(True), user: dict = Depends(verify_api_key)):
+    """
+    Accepts a code snippet and queues it in the fast snippet lane, where a job worker (or this
+    process, with VOUCH_SNIPPET_INLINE) runs Semgrep statically and translates the findings
+    into actionable advice via the Gemini AI API.
+    Returns the report (or, with ?wait=false, 202 and a job id to poll at /jobs/{job_id}).
+    """
+    if not scan_req.code.strip():
+        raise HTTPException(status_code=400, detail="Code snippet cannot be empty.")
+
+    # 0. Detect language if not explicitly provided or if it's the default
+    if not scan_req.language or scan_req.language == "python":
+        scan_req.language = detect_language(code=scan_req.code)
 
-            file_path = os.path.join(root, file)
-            rel_path = os.path.relpath(file_path, directory)
+    # Retries and double submits of the same snippet share one scan
+    job_id, created = await jobs.submit("snippet_scan", {
+        "code": scan_req.code,
+        "language": scan_req.language,
+        "installation_id": user.get("github_installation_id"),
+    }, user_id=user.get("id"), tier=jobs.tier_of(user),
+        dedup_parts=(scan_req.language, user.get("github_installation_id"), scan_req.code))
+    if created and jobs.SNIPPET_INLINE:
+        # No snippet workers: run it here (it keeps running if the client stops waiting)
+        task = asyncio.create_task(jobs.run_inline(job_id))
+        _inline_jobs.add(task)
+        task.add_done_callback(_inline_jobs.discard)
+    return await _job_outcome(job_id, wait, "Scan failed")
+
+
+async def _job_outcome(job_id: str, wait: bool, failure_detail: str):
+    """Waits for a submitted job and returns its result, or 202 with the job id to poll."""
+    status = "queued"
+    if wait:
+        job = await jobs.wait_for_job(job_id, jobs.JOB_WAIT_TIMEOUT)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found.")
+        if job["status"] == "done":
+            return job["result"]
+        if job["status"] == "failed":
+            raise HTTPException(status_code=500, detail=f"{failure_detail}: {job['error']}")
+        status = job["status"]
 
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read(50000)
-                    # --- Fix 2: Redact sensitive lines ---
-                    content = _redact_sensitive_lines(content)
-                    context.append(f"--- {rel_path} ---\n{content}\n")
-                    files_read = files_read + 1
-            except Exception:
-                pass
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job_id, "status": status},
+        headers={"Location": f"/jobs/{job_id}"}
+    )
 
-        if files_read >= max_files:
-            break
 
-    return "\n".join(context)
+def _spool_upload(source, zip_path: str, extract_dir: str) -> str:
+    """
+    Copies an uploaded ZIP to `zip_path` in UPLOAD_CHUNK_SIZE chunks, aborting as soon as it
+    exceeds MAX_UPLOAD_SIZE_MB, then validates it. Returns the archive's SHA-256 hex digest.
+    """
+    max_bytes = MAX_UPLOAD_SIZE_MB * 1024 * 1024
+    digest = hashlib.sha256()
+    size = 0
+    with open(zip_path, 'wb') as f:
+        while chunk := source.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            # --- Fix 3: Check upload size ---
+            if size > max_bytes:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Upload too large. Max size is {MAX_UPLOAD_SIZE_MB}MB."
+                )
+            digest.update(chunk)
+            f.write(chunk)
+
+    # --- Fix 3: Validate ZIP safety before queueing (the worker extracts it) ---
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        _validate_zip_safety(zip_ref, extract_dir)
+    return digest.hexdigest()
 
 
 @app.post("/scan-repo")
 @limiter.limit("5/minute")
-async def scan_repo(request: Request, file: UploadFile = File(...), language: str = Form("python"), user: dict = Depends(verify_api_key)):
+async def scan_repo(
+    request: Request,
+    file: UploadFile = File(...),
+    language: str = Form("python"),
+    wait: bool = Query(True),
+    user: dict = Depends(verify_api_key)
+):
     """
-    Accepts a ZIP file containing a repository, extracts it, runs Semgrep over the directory,
-    and then uses a 2-stage LLM pipeline to do a deep analysis and formatted return.
+    Accepts a ZIP file containing a repository and queues a scan job: a job worker extracts it,
+    runs Semgrep over the directory, and then uses a 2-stage LLM pipeline to do a deep analysis.
+    Returns the report when the job finishes. With ?wait=false (or when the scan outlasts
+    VOUCH_JOB_WAIT_TIMEOUT) answers 202 with a job id to poll at /jobs/{job_id}.
     """
     if not file.filename or not file.filename.endswith('.zip'):
         raise HTTPException(status_code=400, detail="Only .zip files are supported for repo scanning.")
 
-    # --- Fix 3: Check upload size ---
-    contents = await file.read()
-    if len(contents) > MAX_UPLOAD_SIZE_MB * 1024 * 1024:
+    # --- Fix 3: Reject oversized uploads before copying them ---
+    if file.size is not None and file.size > MAX_UPLOAD_SIZE_MB * 1024 * 1024:
         raise HTTPException(
             status_code=400,
             detail=f"Upload too large. Max size is {MAX_UPLOAD_SIZE_MB}MB."
         )
 
-    temp_dir = tempfile.mkdtemp()
-    zip_path = os.path.join(temp_dir, "repo.zip")
-    extract_dir = os.path.join(temp_dir, "extracted")
+    # The worker removes the spool directory once the scan is done
+    spool_dir = jobs.new_spool_dir()
+    zip_path = os.path.join(spool_dir, "repo.zip")
 
     try:
-        # Save uploaded zip file
-        with open(zip_path, 'wb') as f:
-            if isinstance(contents, bytes):
-                f.write(contents)
-            else:
-                f.write(str(contents).encode("utf-8"))
-
-        # --- Fix 3: Validate ZIP safety before extracting ---
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            _validate_zip_safety(zip_ref, extract_dir)
-            zip_ref.extractall(extract_dir)
-
-        # 0. Detect language from the extracted files
-        if not language or language == "python":
-            language = detect_language(directory=extract_dir)
-        print(f"📊 Detected Repository Language: {language}")
-
-        # 1. Run local Semgrep rules on the directory
-        semgrep_output = run_semgrep_on_dir(extract_dir)
-
-        # 2. Extract the summary for the LLM
-        findings_summary = extract_findings_summary(semgrep_output)
-
-        # 2b. Run Dependency Scanning (SCA) via npm audit
-        npm_audit_output = run_npm_audit(extract_dir)
-        npm_findings = extract_npm_audit_summary(npm_audit_output)
-        findings_summary.extend(npm_findings)
-
-        # 2c. Run Gitleaks for Professional Secret Scanning
-        gitleaks_output = run_gitleaks(extract_dir)
-        gitleaks_findings = extract_gitleaks_summary(gitleaks_output)
-        findings_summary.extend(gitleaks_findings)
-
-        # Filter out ignored findings if user is linked
-        if user and user.get("id"):
-            findings_summary = filter_ignored_findings(findings_summary, user["id"], "unknown_repo")
-
-        # 3. Get the repository context (sensitive files are filtered)
-        repo_context = get_repo_context(extract_dir)
-
-        # 3b. Index the repository
-        print(f"📁 Indexing repository in-place: {extract_dir}")
-        code_indexer.index_repository(extract_dir)
-
-        # 4. Use 2-Stage LLM to deeply analyze and translate findings
-        translated_report = translate_repo_findings(
-            code_context=repo_context,
-            language=language,
-            findings=findings_summary,
-            code_indexer=code_indexer
-        )
+        # Copy (size-checked, hashed) and validate off the event loop
+        archive_hash = await asyncio.to_thread(_spool_upload, file.file, zip_path, os.path.join(spool_dir, "extracted"))
+
+        # CI retries and double uploads of the same archive share one scan
+        job_id, created = await jobs.submit("repo_scan", {
+            "zip_path": zip_path,
+            "archive_name": file.filename,
+            "language": language,
+            "installation_id": user.get("github_installation_id"),
+        }, user_id=user.get("id"), tier=jobs.tier_of(user),
+            dedup_parts=(archive_hash, file.filename, language, user.get("github_installation_id")))
+    except BaseException:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+        raise
+    if not created:
+        # The in-flight job scans its own copy of the archive
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+    return await _job_outcome(job_id, wait, "Repository scan failed")
+
+
+# --- Jobs ---
+
+def _job_response(job: dict) -> dict:
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "lane": job["lane"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "result": job["result"],
+        "error": job["error"],
+    }
 
-        # 5. Save to database
-        scan_id = database.save_scan("repo", language, translated_report, user_id=user.get("id"))
-        if user.get("id"):
-            database.increment_scan_count(user.get("id"))
-            
-        translated_report["scan_id"] = scan_id
 
-        return translated_report
+@app.get("/jobs/{job_id}")
+async def get_job_status(
+    job_id: str,
+    wait: float = Query(0, ge=0, le=MAX_JOB_POLL_WAIT),
+    user: dict = Depends(verify_api_key)
+):
+    """
+    Return a job's status, and its result once it is done.
+    `wait` long-polls: the response is held up to that many seconds until the job finishes.
+    """
+    job = await async_database.get_job(job_id)
+    # Jobs are private to the user who submitted them (the admin key sees every job)
+    if not job or (user.get("id") and job["user_id"] != user["id"]):
+        raise HTTPException(status_code=404, detail="Job not found.")
+    if wait and job["status"] not in database.JOB_FINISHED_STATUSES:
+        job = await jobs.wait_for_job(job_id, wait)
+        # Finished jobs are pruned after VOUCH_JOB_RETENTION_DAYS
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found.")
+    return _job_response(job)
+
 
-    finally:
-        shutil.rmtree(temp_dir, ignore_errors=True)
+@app.get("/health/jobs")
+async def job_queue_health():
+    """Reports job counts per lane and status and the age of the oldest queued job."""
+    return await async_database.get_job_stats()
 
 
 # --- Viral Loop Badges ---
 
 @app.get("/badge/{installation_id}")
-async def get_security_badge(installation_id: str):
+async def get_security_badge(installation_id: str, request: Request, repo: str = ""):
     """
-    Returns a dynamic SVG badge representing the latest security score for this installation.
+    Returns a dynamic SVG badge representing the latest security score for this installation
+    (or for one of its repositories with ?repo=owner/name).
+    Served from memory; the database is only read when the score is not cached.
     """
-    score = database.get_latest_score_by_installation(installation_id)
-    
-    # Determine color (Tailwind palette)
-    if score >= 90:
-        color = "#4ade80" # Green
-    elif score >= 70:
-        color = "#facc15" # Yellow
-    else:
-        color = "#f87171" # Red
-        
-    svg = f'''<svg xmlns="http://www.w3.org/2000/svg" width="130" height="20">
-  <linearGradient id="b" x2="0" y2="100%">
-    <stop offset="0" stop-color="#bbb" stop-opacity=".1"/>
-    <stop offset="1" stop-opacity=".1"/>
-  </linearGradient>
-  <mask id="a">
-    <rect width="130" height="20" rx="3" fill="#fff"/>
-  </mask>
-  <g mask="url(#a)">
-    <path fill="#555" d="M0 0h75v20H0z"/>
-    <path fill="{color}" d="M75 0h55v20H75z"/>
-    <path fill="url(#b)" d="M0 0h130v20H0z"/>
-  </g>
-  <g fill="#fff" text-anchor="middle" font-family="DejaVu Sans,Verdana,Geneva,sans-serif" font-size="11">
-    <text x="37.5" y="15" fill="#010101" fill-opacity=".3">Vouch</text>
-    <text x="37.5" y="14">Vouch</text>
-    <text x="101.5" y="15" fill="#010101" fill-opacity=".3">Score {score}</text>
-    <text x="101.5" y="14">Score {score}</text>
-  </g>
-</svg>'''
-    
-    # Cache for 1 hour so GitHub doesn't hammer our API when viewers look at READMEs
-    headers = {
-        "Cache-Control": "public, max-age=3600"
-    }
+    score = database.peek_latest_score(installation_id, repo)
+    if score is None:
+        score = await async_database.get_latest_score_by_installation(installation_id, repo)
+
+    svg, etag = badges.get_badge(score)
+    headers = {"Cache-Control": badges.BADGE_CACHE_CONTROL, "ETag": etag}
+    if badges.etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status_code=304, headers=headers)
     return Response(content=svg, media_type="image/svg+xml", headers=headers)
 
 
 # --- Scan History Endpoints ---
 
+def _split_fields(value: Optional[str]) -> Optional[list]:
+    """Parses a comma-separated `fields` query parameter."""
+    if not value:
+        return None
+    return [f.strip() for f in value.split(",") if f.strip()]
+
+
 @app.get("/scans")
-async def list_scans(limit: int = 20, user: dict = Depends(verify_api_key)):
-    """Return a list of recent scans for the history sidebar."""
-    return database.get_all_scans(limit=limit, user_id=user.get("id"))
+async def list_scans(
+    response: Response,
+    limit: int = Query(20, ge=1, le=MAX_SCAN_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    user: dict = Depends(verify_api_key)
+):
+    """
+    Return a page of recent scans for the history sidebar.
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    """
+    try:
+        scans, next_cursor = await async_database.get_all_scans(
+            limit=limit, user_id=user.get("id"), cursor=cursor, fields=_split_fields(fields)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return scans
 
 
 @app.get("/scans/{scan_id}")
-async def get_scan(scan_id: str):
-    """Return full details of a past scan, including all issues."""
-    scan = database.get_scan_by_id(scan_id)
+async def get_scan(
+    scan_id: str,
+    fields: Optional[str] = None,
+    issue_fields: Optional[str] = None,
+    issue_limit: Optional[int] = Query(None, ge=1, le=MAX_SCAN_PAGE_SIZE),
+    issue_cursor: Optional[str] = None
+):
+    """
+    Return details of a past scan, including its issues.
+    `fields`/`issue_fields` select columns; `issue_limit`/`issue_cursor` page through issues.
+    """
+    try:
+        scan = await async_database.get_scan_by_id(
+            scan_id,
+            fields=_split_fields(fields),
+            issue_fields=_split_fields(issue_fields),
+            issue_limit=issue_limit,
+            issue_cursor=issue_cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not scan:
         raise HTTPException(status_code=404, detail="Scan not found.")
     return scan
 
 
+@app.get("/analytics/scans")
+async def scan_analytics(
+    days: int = Query(30, ge=1, le=MAX_ANALYTICS_DAYS),
+    repo: Optional[str] = None,
+    user: dict = Depends(verify_api_key)
+):
+    """Return per-day scan counts, scores and issue counts for trend charts."""
+    if not user.get("id"):
+        return []
+    return await async_database.get_scan_analytics(user["id"], days=days, repo=repo)
+
+
 @app.delete("/scans/{scan_id}")
 async def remove_scan(scan_id: str, _auth=Depends(verify_api_key)):
     """Delete a scan from history."""
-    deleted = database.delete_scan(scan_id)
+    deleted = await async_database.delete_scan(scan_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Scan not found.")
     return {"status": "deleted", "scan_id": scan_id}
@@ -805,7 +861,7 @@ async def github_callback(
         return RedirectResponse(url=f"{FRONTEND_URL}/developer?installation=error")
 
     # Link the installation ID to the Vouch User — the 'state' parameter is the Supabase UID
-    linked = database.link_github_installation(supabase_uid=state, installation_id=installation_id)
+    linked = await async_database.link_github_installation(supabase_uid=state, installation_id=installation_id)
     
     # Redirect back to the developer dashboard
     if linked:
@@ -813,168 +869,15 @@ async def github_callback(
     else:
         return RedirectResponse(url=f"{FRONTEND_URL}/developer?installation=error")
 
-async def process_github_webhook(payload: dict, event_name: str):
-    """Background task to handle analyzing the PR and posting the comment."""
-    if event_name != "pull_request" or payload.get("action") not in ["opened", "synchronize", "reopened"]:
-        return # Currently only handle PRs
-
-    pull_request = payload.get("pull_request")
-    installation = payload.get("installation")
-    repository = payload.get("repository")
-
-    if not pull_request or not installation or not repository:
-        return
-
-    installation_id = installation["id"]
-    owner = repository["owner"]["login"]
-    repo_name = repository["name"]
-    pr_number = pull_request["number"]
-    head_sha = pull_request["head"]["sha"]
-
-    # Generate Installation Token
-    token = await github_app.get_installation_access_token(installation_id)
-    if not token:
-        print("❌ Could not get installation token")
-        return
-
-    # Post initial 'pending' status
-    await github_app.post_status_check(
-        token, owner, repo_name, head_sha,
-        state="pending",
-        description="Vouch scanning PR for security issues..."
-    )
-
-    # Check database to see if this installation is linked to a Vouch User
-    user = database.get_user_by_installation_id(str(installation_id))
-    if not user:
-        print(f"⚠️ Webhook received for unlinked installation {installation_id}. Skipping scan.")
-        return
-
-    # Fetch explicitly changed files (Diff-based fetching)
-    diff_files = await github_app.fetch_pr_diff_files(token, owner, repo_name, pr_number)
-    
-    if not diff_files:
-        print("⚠️ Vouch: Keine Diff-Dateien gefunden (leerer PR oder API-Fehler). Beende Scan.")
-        await github_app.post_status_check(
-            token, owner, repo_name, head_sha,
-            state="success",
-            description="Vouch: No scannable files changed."
-        )
-        return
-
-    context_files = []
-    
-    for df in diff_files:
-        if df.get("status") in ("removed", "deleted"):
-            continue
-        
-        filename = df.get("filename", "")
-        
-        # We process all files including sensitive ones (like .env) to allow AI secret detection.
-        # This is the intended behavior for Vouch PR analysis.
-        print(f"📦 Vouch: Fetching file for analysis: {filename}")
-            
-        # Use contents_url with raw accept header for reliable fetching
-        contents_url = df.get("contents_url")
-        if not contents_url:
-            contents_url = df.get("raw_url")
-
-        content = await github_app.fetch_file_content(token, contents_url)
-        if content:
-            # We skip content redaction for PR scans to allow the AI to detect hardcoded secrets.
-            context_files.append(f"--- {filename} ---\n{content}\n")
-
-    if not context_files:
-        print("ℹ️ Vouch: No processable files found in PR context.")
-        await github_app.post_status_check(
-            token, owner, repo_name, head_sha,
-            state="success",
-            description="Vouch: No scannable code changes found in this PR."
-        )
-        return
-
-    findings_summary = [] # Initialize findings list; AI will also perform direct review of context
-    code_context = "\n".join(context_files)
-    
-    if user and user.get("id"):
-        findings_summary = filter_ignored_findings(findings_summary, user["id"], repo_name)
-    
-    # --- Indexing Step ---
-    # We index the repository asynchronously to keep the PR feedback fast.
-    # For now, we simulate a local repo path for the indexer.
-    # In a real environment, this would be a persistent volume attached to the installation.
-    with tempfile.TemporaryDirectory() as repo_dir:
-        # Download all files in the repo for indexing (or just the diff)
-        # For the MVP indexer, we need a directory structure.
-        # This is a placeholder for a more advanced VFS or shared persistent disk.
-        print(f"📁 Indexing repository: {repo_name}")
-        for df in diff_files:
-            if df.get("status") not in ("removed", "deleted"):
-                filename = df.get("filename", "")
-                # --- Path Traversal Protection ---
-                # We use os.path.basename to force the file to stay within the repo_dir
-                safe_filename = os.path.basename(filename)
-                
-                content = await github_app.fetch_file_content(token, df.get("raw_url"))
-                if content:
-                    file_path = os.path.join(repo_dir, safe_filename)
-                    # Note: Using basename loses folder structure but ensures safety for now.
-                    # A better fix would be validating the relative path starts with '' and has no '..'
-                    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                    with open(file_path, "w") as f:
-                        f.write(content)
-        
-        # Incremental Indexing
-        code_indexer.index_repository(repo_dir)
-
-    # Send to AI
-    translated_report = translate_repo_findings(
-        code_context=code_context,
-        language="javascript", # Fallback language, could auto-detect
-        findings=findings_summary, # Mocked until local diff VFS is implemented
-        code_indexer=code_indexer
-    )
-    
-    # Post PR Comment
-    comment_body = f"## 🛡️ Vouch Security Analysis\n**Score:** {translated_report.get('score', 0)}/100\n\n**Summary:**\n{translated_report.get('summary', '')}"
-    
-    for issue in translated_report.get('issues', []):
-        comment_body += f"\n\n### ⚠️ {issue.get('title')} ({issue.get('severity')})"
-        comment_body += f"\n{issue.get('description')}"
-        if issue.get('fixed_code_snippet'):
-            comment_body += f"\n\n**Fix Strategy:** {issue.get('how_to_fix')}\n```\n{issue.get('fixed_code_snippet')}\n```"
-
-    await github_app.post_pr_comment(token, owner, repo_name, pr_number, comment_body)
-    
-    # Post Final Status Check to block merges if score is low
-    final_score = translated_report.get('score', 0)
-    final_state = "success" if final_score >= 90 else "failure"
-    status_desc = f"Vouch Security Score: {final_score}/100"
-    if final_score < 90:
-        status_desc += " (Issues Found)"
-        
-    await github_app.post_status_check(
-        token, owner, repo_name, head_sha,
-        state=final_state,
-        description=status_desc
-    )
-    
-    
-    # Save to Database using the linked user
-    database.save_scan("github_pr", "javascript", translated_report, user_id=user.get("id"))
-    database.increment_scan_count(user.get("id"))
-
-
 @app.post("/webhook/github")
 async def github_webhook(
     request: Request,
-    background_tasks: BackgroundTasks,
     x_github_event: str = Header(None),
     x_hub_signature_256: str = Header(None)
 ):
     """
     Receives Webhooks from the Vouch GitHub App.
-    Verifies the SHA256 signature and offloads the analysis to a background task.
+    Verifies the SHA256 signature and queues the analysis as a job.
     """
     secret = github_app.GITHUB_WEBHOOK_SECRET
     if not secret:
@@ -994,10 +897,26 @@ async def github_webhook(
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid JSON")
 
-    # Always return 202 Accepted quickly to GitHub to prevent timeouts (10s max)
-    background_tasks.add_task(process_github_webhook, payload, x_github_event)
-    
-    return {"status": "Accepted"}
+    if not pipeline.is_scannable_github_event(payload, x_github_event):
+        return {"status": "Accepted"}
+
+    # Always return 202 Accepted quickly to GitHub to prevent timeouts (10s max);
+    # the analysis runs on a job worker (scheduled under the linked user's tier) and survives restarts
+    user = await async_database.get_user_by_installation_id(str(payload["installation"]["id"])) if payload.get("installation") else None
+    # Redeliveries and repeated events for the same PR head commit share one analysis
+    pull_request = payload.get("pull_request") or {}
+    job_id, _ = await jobs.submit(
+        "github_pr", {"payload": payload, "event_name": x_github_event},
+        user_id=user.get("id") if user else None, tier=jobs.tier_of(user or {}),
+        dedup_parts=(
+            (payload.get("installation") or {}).get("id"),
+            (payload.get("repository") or {}).get("full_name"),
+            pull_request.get("number"),
+            (pull_request.get("head") or {}).get("sha"),
+        )
+    )
+
+    return {"status": "Accepted", "job_id": job_id}
 
 
 if __name__ == "__main__":
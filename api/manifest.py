@@ -0,0 +1,115 @@
+"""
+Vouch Repository Manifest
+One pass over an extracted repository with os.scandir records every file's path, size,
+extension, language, content hash and binary flag, and keeps file contents in a shared
+cache. Pipeline stages (language detection, LLM context, indexing, scanner selection) read
+the manifest instead of walking the tree and re-reading the same files.
+"""
+import hashlib
+import os
+from collections import namedtuple
+
+from symbol_extractor import language_for_path
+
+# File contents kept in memory per manifest; larger repositories read the rest from disk
+MANIFEST_CACHE_BYTES = int(os.environ.get("VOUCH_MANIFEST_CACHE_BYTES") or 64 * 1024 * 1024)
+# A NUL byte in the first block marks a file as binary (the heuristic git uses)
+BINARY_SNIFF_BYTES = 8192
+
+# `path` is relative to the manifest root and uses "/" separators; `language` is the
+# tree-sitter language the indexer parses the file as (None if it is not indexed)
+ManifestEntry = namedtuple("ManifestEntry", "path size extension language sha256 binary")
+
+
+class RepoManifest:
+    """The files of a repository directory and a read-once cache of their contents."""
+
+    def __init__(self, root: str, entries: list, contents: dict):
+        self.root = root
+        self.entries = entries
+        self._by_path = {entry.path: entry for entry in entries}
+        self._contents = contents
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, path: str):
+        return path in self._by_path
+
+    def get(self, path: str):
+        return self._by_path.get(path)
+
+    def paths(self) -> list:
+        return [entry.path for entry in self.entries]
+
+    def text_files(self) -> list:
+        return [entry for entry in self.entries if not entry.binary]
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(entry.size for entry in self.entries)
+
+    def read_bytes(self, path: str) -> bytes:
+        content = self._contents.get(path)
+        if content is None:
+            with open(os.path.join(self.root, *path.split("/")), 'rb') as f:
+                content = f.read()
+        return content
+
+    def read_text(self, path: str, errors: str = "strict") -> str:
+        """Decodes a file as UTF-8 with universal newlines, like open(path, 'r') would."""
+        text = self.read_bytes(path).decode("utf-8", errors)
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return text
+
+    def text_sha256(self, path: str, text: str) -> str:
+        """
+        SHA-256 of `text` (as read by `read_text`) encoded as UTF-8. Reuses the file's hash
+        when decoding left the bytes unchanged (ASCII without carriage returns).
+        """
+        content = self._contents.get(path)
+        if content is not None and content.isascii() and b"\r" not in content:
+            return self._by_path[path].sha256
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _read_file(path: str) -> tuple:
+    """Reads a file once. Returns (content, SHA-256 hex digest, binary flag)."""
+    with open(path, 'rb') as f:
+        content = f.read()
+    return content, hashlib.sha256(content).hexdigest(), b"\0" in content[:BINARY_SNIFF_BYTES]
+
+
+def build_manifest(root: str) -> RepoManifest:
+    """
+    Walks `root` once (top-down, like os.walk) and reads each regular file once.
+    Symbolic links are not followed.
+    """
+    entries = []
+    contents = {}
+    cache_budget = MANIFEST_CACHE_BYTES
+    pending = [""]
+    while pending:
+        rel_dir = pending.pop()
+        subdirs = []
+        with os.scandir(os.path.join(root, rel_dir) if rel_dir else root) as it:
+            for entry in it:
+                rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(rel_path)
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                # Files are read whole: extraction already dropped everything over
+                # MAX_SCAN_FILE_BYTES except dependency lockfiles
+                content, sha256, binary = _read_file(entry.path)
+                size = len(content)
+                if size <= cache_budget and not binary:
+                    contents[rel_path] = content
+                    cache_budget -= size
+                extension = os.path.splitext(entry.name)[1].lower()
+                entries.append(ManifestEntry(rel_path, size, extension, language_for_path(rel_path), sha256, binary))
+        # Visit subdirectories in scandir order
+        pending.extend(reversed(subdirs))
+    return RepoManifest(root, entries, contents)
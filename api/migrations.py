@@ -0,0 +1,431 @@
+"""
+Vouch Schema Migrations
+Versioned, forward-only schema changes for both database backends. Applied versions
+are recorded in `schema_migrations`; `apply_migrations` runs the missing ones at
+startup. Each migration and its version check run in one transaction that holds a
+lock (an advisory lock on PostgreSQL, BEGIN IMMEDIATE on SQLite), so a migration is
+never half-applied and it is safe to run on every boot and from several workers at once.
+
+Usage (from the api/ directory):
+    python migrations.py          # apply pending migrations and show query plans
+"""
+from datetime import datetime, timezone
+
+import scan_archive
+
+# Arbitrary key for pg_advisory_xact_lock, shared by every API process
+_MIGRATION_LOCK_KEY = 0x566F756368  # "Vouch"
+
+
+def _initial_schema(postgres: bool) -> list:
+    serial_type = "SERIAL PRIMARY KEY" if postgres else "INTEGER PRIMARY KEY AUTOINCREMENT"
+    return [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id              TEXT PRIMARY KEY,
+            api_key         TEXT UNIQUE,
+            github_installation_id TEXT UNIQUE,
+            tier            TEXT DEFAULT 'free',
+            scan_count      INTEGER DEFAULT 0,
+            additional_credits INTEGER DEFAULT 0,
+            stripe_customer_id TEXT,
+            stripe_subscription_id TEXT,
+            created_at      TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS scans (
+            id          TEXT PRIMARY KEY,
+            user_id     TEXT REFERENCES users(id) ON DELETE SET NULL,
+            scan_type   TEXT NOT NULL,
+            language    TEXT NOT NULL,
+            score       INTEGER NOT NULL,
+            summary     TEXT NOT NULL,
+            created_at  TEXT NOT NULL
+        )
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS issues (
+            id          {serial_type},
+            scan_id     TEXT NOT NULL REFERENCES scans(id) ON DELETE CASCADE,
+            title       TEXT NOT NULL,
+            severity    TEXT NOT NULL,
+            file        TEXT,
+            description TEXT,
+            how_to_fix  TEXT,
+            fixed_code_snippet TEXT
+        )
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS ignored_findings (
+            id          {serial_type},
+            user_id     TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            repo_name   TEXT NOT NULL,
+            file_path   TEXT NOT NULL,
+            snippet_hash TEXT NOT NULL,
+            created_at  TEXT NOT NULL,
+            UNIQUE(user_id, repo_name, file_path, snippet_hash)
+        )
+        """,
+    ]
+
+
+def _hot_query_indexes(postgres: bool) -> list:
+    return [
+        # Scan history per user, newest first (get_all_scans) and the badge's latest scan
+        "CREATE INDEX IF NOT EXISTS idx_scans_user_created ON scans (user_id, created_at DESC)",
+        # Unfiltered history (admin key)
+        "CREATE INDEX IF NOT EXISTS idx_scans_created ON scans (created_at DESC)",
+        # Issues of a scan (get_scan_by_id) and the ON DELETE CASCADE from scans
+        "CREATE INDEX IF NOT EXISTS idx_issues_scan ON issues (scan_id)",
+    ]
+
+
+def _latest_scores(postgres: bool) -> list:
+    return [
+        # Latest score per GitHub installation (repo = '') and per installation repository,
+        # maintained by save_scan so badges never sort the scans table
+        """
+        CREATE TABLE IF NOT EXISTS latest_scores (
+            installation_id TEXT NOT NULL,
+            repo            TEXT NOT NULL DEFAULT '',
+            score           INTEGER NOT NULL,
+            scan_id         TEXT,
+            updated_at      TEXT NOT NULL,
+            PRIMARY KEY (installation_id, repo)
+        )
+        """,
+        """
+        INSERT INTO latest_scores (installation_id, repo, score, scan_id, updated_at)
+        SELECT u.github_installation_id, '', s.score, s.id, s.created_at
+        FROM users u JOIN scans s ON s.user_id = u.id
+        WHERE u.github_installation_id IS NOT NULL
+          AND s.id = (SELECT s2.id FROM scans s2 WHERE s2.user_id = u.id
+                      ORDER BY s2.created_at DESC, s2.id DESC LIMIT 1)
+        """,
+    ]
+
+
+def _native_timestamps(postgres: bool) -> list:
+    # SQLite has no timestamp type; there we keep ISO-8601 UTC text, which sorts chronologically
+    if not postgres:
+        return []
+    return [
+        f"ALTER TABLE {table} ALTER COLUMN {column} TYPE TIMESTAMPTZ USING {column}::timestamptz"
+        for table, column in (
+            ("users", "created_at"),
+            ("scans", "created_at"),
+            ("ignored_findings", "created_at"),
+            ("latest_scores", "updated_at"),
+        )
+    ]
+
+
+def _daily_rollups(postgres: bool) -> list:
+    day_type = "DATE" if postgres else "TEXT"
+    timestamp_type = "TIMESTAMPTZ" if postgres else "TEXT"
+    day = "(s.created_at AT TIME ZONE 'UTC')::date" if postgres else "substr(s.created_at, 1, 10)"
+    return [
+        # Per user, repository and UTC day; maintained by save_scan, read by /analytics/scans
+        f"""
+        CREATE TABLE IF NOT EXISTS scan_rollups_daily (
+            user_id         TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            repo            TEXT NOT NULL DEFAULT '',
+            day             {day_type} NOT NULL,
+            scan_count      INTEGER NOT NULL,
+            score_sum       INTEGER NOT NULL,
+            min_score       INTEGER NOT NULL,
+            last_score      INTEGER NOT NULL,
+            last_scan_at    {timestamp_type} NOT NULL,
+            critical_issues INTEGER NOT NULL DEFAULT 0,
+            high_issues     INTEGER NOT NULL DEFAULT 0,
+            medium_issues   INTEGER NOT NULL DEFAULT 0,
+            low_issues      INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, repo, day)
+        )
+        """,
+        f"""
+        INSERT INTO scan_rollups_daily (user_id, repo, day, scan_count, score_sum, min_score, last_score,
+                                        last_scan_at, critical_issues, high_issues, medium_issues, low_issues)
+        SELECT s.user_id, '', {day}, COUNT(*), SUM(s.score), MIN(s.score), MIN(s.score), MAX(s.created_at),
+               COALESCE(SUM(i.critical), 0), COALESCE(SUM(i.high), 0),
+               COALESCE(SUM(i.medium), 0), COALESCE(SUM(i.low), 0)
+        FROM scans s
+        LEFT JOIN (
+            SELECT scan_id,
+                   SUM(CASE WHEN UPPER(severity) = 'CRITICAL' THEN 1 ELSE 0 END) AS critical,
+                   SUM(CASE WHEN UPPER(severity) = 'HIGH' THEN 1 ELSE 0 END) AS high,
+                   SUM(CASE WHEN UPPER(severity) = 'MEDIUM' THEN 1 ELSE 0 END) AS medium,
+                   SUM(CASE WHEN UPPER(severity) = 'LOW' THEN 1 ELSE 0 END) AS low
+            FROM issues GROUP BY scan_id
+        ) i ON i.scan_id = s.id
+        WHERE s.user_id IS NOT NULL
+        GROUP BY s.user_id, {day}
+        """,
+        """
+        UPDATE scan_rollups_daily SET last_score = (
+            SELECT s.score FROM scans s
+            WHERE s.user_id = scan_rollups_daily.user_id AND s.created_at = scan_rollups_daily.last_scan_at
+            LIMIT 1
+        )
+        """,
+    ]
+
+
+def _cold_storage(postgres: bool) -> list:
+    blob_type = "BYTEA" if postgres else "BLOB"
+    timestamp_type = "TIMESTAMPTZ" if postgres else "TEXT"
+    return [
+        # Distinct long issue texts of archived scans, compressed, keyed by content hash
+        f"""
+        CREATE TABLE IF NOT EXISTS issue_texts (
+            hash    TEXT PRIMARY KEY,
+            codec   TEXT NOT NULL,
+            body    {blob_type} NOT NULL
+        )
+        """,
+        # Compressed issues of scans older than the retention window (see scan_archive.py)
+        f"""
+        CREATE TABLE IF NOT EXISTS scan_archive (
+            scan_id     TEXT PRIMARY KEY REFERENCES scans(id) ON DELETE CASCADE,
+            codec       TEXT NOT NULL,
+            issue_count INTEGER NOT NULL,
+            issues      {blob_type} NOT NULL,
+            archived_at {timestamp_type} NOT NULL
+        )
+        """,
+    ]
+
+
+def _jobs(postgres: bool) -> list:
+    timestamp_type = "TIMESTAMPTZ" if postgres else "TEXT"
+    return [
+        # Durable background work (repository scans, GitHub PR analysis), run by jobs.py workers
+        f"""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id              TEXT PRIMARY KEY,
+            kind            TEXT NOT NULL,
+            status          TEXT NOT NULL DEFAULT 'queued',
+            user_id         TEXT,
+            payload         TEXT NOT NULL,
+            result          TEXT,
+            error           TEXT,
+            attempts        INTEGER NOT NULL DEFAULT 0,
+            worker_id       TEXT,
+            created_at      {timestamp_type} NOT NULL,
+            started_at      {timestamp_type},
+            heartbeat_at    {timestamp_type},
+            finished_at     {timestamp_type}
+        )
+        """,
+        # Claiming the oldest queued job, finding stale running jobs and pruning finished ones
+        "CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at)",
+    ]
+
+
+def _job_lanes(postgres: bool) -> list:
+    float_type = "DOUBLE PRECISION" if postgres else "REAL"
+    return [
+        # Jobs run in lanes (fast snippets never wait behind repository scans), are capped per
+        # user and tier, and are claimed in weighted fair queuing order (fair_tag, see jobs.py)
+        "ALTER TABLE jobs ADD COLUMN lane TEXT NOT NULL DEFAULT 'repo'",
+        "ALTER TABLE jobs ADD COLUMN tier TEXT NOT NULL DEFAULT 'free'",
+        f"ALTER TABLE jobs ADD COLUMN fair_tag {float_type} NOT NULL DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_lane_queue ON jobs (lane, status, fair_tag)",
+    ]
+
+
+def _job_dedup(postgres: bool) -> list:
+    return [
+        # Identical submissions (same user, kind and content) share one queued or running job
+        "ALTER TABLE jobs ADD COLUMN dedup_key TEXT",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedup ON jobs (dedup_key) WHERE status IN ('queued', 'running')",
+    ]
+
+
+def _scan_repo(postgres: bool) -> list:
+    return [
+        # The repository of a GitHub scan, so deleting a scan can restore that repository's badge
+        "ALTER TABLE scans ADD COLUMN repo TEXT",
+        """
+        UPDATE scans SET repo = (
+            SELECT l.repo FROM latest_scores l WHERE l.scan_id = scans.id AND l.repo <> '' LIMIT 1
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_scans_user_repo_created ON scans (user_id, repo, created_at DESC)",
+    ]
+
+
+def _backfill_archive_texts(cur, postgres: bool):
+    cur.execute("SELECT scan_id, codec, issues FROM scan_archive")
+    references = set()
+    for scan_id, codec, blob in cur:
+        for issue in scan_archive.unpack_issues(blob, codec):
+            references.update((scan_id, issue[f]) for f in scan_archive.TEXT_FIELDS if issue.get(f))
+    if references:
+        p = "%s" if postgres else "?"
+        cur.executemany(
+            f"INSERT INTO scan_archive_texts (scan_id, hash) VALUES ({p}, {p}) ON CONFLICT DO NOTHING",
+            sorted(references)
+        )
+
+
+def _archive_text_references(postgres: bool) -> list:
+    return [
+        # Which archived scans reference each issue_texts row, so deleting a scan can drop
+        # the texts nothing else uses
+        """
+        CREATE TABLE IF NOT EXISTS scan_archive_texts (
+            scan_id TEXT NOT NULL REFERENCES scans(id) ON DELETE CASCADE,
+            hash    TEXT NOT NULL,
+            PRIMARY KEY (scan_id, hash)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_scan_archive_texts_hash ON scan_archive_texts (hash)",
+        _backfill_archive_texts,
+    ]
+
+
+def _cache_invalidations(postgres: bool) -> list:
+    serial_type = "SERIAL PRIMARY KEY" if postgres else "INTEGER PRIMARY KEY AUTOINCREMENT"
+    timestamp_type = "TIMESTAMPTZ" if postgres else "TEXT"
+    return [
+        # Cache entries made stale by a write, so every API and worker process drops its copy
+        # (see database._sync_caches)
+        f"""
+        CREATE TABLE IF NOT EXISTS cache_invalidations (
+            id          {serial_type},
+            cache       TEXT NOT NULL,
+            cache_key   TEXT NOT NULL,
+            created_at  {timestamp_type} NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_cache_invalidations_created ON cache_invalidations (created_at)",
+    ]
+
+
+# (version, name, statements(postgres) -> list of SQL, or of callables(cursor, postgres) for data
+# migrations that need Python). Never edit an applied entry; append.
+MIGRATIONS = [
+    (1, "initial schema", _initial_schema),
+    (2, "indexes for scan history, badge and issue lookups", _hot_query_indexes),
+    (3, "latest score per installation and repository", _latest_scores),
+    (4, "native timestamp columns", _native_timestamps),
+    (5, "daily scan rollups", _daily_rollups),
+    (6, "cold storage for old scan issues", _cold_storage),
+    (7, "durable job queue", _jobs),
+    (8, "job lanes and fair scheduling", _job_lanes),
+    (9, "single-flight job deduplication", _job_dedup),
+    (10, "repository of each scan", _scan_repo),
+    (11, "archived scan text references", _archive_text_references),
+    (12, "cross-process cache invalidation", _cache_invalidations),
+]
+
+# Hot queries and the index each one is expected to use (checked by `check_query_plans`)
+HOT_QUERIES = {
+    "scan_history": (
+        "SELECT id, scan_type, language, score, summary, created_at FROM scans "
+        "WHERE user_id = {p} ORDER BY created_at DESC LIMIT 20",
+        ("user",),
+        "idx_scans_user_created",
+    ),
+    "latest_score": (
+        "SELECT score FROM latest_scores WHERE installation_id = {p} AND repo = {p}",
+        ("1", ""),
+        "latest_scores_",  # primary key index: latest_scores_pkey / sqlite_autoindex_latest_scores_1
+    ),
+    "scan_issues": (
+        "SELECT title, severity, file FROM issues WHERE scan_id = {p}",
+        ("scan",),
+        "idx_issues_scan",
+    ),
+    "claim_job": (
+        "SELECT id FROM jobs WHERE lane = {p} AND status = {p} ORDER BY fair_tag LIMIT 1",
+        ("repo", "queued"),
+        "idx_jobs_lane_queue",
+    ),
+    "cache_sync": (
+        "SELECT id, cache, cache_key FROM cache_invalidations WHERE created_at >= {p}",
+        ("2000-01-01T00:00:00+00:00",),
+        "idx_cache_invalidations_created",
+    ),
+}
+
+
+def _applied_versions(cur) -> set:
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+
+def apply_migrations(conn, postgres: bool) -> list:
+    """Applies every pending migration in order. Returns the versions applied now."""
+    p = "%s" if postgres else "?"
+    cur = conn.cursor()
+    if not postgres:
+        # Python's sqlite3 would run DDL outside of any transaction (autocommit); issue
+        # BEGIN/COMMIT explicitly so each migration is applied completely or not at all
+        if conn.in_transaction:
+            conn.commit()
+        isolation_level, conn.isolation_level = conn.isolation_level, None
+    try:
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TEXT NOT NULL)"
+        )
+        conn.commit()
+
+        applied_now = []
+        for version, name, statements in MIGRATIONS:
+            # The lock is held until commit, so concurrent workers apply each migration exactly once
+            if postgres:
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (_MIGRATION_LOCK_KEY,))
+            else:
+                cur.execute("BEGIN IMMEDIATE")
+            if version in _applied_versions(cur):
+                conn.rollback()
+                continue
+            try:
+                for statement in statements(postgres):
+                    if callable(statement):
+                        statement(cur, postgres)
+                    else:
+                        cur.execute(statement)
+                cur.execute(
+                    f"INSERT INTO schema_migrations (version, name, applied_at) VALUES ({p}, {p}, {p})",
+                    (version, name, datetime.now(timezone.utc).isoformat())
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            print(f"🧱 Applied migration {version}: {name}")
+            applied_now.append(version)
+        return applied_now
+    finally:
+        if not postgres:
+            conn.isolation_level = isolation_level
+
+
+def check_query_plans(conn, postgres: bool) -> dict:
+    """
+    Runs EXPLAIN for each hot query. Returns {name: (uses expected index, plan text)}.
+    Small tables may legitimately be scanned sequentially by PostgreSQL.
+    """
+    p = "%s" if postgres else "?"
+    cur = conn.cursor()
+    results = {}
+    for name, (sql, params, index_name) in HOT_QUERIES.items():
+        prefix = "EXPLAIN " if postgres else "EXPLAIN QUERY PLAN "
+        cur.execute(prefix + sql.format(p=p), params)
+        plan = "\n".join(str(row[-1]) for row in cur.fetchall())
+        results[name] = (index_name in plan, plan)
+    conn.rollback()
+    return results
+
+
+if __name__ == "__main__":
+    import database
+    with database._connection() as conn:
+        apply_migrations(conn, bool(database.DATABASE_URL))
+        for name, (uses_index, plan) in check_query_plans(conn, bool(database.DATABASE_URL)).items():
+            print(f"{'✅' if uses_index else '⚠️ '} {name}\n{plan}\n")
@@ -0,0 +1,462 @@
+"""
+Vouch Scan Pipeline
+The analysis steps behind repository and pull request scans: language detection,
+static analysis, context collection, indexing and the LLM report. Run by the job
+workers (jobs.py), so scan duration never holds up the web process.
+"""
+import io
+import os
+import re
+import shutil
+import tempfile
+import time
+from typing import Optional
+
+from scanner import run_semgrep, run_semgrep_on_dir, extract_findings_summary, run_npm_audit, extract_npm_audit_summary, run_gitleaks, extract_gitleaks_summary
+from ai_translator import translate_findings, translate_repo_findings
+import archive_fs
+import async_database
+import github_app
+from archive_fs import ArchiveFS
+from indexer import CodeIndexer
+from manifest import RepoManifest, build_manifest
+
+_code_indexer = None
+
+
+def get_code_indexer() -> CodeIndexer:
+    """
+    Returns this process's code indexer, opening it on first use. Job workers on one host
+    share VOUCH_INDEX_PATH; their writes take turns (see CodeIndexer).
+    """
+    global _code_indexer
+    if _code_indexer is None:
+        # Optionally warm-started from a snapshot exported by another node
+        _code_indexer = CodeIndexer(
+            db_path=os.environ.get("VOUCH_INDEX_PATH", "./chroma_db"),
+            snapshot_path=os.environ.get("VOUCH_INDEX_SNAPSHOT")
+        )
+    return _code_indexer
+
+
+# Files that should NEVER be sent to the LLM
+SENSITIVE_FILE_PATTERNS = {
+    ".env", ".env.local", ".env.production", ".env.development",
+    "id_rsa", "id_ed25519", "id_dsa",
+    ".pem", ".key", ".p12", ".pfx",
+    "credentials.json", "service-account.json",
+    ".npmrc", ".pypirc", ".netrc",
+}
+
+# Patterns to redact from file contents before LLM analysis
+SENSITIVE_LINE_PATTERNS = re.compile(
+    r'(password|passwd|secret|api_key|apikey|auth_token|access_token|private_key|'
+    r'db_password|database_url|connection_string|credentials|'
+    r'sh_key|sk_live|sk_test|pk_live|pk_test)\s*[:=]\s*["\']?([^"\']+)["\']?',
+    re.IGNORECASE
+)
+
+def detect_language(directory: Optional[str] = None, code: Optional[str] = None, files: Optional[list] = None) -> str:
+    """Detects the primary language of a directory, a list of file paths or a code snippet."""
+    if code:
+        if "import React" in code or "export default" in code or "className=" in code:
+            return "javascript"
+        if "package main" in code or "func " in code:
+            return "go"
+        if "def " in code or "import " in code:
+            return "python"
+    
+    if directory or files is not None:
+        if files is None:
+            files = [file for _, _, dir_files in os.walk(directory) for file in dir_files]
+        ext_counts = {}
+        for file in files:
+            ext = os.path.splitext(file)[1].lower()
+            if ext in ['.py', '.js', '.jsx', '.ts', '.tsx', '.go', '.java', '.c', '.cpp']:
+                ext_counts[ext] = ext_counts.get(ext, 0) + 1
+        
+        if not ext_counts:
+            return "python"
+            
+        # top_ext = max(ext_counts, key=ext_counts.get)
+        top_ext = max(ext_counts.items(), key=lambda x: x[1])[0]
+        if top_ext in ['.js', '.jsx', '.ts', '.tsx']:
+            return "javascript"
+        if top_ext == '.go':
+            return "go"
+        return "python"
+        
+    return "python"
+
+def _is_sensitive_file(filename: str) -> bool:
+    """Check if a filename matches known sensitive file patterns."""
+    lower = filename.lower()
+    for pattern in SENSITIVE_FILE_PATTERNS:
+        if lower.endswith(pattern) or lower == pattern:
+            return True
+    return False
+
+
+def _redact_sensitive_lines(content: str) -> str:
+    """Redact lines containing passwords, keys, or secrets."""
+    return SENSITIVE_LINE_PATTERNS.sub("[REDACTED BY VOUCH]", content)
+
+
+def _directory_files(directory: str):
+    """Yields (relative path, file name, text opener) for every file under `directory`."""
+    for root, _, files in os.walk(directory):
+        for file in files:
+            file_path = os.path.join(root, file)
+            yield os.path.relpath(file_path, directory), file, lambda path=file_path: open(path, 'r', encoding='utf-8')
+
+
+def _manifest_files(manifest: RepoManifest):
+    """Yields (relative path, file name, text opener) for every file of a manifest, read from its cache."""
+    for path in manifest.paths():
+        yield path, path.rsplit("/", 1)[-1], lambda path=path: io.StringIO(manifest.read_text(path))
+
+
+def get_repo_context(directory: Optional[str] = None, max_files: int = 50, manifest: Optional[RepoManifest] = None) -> str:
+    """
+    Read up to `max_files` text files from the directory (or from a repository manifest,
+    without touching the disk again), filtering sensitive data.
+    """
+    context = []
+    files_read: int = 0
+
+    for rel_path, file, open_text in (_manifest_files(manifest) if manifest is not None else _directory_files(directory)):
+        if files_read >= max_files:
+            break
+
+        # Skip hidden files or common non-source directories/files
+        if file.startswith('.') or file.endswith(('.pyc', '.png', '.jpg', '.zip', '.sqlite3')):
+            continue
+
+        # --- Fix 2: Skip sensitive files ---
+        if _is_sensitive_file(file):
+            print(f"🚫 Skipping sensitive file: {file}")
+            continue
+
+        try:
+            with open_text() as f:
+                content = f.read(50000)
+                # --- Fix 2: Redact sensitive lines ---
+                content = _redact_sensitive_lines(content)
+                context.append(f"--- {rel_path} ---\n{content}\n")
+                files_read = files_read + 1
+        except Exception:
+            pass
+
+    return "\n".join(context)
+
+
+async def scan_snippet(code: str, language: str, user_id: Optional[str] = None,
+                       installation_id: Optional[str] = None) -> dict:
+    """
+    Runs Semgrep on a code snippet and translates the findings into actionable advice via
+    the Gemini AI API, then saves the report.
+    """
+    # 1. Run local Semgrep rules
+    semgrep_output = run_semgrep(code, language)
+
+    # 2. Extract the summary for the LLM
+    findings_summary = extract_findings_summary(semgrep_output)
+
+    # Filter out muted findings
+    if user_id:
+        findings_summary = await filter_ignored_findings(findings_summary, user_id, "unknown_repo")
+
+    # 3. Use LLM to translate findings into human-readable patches
+    # We ALWAYS call LLM now to do a "Vouch Deep Check" even if Semgrep found nothing
+    translated_report = translate_findings(
+        code_snippet=code,
+        language=language,
+        findings=findings_summary
+    )
+
+    # 4. Save to database (also counts the scan for the user)
+    scan_id = await async_database.save_scan(
+        "snippet", language, translated_report,
+        user_id=user_id, installation_id=installation_id
+    )
+    translated_report["scan_id"] = scan_id
+
+    return translated_report
+
+
+async def scan_repository(zip_path: str, extract_dir: str, language: str, archive_name: str,
+                          user_id: Optional[str] = None, installation_id: Optional[str] = None) -> dict:
+    """
+    Scans an uploaded (already validated) repository ZIP: extracts the files the scanners
+    target, runs Semgrep, npm audit and Gitleaks over them, and uses the 2-stage LLM pipeline
+    to build and save the report. Language detection, the LLM context and the code index
+    read the extracted files once, through a manifest.
+    """
+    with ArchiveFS(zip_path) as archive:
+        return await _scan_archive(archive, extract_dir, language, archive_name, user_id, installation_id)
+
+
+async def _scan_archive(archive: ArchiveFS, extract_dir: str, language: str, archive_name: str,
+                        user_id: Optional[str], installation_id: Optional[str]) -> dict:
+    started = time.monotonic()
+    extracted, extracted_bytes = archive.extract_scan_targets(extract_dir)
+    print(f"📦 Extracted {extracted} of {len(archive.files())} files ({extracted_bytes / 1e6:.1f}MB) "
+          f"for scanning in {time.monotonic() - started:.2f}s")
+
+    # One walk and one read per file; every later stage uses the manifest
+    started = time.monotonic()
+    manifest = build_manifest(extract_dir)
+    print(f"🗂️ Manifest of {len(manifest)} files ({manifest.total_bytes / 1e6:.1f}MB) "
+          f"built in {time.monotonic() - started:.2f}s")
+
+    # 0. Detect language from the manifest
+    if not language or language == "python":
+        language = detect_language(files=manifest.paths())
+    print(f"📊 Detected Repository Language: {language}")
+
+    # Scanners that read source are skipped when nothing but binaries was extracted
+    has_text_files = bool(manifest.text_files())
+    findings_summary = []
+    if has_text_files:
+        # 1. Run local Semgrep rules on the directory
+        semgrep_output = run_semgrep_on_dir(extract_dir)
+
+        # 2. Extract the summary for the LLM
+        findings_summary = extract_findings_summary(semgrep_output)
+
+    # 2b. Run Dependency Scanning (SCA) via npm audit (only npm projects have anything to audit)
+    if "package.json" in manifest:
+        npm_audit_output = run_npm_audit(extract_dir)
+        npm_findings = extract_npm_audit_summary(npm_audit_output)
+        findings_summary.extend(npm_findings)
+
+    # 2c. Run Gitleaks for Professional Secret Scanning
+    if has_text_files:
+        gitleaks_output = run_gitleaks(extract_dir)
+        gitleaks_findings = extract_gitleaks_summary(gitleaks_output)
+        findings_summary.extend(gitleaks_findings)
+
+    # Filter out ignored findings if user is linked
+    if user_id:
+        findings_summary = await filter_ignored_findings(findings_summary, user_id, "unknown_repo")
+
+    # 3. Get the repository context (sensitive files are filtered)
+    repo_context = get_repo_context(manifest=manifest)
+
+    # 3b. Index the repository (uploads are namespaced per user and archive name)
+    code_indexer = get_code_indexer()
+    index_namespace = f"upload/{user_id or 'anonymous'}/{archive_name}"
+    print(f"📁 Indexing repository in-place: {extract_dir}")
+    code_indexer.index_repository(extract_dir, namespace=index_namespace, manifest=manifest)
+
+    # 4. Use 2-Stage LLM to deeply analyze and translate findings
+    translated_report = translate_repo_findings(
+        code_context=repo_context,
+        language=language,
+        findings=findings_summary,
+        code_indexer=code_indexer,
+        index_namespace=index_namespace
+    )
+
+    # 5. Save to database (also counts the scan for the user)
+    scan_id = await async_database.save_scan(
+        "repo", language, translated_report,
+        user_id=user_id, installation_id=installation_id
+    )
+
+    translated_report["scan_id"] = scan_id
+
+    return translated_report
+
+
+async def filter_ignored_findings(findings: list, supabase_uid: str, repo_name: str) -> list:
+    """Removes findings that the user has previously ignored for this repository."""
+    if not any(f.get("snippet_hash") for f in findings):
+        return findings
+    # One (cached) lookup per repo, then a set membership check per finding
+    ignored = await async_database.get_ignored_findings(supabase_uid, repo_name)
+    if not ignored:
+        return findings
+    filtered = []
+    for f in findings:
+        h = f.get("snippet_hash")
+        if h and (f.get("file", "unknown_file"), h) in ignored:
+            print(f"🔇 Muting ignored finding: {f.get('rule_id')} in {f.get('file')}")
+            continue
+        filtered.append(f)
+    return filtered
+
+
+
+def is_scannable_github_event(payload: dict, event_name: str) -> bool:
+    """True for the pull request events that trigger an analysis."""
+    return event_name == "pull_request" and payload.get("action") in ["opened", "synchronize", "reopened"]
+
+
+async def process_github_webhook(payload: dict, event_name: str) -> Optional[str]:
+    """Analyzes the PR and posts the comment and status check. Returns the saved scan id."""
+    if not is_scannable_github_event(payload, event_name):
+        return # Currently only handle PRs
+
+    pull_request = payload.get("pull_request")
+    installation = payload.get("installation")
+    repository = payload.get("repository")
+
+    if not pull_request or not installation or not repository:
+        return
+
+    installation_id = installation["id"]
+    owner = repository["owner"]["login"]
+    repo_name = repository["name"]
+    pr_number = pull_request["number"]
+    head_sha = pull_request["head"]["sha"]
+    index_namespace = f"github/{installation_id}/{owner}/{repo_name}"
+
+    # Generate Installation Token
+    token = await github_app.get_installation_access_token(installation_id)
+    if not token:
+        print("❌ Could not get installation token")
+        return
+
+    # Post initial 'pending' status
+    await github_app.post_status_check(
+        token, owner, repo_name, head_sha,
+        state="pending",
+        description="Vouch scanning PR for security issues..."
+    )
+
+    # Check database to see if this installation is linked to a Vouch User
+    user = await async_database.get_user_by_installation_id(str(installation_id))
+    if not user:
+        print(f"⚠️ Webhook received for unlinked installation {installation_id}. Skipping scan.")
+        return
+
+    # Fetch explicitly changed files (Diff-based fetching)
+    diff_files = await github_app.fetch_pr_diff_files(token, owner, repo_name, pr_number)
+    
+    if not diff_files:
+        print("⚠️ Vouch: Keine Diff-Dateien gefunden (leerer PR oder API-Fehler). Beende Scan.")
+        await github_app.post_status_check(
+            token, owner, repo_name, head_sha,
+            state="success",
+            description="Vouch: No scannable files changed."
+        )
+        return
+
+    context_files = []
+    changed_files = []  # (filename, content, patch) for incremental indexing
+    
+    for df in diff_files:
+        if df.get("status") in ("removed", "deleted"):
+            continue
+        
+        filename = df.get("filename", "")
+        
+        # We process all files including sensitive ones (like .env) to allow AI secret detection.
+        # This is the intended behavior for Vouch PR analysis.
+        print(f"📦 Vouch: Fetching file for analysis: {filename}")
+            
+        # Use contents_url with raw accept header for reliable fetching
+        contents_url = df.get("contents_url")
+        if not contents_url:
+            contents_url = df.get("raw_url")
+
+        content = await github_app.fetch_file_content(token, contents_url)
+        if content:
+            # We skip content redaction for PR scans to allow the AI to detect hardcoded secrets.
+            context_files.append(f"--- {filename} ---\n{content}\n")
+            changed_files.append((filename, content, df.get("patch")))
+
+    if not context_files:
+        print("ℹ️ Vouch: No processable files found in PR context.")
+        await github_app.post_status_check(
+            token, owner, repo_name, head_sha,
+            state="success",
+            description="Vouch: No scannable code changes found in this PR."
+        )
+        return
+
+    findings_summary = [] # Initialize findings list; AI will also perform direct review of context
+    code_context = "\n".join(context_files)
+    
+    if user and user.get("id"):
+        findings_summary = await filter_ignored_findings(findings_summary, user["id"], repo_name)
+    
+    # --- Indexing Step ---
+    # Index the changed files straight from the fetched contents. Files seen in an earlier
+    # PR event are reparsed incrementally from their cached syntax trees, and only the
+    # symbols that changed are rewritten, so latency follows the diff size.
+    print(f"📁 Indexing repository: {repo_name}")
+    code_indexer = get_code_indexer()
+    code_indexer.index_changed_files(changed_files, namespace=index_namespace)
+
+    # Send to AI
+    translated_report = translate_repo_findings(
+        code_context=code_context,
+        language="javascript", # Fallback language, could auto-detect
+        findings=findings_summary, # Mocked until local diff VFS is implemented
+        code_indexer=code_indexer,
+        index_namespace=index_namespace
+    )
+    
+    # Post PR Comment
+    comment_body = f"## 🛡️ Vouch Security Analysis\n**Score:** {translated_report.get('score', 0)}/100\n\n**Summary:**\n{translated_report.get('summary', '')}"
+    
+    for issue in translated_report.get('issues', []):
+        comment_body += f"\n\n### ⚠️ {issue.get('title')} ({issue.get('severity')})"
+        comment_body += f"\n{issue.get('description')}"
+        if issue.get('fixed_code_snippet'):
+            comment_body += f"\n\n**Fix Strategy:** {issue.get('how_to_fix')}\n```\n{issue.get('fixed_code_snippet')}\n```"
+
+    await github_app.post_pr_comment(token, owner, repo_name, pr_number, comment_body)
+    
+    # Post Final Status Check to block merges if score is low
+    final_score = translated_report.get('score', 0)
+    final_state = "success" if final_score >= 90 else "failure"
+    status_desc = f"Vouch Security Score: {final_score}/100"
+    if final_score < 90:
+        status_desc += " (Issues Found)"
+        
+    await github_app.post_status_check(
+        token, owner, repo_name, head_sha,
+        state=final_state,
+        description=status_desc
+    )
+    
+    
+    # Save to Database using the linked user
+    return await async_database.save_scan(
+        "github_pr", "javascript", translated_report,
+        user_id=user.get("id"), installation_id=str(installation_id), repo=f"{owner}/{repo_name}"
+    )
+
+
+# --- Job handlers (job payload, user id) -> JSON-serializable result ---
+
+async def run_snippet_scan_job(payload: dict, user_id: Optional[str]) -> dict:
+    return await scan_snippet(payload["code"], payload["language"], user_id=user_id,
+                              installation_id=payload.get("installation_id"))
+
+
+async def run_repo_scan_job(payload: dict, user_id: Optional[str]) -> dict:
+    """Scans an uploaded ZIP from the job spool directory, then removes it."""
+    spool_dir = os.path.dirname(payload["zip_path"])
+    if archive_fs.EXTRACT_DIR:
+        os.makedirs(archive_fs.EXTRACT_DIR, exist_ok=True)
+        extract_dir = tempfile.mkdtemp(dir=archive_fs.EXTRACT_DIR)
+    else:
+        extract_dir = os.path.join(spool_dir, "extracted")
+    try:
+        return await scan_repository(
+            payload["zip_path"], extract_dir, payload.get("language"),
+            payload["archive_name"], user_id=user_id, installation_id=payload.get("installation_id")
+        )
+    finally:
+        shutil.rmtree(extract_dir, ignore_errors=True)
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+
+async def run_github_pr_job(payload: dict, user_id: Optional[str]) -> dict:
+    """Analyzes a pull request from a queued GitHub webhook delivery."""
+    scan_id = await process_github_webhook(payload["payload"], payload["event_name"])
+    return {"scan_id": scan_id}
@@ -0,0 +1,78 @@
+"""
+Vouch Scan Archive Codec
+Packs the issues of an old scan into a compact cold-storage form. Long issue texts
+(description, how_to_fix, fixed_code_snippet) are stored once per distinct text in
+`issue_texts` and referenced by hash, since repeated scans of a repository produce
+near-identical reports; `scan_archive_texts` records which scans reference each text. Blobs use zstd when the `zstandard` package is installed and
+zlib otherwise; the codec is stored with each blob so either can be read back.
+"""
+import hashlib
+import json
+import zlib
+
+try:
+    import zstandard
+    _zstd_compressor = zstandard.ZstdCompressor(level=10)
+    _zstd_decompressor = zstandard.ZstdDecompressor()
+except ImportError:
+    zstandard = None
+
+DEFAULT_CODEC = "zstd" if zstandard else "zlib"
+
+# Issue fields moved to the deduplicated text store
+TEXT_FIELDS = ("description", "how_to_fix", "fixed_code_snippet")
+
+
+def compress(data: bytes, codec: str = DEFAULT_CODEC) -> bytes:
+    if codec == "zstd":
+        return _zstd_compressor.compress(data)
+    return zlib.compress(data, 9)
+
+
+def decompress(blob: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Archived scan uses zstd but the zstandard package is not installed")
+        return _zstd_decompressor.decompress(bytes(blob))
+    return zlib.decompress(bytes(blob))
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def pack_issues(issues: list, codec: str = DEFAULT_CODEC) -> tuple:
+    """
+    Returns (blob, texts) for a list of issue dicts. `texts` maps hash -> compressed text
+    for every long text referenced by the blob.
+    """
+    texts = {}
+    packed = []
+    for issue in issues:
+        entry = dict(issue)
+        for field in TEXT_FIELDS:
+            value = entry.get(field)
+            if value:
+                h = text_hash(value)
+                if h not in texts:
+                    texts[h] = compress(value.encode("utf-8"), codec)
+                entry[field] = h
+        packed.append(entry)
+    blob = compress(json.dumps(packed, separators=(",", ":")).encode("utf-8"), codec)
+    return blob, texts
+
+
+def unpack_issues(blob: bytes, codec: str) -> list:
+    """Returns the issue dicts of a blob with text fields still holding hashes."""
+    return json.loads(decompress(blob, codec))
+
+
+def restore_texts(issues: list, texts: dict) -> list:
+    """Replaces text hashes with their text (`texts` maps hash -> (codec, compressed text))."""
+    for issue in issues:
+        for field in TEXT_FIELDS:
+            h = issue.get(field)
+            if h:
+                entry = texts.get(h)
+                issue[field] = decompress(entry[1], entry[0]).decode("utf-8") if entry else None
+    return issues
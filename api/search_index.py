@@ -0,0 +1,143 @@
+"""
+Vouch Lexical Search Index
+In-memory BM25 index over indexed code symbols. Used by the CodeIndexer for
+context retrieval so we get meaningful results without an embedding model.
+"""
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Optional
+
+# BM25 tuning parameters (standard Okapi defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Symbol names are weighted higher than identifiers that merely appear in a body
+NAME_BOOST = 3
+
+_IDENTIFIER_RE = re.compile(r"[A-Za-z_$][A-Za-z0-9_$]*")
+_WORD_PART_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+# Keywords that appear in nearly every snippet and carry no retrieval signal
+STOP_WORDS = {
+    "def", "class", "return", "self", "this", "import", "from", "as", "if", "else",
+    "elif", "for", "while", "in", "is", "not", "and", "or", "none", "true", "false",
+    "null", "undefined", "const", "let", "var", "function", "new", "async", "await",
+    "try", "except", "catch", "finally", "raise", "throw", "export", "default",
+    "pass", "with", "of", "the",
+}
+
+
+def tokenize(text: str) -> list:
+    """
+    Splits code into lowercase search terms.
+    Each identifier is kept whole and also split into its snake_case/camelCase parts,
+    so `getUserById` matches queries for `get_user_by_id`, `user` or `id`.
+    """
+    tokens = []
+    for identifier in _IDENTIFIER_RE.findall(text):
+        whole = identifier.lower()
+        if len(whole) > 1 and whole not in STOP_WORDS:
+            tokens.append(whole)
+        parts = _WORD_PART_RE.findall(identifier)
+        if len(parts) > 1:
+            for part in parts:
+                part = part.lower()
+                if len(part) > 1 and part not in STOP_WORDS:
+                    tokens.append(part)
+    return tokens
+
+
+class BM25Index:
+    """
+    Inverted index with BM25 ranking.
+    Documents are grouped by file so a re-indexed file can be replaced incrementally.
+    """
+
+    def __init__(self):
+        self.postings = {}      # term -> {doc_id: term frequency}
+        self.doc_lengths = {}   # doc_id -> number of terms
+        self.doc_terms = {}     # doc_id -> distinct terms (for removal)
+        self.documents = {}     # doc_id -> (content, metadata)
+        self.file_docs = {}     # file path -> set of doc_ids
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add_document(self, doc_id: str, content: str, metadata: dict, name: Optional[str] = None):
+        """Adds (or replaces) a single document."""
+        if doc_id in self.doc_lengths:
+            self.remove_document(doc_id)
+
+        terms = tokenize(content)
+        if name:
+            terms.extend(tokenize(name) * NAME_BOOST)
+        counts = Counter(terms)
+
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        self.doc_lengths[doc_id] = len(terms)
+        self.doc_terms[doc_id] = tuple(counts)
+        self.documents[doc_id] = (content, metadata)
+        self.total_length += len(terms)
+
+        file_path = metadata.get("file")
+        if file_path is not None:
+            self.file_docs.setdefault(file_path, set()).add(doc_id)
+
+    def update_metadata(self, doc_id: str, metadata: dict):
+        """Replaces a document's metadata without re-tokenizing it (its file must not change)."""
+        if doc_id in self.documents:
+            content, _ = self.documents[doc_id]
+            self.documents[doc_id] = (content, metadata)
+
+    def remove_document(self, doc_id: str):
+        """Removes a single document if present."""
+        length = self.doc_lengths.pop(doc_id, None)
+        if length is None:
+            return
+        for term in self.doc_terms.pop(doc_id, ()):
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[term]
+        _, metadata = self.documents.pop(doc_id)
+        self.total_length -= length
+
+        file_docs = self.file_docs.get(metadata.get("file"))
+        if file_docs is not None:
+            file_docs.discard(doc_id)
+            if not file_docs:
+                del self.file_docs[metadata.get("file")]
+
+    def remove_file(self, file_path: str):
+        """Removes every document that belongs to a file."""
+        for doc_id in list(self.file_docs.get(file_path, ())):
+            self.remove_document(doc_id)
+
+    def query(self, text: str, n_results: int = 3) -> list:
+        """
+        Returns up to `n_results` (doc_id, score, content, metadata) tuples ranked by BM25.
+        Every distinct query term counts once, so long queries do not favour repeated words.
+        """
+        if not self.doc_lengths:
+            return []
+
+        n_docs = len(self.doc_lengths)
+        avg_length = self.total_length / n_docs or 1.0
+        scores = {}
+
+        for term in set(tokenize(text)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        top = heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+        return [(doc_id, score, *self.documents[doc_id]) for doc_id, score in top]
@@ -0,0 +1,446 @@
+"""
+Vouch Symbol Extractor
+Tree-sitter based extraction of function/class definitions.
+Kept free of ChromaDB imports so it can run cheaply inside indexing worker processes.
+"""
+import os
+import re
+from typing import Optional
+
+try:
+    from tree_sitter_languages import get_parser, get_language
+except ImportError:
+    print("⚠️ tree_sitter_languages not found. Indexing features will be disabled.")
+    get_parser = None
+    get_language = None
+
+LANGUAGE_BY_EXTENSION = {
+    '.py': 'python',
+    '.js': 'javascript',
+    '.jsx': 'javascript',
+    '.ts': 'typescript',
+    '.tsx': 'tsx'
+}
+
+_JS_DEFINITIONS_QUERY = """
+(function_declaration
+    name: (identifier) @name) @def
+(method_definition
+    name: (property_identifier) @name) @def
+(class_declaration
+    name: (identifier) @name) @def
+(variable_declarator
+    name: (identifier) @name
+    value: (arrow_function)) @def
+"""
+
+# Simple queries for definitions
+DEFINITION_QUERIES = {
+    'python': """
+    (function_definition
+        name: (identifier) @name) @def
+    (class_definition
+        name: (identifier) @name) @def
+    """,
+    'javascript': _JS_DEFINITIONS_QUERY,
+    'typescript': _JS_DEFINITIONS_QUERY,
+    'tsx': _JS_DEFINITIONS_QUERY,
+}
+
+_JS_REFERENCES_QUERY = """
+(call_expression
+    function: (identifier) @ref)
+(call_expression
+    function: (member_expression
+        property: (property_identifier) @ref))
+(new_expression
+    constructor: (identifier) @ref)
+(import_specifier
+    name: (identifier) @ref)
+"""
+
+# Call sites and imported names, used to link symbols into a cross-reference graph
+REFERENCE_QUERIES = {
+    'python': """
+    (call
+        function: (identifier) @ref)
+    (call
+        function: (attribute
+            attribute: (identifier) @ref))
+    (import_from_statement
+        name: (dotted_name) @ref)
+    """,
+    'javascript': _JS_REFERENCES_QUERY,
+    'typescript': _JS_REFERENCES_QUERY,
+    'tsx': _JS_REFERENCES_QUERY,
+}
+
+# Per-process caches: building a parser or compiling a query is far more
+# expensive than parsing a typical source file, so each is done once per language.
+_parsers = {}
+_queries = {}
+
+
+def language_for_path(file_path: str) -> Optional[str]:
+    """Maps a file path to its tree-sitter language name (None if unsupported)."""
+    return LANGUAGE_BY_EXTENSION.get(os.path.splitext(file_path)[1])
+
+
+def get_cached_parser(lang_name: str):
+    """Returns the tree-sitter parser for a language, creating it on first use."""
+    parser = _parsers.get(lang_name)
+    if parser is None:
+        parser = get_parser(lang_name)
+        _parsers[lang_name] = parser
+    return parser
+
+
+def get_cached_query(lang_name: str):
+    """Returns the compiled definitions + references query for a language, compiling it on first use."""
+    query = _queries.get(lang_name)
+    if query is None:
+        language = get_language(lang_name)
+        if not language:
+            return None
+        query = language.query(DEFINITION_QUERIES[lang_name] + REFERENCE_QUERIES.get(lang_name, ""))
+        _queries[lang_name] = query
+    return query
+
+
+def parse_source(file_path: str, content_bytes: bytes, old_tree=None):
+    """
+    Parses source bytes with the cached parser for the file's language.
+    Pass an `old_tree` that was edited to match `content_bytes` to reparse incrementally.
+    Returns None if the language is unsupported or tree-sitter is missing.
+    """
+    lang_name = language_for_path(file_path)
+    if not lang_name or lang_name not in DEFINITION_QUERIES:
+        return None
+
+    if not get_parser or not get_language:
+        print(f"Skipping indexing for {file_path} (missing dependency)")
+        return None
+
+    parser = get_cached_parser(lang_name)
+    return parser.parse(content_bytes, old_tree) if old_tree is not None else parser.parse(content_bytes)
+
+
+def _capture_nodes(query, tree, start_point=None, end_point=None) -> tuple:
+    """Definition and reference nodes of a tree, or of the part between two (row, column) points."""
+    if start_point is None:
+        captures = query.captures(tree.root_node)
+    else:
+        captures = query.captures(tree.root_node, start_point=start_point, end_point=end_point)
+    def_nodes = []
+    ref_nodes = []
+    for node, tag in captures:
+        if tag == 'def':
+            def_nodes.append(node)
+        elif tag == 'ref':
+            ref_nodes.append(node)
+    return def_nodes, ref_nodes
+
+
+def _build_definitions(file_path: str, content_bytes: bytes, def_nodes, ref_nodes) -> list:
+    """Definition dicts (without ids) of definition nodes, with the names they reference."""
+    definitions = []
+    for node in def_nodes:
+        code_snippet = content_bytes[node.start_byte:node.end_byte].decode("utf8", errors="ignore")
+
+        # All queried node types expose their identifier via the 'name' field
+        name_node = node.child_by_field_name("name")
+        name = name_node.text.decode("utf8", errors="ignore") if name_node else ""
+
+        definitions.append({
+            "content": code_snippet,
+            "metadata": {
+                "file": file_path,
+                "line": node.start_point[0],
+                "end_line": node.end_point[0],
+                "type": node.type,
+                "name": name,
+                "refs": ""
+            }
+        })
+
+    _attach_references(definitions, def_nodes, ref_nodes)
+    return definitions
+
+
+def _assign_ids(file_path: str, definitions: list) -> list:
+    """Sets the ids of a file's definitions, given in source order."""
+    seen_names = {}
+    for definition in definitions:
+        # Ids don't contain the line, so a symbol keeps its id when code above it changes
+        key = definition["metadata"]["name"] or definition["metadata"]["type"]
+        occurrence = seen_names.get(key, 0)
+        seen_names[key] = occurrence + 1
+        definition["id"] = f"{file_path}:{key}" + (f"#{occurrence}" if occurrence else "")
+    return definitions
+
+
+def definitions_from_tree(file_path: str, content_bytes: bytes, tree) -> Optional[list]:
+    """Runs the definitions/references query over a parsed tree and returns the definitions."""
+    query = get_cached_query(language_for_path(file_path))
+    if query is None:
+        return None
+    def_nodes, ref_nodes = _capture_nodes(query, tree)
+    return _assign_ids(file_path, _build_definitions(file_path, content_bytes, def_nodes, ref_nodes))
+
+
+def extract_definitions(file_path: str, content: str) -> Optional[list]:
+    """
+    Parses a file with tree-sitter and returns its function/class definitions.
+    Returns None if the file could not be parsed (unsupported language, missing
+    dependency or parser error), so callers can keep the previously indexed symbols.
+    """
+    try:
+        content_bytes = bytes(content, "utf8")
+        tree = parse_source(file_path, content_bytes)
+        if tree is None:
+            return None
+        return definitions_from_tree(file_path, content_bytes, tree)
+
+    except Exception as e:
+        print(f"Error indexing {file_path}: {e}")
+        return None
+
+
+def _attach_references(definitions, def_nodes, ref_nodes):
+    """
+    Assigns every referenced name to the innermost definition that contains it and stores
+    them as a space-separated `refs` metadata string (ChromaDB metadata must be scalar).
+    References outside of any definition (module-level code) are dropped.
+    """
+    # Sweep definitions and references in source order, keeping a stack of open definitions.
+    # At equal start offsets the enclosing (longer) definition must come first.
+    events = [(n.start_byte, -n.end_byte, 0, i) for i, n in enumerate(def_nodes)]
+    events += [(n.start_byte, -n.end_byte, 1, i) for i, n in enumerate(ref_nodes)]
+    events.sort()
+
+    refs = [set() for _ in definitions]
+    stack = []
+    for start, neg_end, kind, i in events:
+        while stack and def_nodes[stack[-1]].end_byte <= start:
+            stack.pop()
+        if kind == 0:
+            stack.append(i)
+        elif stack:
+            # Dotted imports (`from a.b import c`) refer to their last component
+            name = ref_nodes[i].text.decode("utf8", errors="ignore").rsplit(".", 1)[-1]
+            if name and name != definitions[stack[-1]]["metadata"]["name"]:
+                refs[stack[-1]].add(name)
+
+    for definition, names in zip(definitions, refs):
+        definition["metadata"]["refs"] = " ".join(sorted(names))
+
+
+def extract_definitions_task(task: tuple) -> tuple:
+    """Process-pool entry point: (file_path, content) -> (file_path, definitions)."""
+    file_path, content = task
+    return file_path, extract_definitions(file_path, content)
+
+
+# --- Incremental re-parsing ---
+
+_HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@", re.MULTILINE)
+
+
+def parse_patch_hunks(patch: Optional[str]) -> list:
+    """Parses unified-diff hunk headers into (old_start, old_len, new_start, new_len) tuples (1-based lines)."""
+    hunks = []
+    for match in _HUNK_HEADER_RE.finditer(patch or ""):
+        old_start, old_len, new_start, new_len = match.groups()
+        hunks.append((
+            int(old_start), int(old_len) if old_len is not None else 1,
+            int(new_start), int(new_len) if new_len is not None else 1
+        ))
+    return hunks
+
+
+def _line_offsets(content_bytes: bytes) -> list:
+    """Byte offset of the start of every line, plus a final entry for the end of the content."""
+    offsets = [0]
+    position = content_bytes.find(b"\n")
+    while position != -1:
+        offsets.append(position + 1)
+        position = content_bytes.find(b"\n", position + 1)
+    if offsets[-1] != len(content_bytes):
+        offsets.append(len(content_bytes))
+    return offsets
+
+
+def _point(content_bytes: bytes, byte: int) -> tuple:
+    """Converts a byte offset into a tree-sitter (row, column) point."""
+    row = content_bytes.count(b"\n", 0, byte)
+    return (row, byte - (content_bytes.rfind(b"\n", 0, byte) + 1))
+
+
+def _advance(point: tuple, text: bytes) -> tuple:
+    """The point reached after `text` when it starts at `point`."""
+    newlines = text.count(b"\n")
+    if not newlines:
+        return (point[0], point[1] + len(text))
+    return (point[0] + newlines, len(text) - text.rfind(b"\n") - 1)
+
+
+def _hunk_edits(old_bytes: bytes, new_bytes: bytes, hunks: list) -> Optional[list]:
+    """
+    Converts diff hunks into sequential tree-sitter edits, each expressed in the coordinates
+    of the document after the previous edits. Returns None if the hunks don't describe a
+    change from `old_bytes` to `new_bytes`, e.g. because the cached tree is of another revision.
+    """
+    old_offsets = _line_offsets(old_bytes)
+    new_offsets = _line_offsets(new_bytes)
+
+    def span(offsets, start, length):
+        # A zero-length side means "insert after line `start`"
+        first = start if length else start + 1
+        begin = offsets[min(max(first - 1, 0), len(offsets) - 1)]
+        end = offsets[min(max(first - 1 + length, 0), len(offsets) - 1)]
+        return begin, end
+
+    edits = []
+    old_cursor = new_cursor = 0
+    for old_start, old_len, new_start, new_len in hunks:
+        old_begin, old_end = span(old_offsets, old_start, old_len)
+        new_begin, new_end = span(new_offsets, new_start, new_len)
+
+        # The text between hunks must be unchanged, otherwise the patch is for another base
+        if old_begin < old_cursor or old_bytes[old_cursor:old_begin] != new_bytes[new_cursor:new_begin]:
+            return None
+        start_point = _point(new_bytes, new_begin)
+        edits.append({
+            "start_byte": new_begin,
+            "old_end_byte": new_begin + (old_end - old_begin),
+            "new_end_byte": new_end,
+            "start_point": start_point,
+            "old_end_point": _advance(start_point, old_bytes[old_begin:old_end]),
+            "new_end_point": _point(new_bytes, new_end),
+        })
+        old_cursor, new_cursor = old_end, new_end
+
+    if old_bytes[old_cursor:] != new_bytes[new_cursor:]:
+        return None
+    return edits
+
+
+def _span_edit(old_bytes: bytes, new_bytes: bytes) -> dict:
+    """Single edit covering everything between the common prefix and common suffix of two versions."""
+    # Binary search on slice equality keeps the comparisons in C (memcmp) instead of a Python loop
+    limit = min(len(old_bytes), len(new_bytes))
+    low, high = 0, limit
+    while low < high:
+        mid = (low + high + 1) // 2
+        if old_bytes[:mid] == new_bytes[:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    prefix = low
+
+    low, high = 0, limit - prefix
+    while low < high:
+        mid = (low + high + 1) // 2
+        if old_bytes[len(old_bytes) - mid:] == new_bytes[len(new_bytes) - mid:]:
+            low = mid
+        else:
+            high = mid - 1
+    suffix = low
+
+    return {
+        "start_byte": prefix,
+        "old_end_byte": len(old_bytes) - suffix,
+        "new_end_byte": len(new_bytes) - suffix,
+        "start_point": _point(new_bytes, prefix),
+        "old_end_point": _point(old_bytes, len(old_bytes) - suffix),
+        "new_end_point": _point(new_bytes, len(new_bytes) - suffix),
+    }
+
+
+def tree_edits(old_bytes: bytes, new_bytes: bytes, patch: Optional[str] = None) -> list:
+    """
+    The tree edits turning `old_bytes` into `new_bytes`: the PR patch hunks when they match
+    the old revision, otherwise one edit spanning the changed region.
+    """
+    edits = _hunk_edits(old_bytes, new_bytes, parse_patch_hunks(patch)) if patch else None
+    if edits is None:
+        edits = [_span_edit(old_bytes, new_bytes)]
+    return edits
+
+
+def reparse_incremental(file_path: str, old_bytes: bytes, old_tree, new_bytes: bytes, patch: Optional[str] = None,
+                        edits: Optional[list] = None):
+    """
+    Reparses a new revision of a file reusing the syntax tree of the previous one.
+    The changes are applied as tree edits (`edits`, or tree_edits of the patch) first.
+    Returns the new tree (the old tree is modified in place and should be discarded).
+    """
+    if edits is None:
+        edits = tree_edits(old_bytes, new_bytes, patch)
+    for edit in edits:
+        old_tree.edit(**edit)
+    return parse_source(file_path, new_bytes, old_tree=old_tree)
+
+
+def changed_rows(edits: list) -> list:
+    """
+    (old_first, old_last, new_first, new_last) row ranges touched by sequential tree edits,
+    in the coordinates of the old and of the new revision.
+    """
+    rows = []
+    delta = 0
+    for edit in edits:
+        first = edit["start_point"][0]
+        rows.append((first - delta, edit["old_end_point"][0] - delta, first, edit["new_end_point"][0]))
+        delta += edit["new_end_point"][0] - edit["old_end_point"][0]
+    return rows
+
+
+def definitions_in_rows(file_path: str, content_bytes: bytes, tree, rows: list) -> Optional[list]:
+    """
+    Definitions (without ids) of the new revision that overlap the changed `rows` (see
+    changed_rows). Only those parts of the tree are queried: first the changed rows, to find
+    the definitions around them, then the span of those definitions for their references.
+    """
+    query = get_cached_query(language_for_path(file_path))
+    if query is None:
+        return None
+
+    def_nodes = {}
+    for _, _, new_first, new_last in rows:
+        for node in _capture_nodes(query, tree, (new_first, 0), (new_last + 1, 0))[0]:
+            def_nodes[node.id] = node
+    if not def_nodes:
+        return []
+
+    start = min(node.start_point for node in def_nodes.values())
+    end = max(node.end_point for node in def_nodes.values())
+    span_defs, ref_nodes = _capture_nodes(query, tree, start, end)
+    # Nested definitions untouched by the change are built too, so references are attributed
+    # to the innermost definition, and then dropped
+    definitions = _build_definitions(file_path, content_bytes, span_defs, ref_nodes)
+    return [d for node, d in zip(span_defs, definitions) if node.id in def_nodes]
+
+
+def update_definitions(file_path: str, old_definitions: list, new_definitions: list, rows: list) -> list:
+    """
+    All definitions of a file's new revision, from those of the old revision and the new
+    definitions overlapping the changed `rows` (definitions_in_rows). Old definitions away
+    from the changes are kept, moved by the lines inserted or deleted above them.
+    """
+    kept = []
+    for definition in old_definitions:
+        meta = definition["metadata"]
+        line, end_line = meta["line"], meta["end_line"]
+        if any(old_first <= end_line and line <= old_last for old_first, old_last, _, _ in rows):
+            continue
+        shift = sum((new_last - new_first) - (old_last - old_first)
+                    for old_first, old_last, new_first, new_last in rows if old_last < line)
+        kept.append({
+            "content": definition["content"],
+            "metadata": {**meta, "line": line + shift, "end_line": end_line + shift},
+        })
+
+    # Source order, enclosing definitions before the ones nested in them
+    merged = sorted(kept + new_definitions, key=lambda d: (d["metadata"]["line"], -d["metadata"]["end_line"]))
+    return _assign_ids(file_path, merged)
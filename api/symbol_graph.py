@@ -0,0 +1,151 @@
+"""
+Vouch Symbol Graph
+Cross-reference graph between indexed definitions (caller -> callee), stored as
+compact CSR adjacency arrays. Used to pick the definitions most relevant to a set
+of findings instead of sending whole files to the LLM.
+"""
+import bisect
+import heapq
+from array import array
+
+# Relative weight of following a call edge forwards (callee) vs. backwards (caller)
+CALLEE_WEIGHT = 1.0
+CALLER_WEIGHT = 0.6
+# Score multiplier per additional hop away from the finding
+HOP_DECAY = 0.35
+MAX_HOPS = 2
+# Definitions in the finding's own file are usually already in the prompt context
+SAME_FILE_WEIGHT = 0.5
+
+
+def _csr(n_nodes, edges):
+    """Builds (offsets, targets) arrays from (source, target) pairs."""
+    counts = [0] * (n_nodes + 1)
+    for source, _ in edges:
+        counts[source + 1] += 1
+    for i in range(n_nodes):
+        counts[i + 1] += counts[i]
+    offsets = array('i', counts)
+    targets = array('i', bytes(4 * len(edges)))
+    cursor = list(counts[:-1])
+    for source, target in edges:
+        targets[cursor[source]] = target
+        cursor[source] += 1
+    return offsets, targets
+
+
+class SymbolGraph:
+    """
+    Immutable graph over a repository's definitions.
+    Node i is the i-th definition; an edge i -> j means i references a name that j defines.
+    """
+
+    def __init__(self, documents):
+        """`documents` maps doc_id -> (content, metadata) as stored by the CodeIndexer."""
+        self.ids = []
+        self.files = []
+        self.lines = array('i')
+        self.end_lines = array('i')
+        refs_by_node = []
+        nodes_by_name = {}
+
+        for doc_id, (_, meta) in documents.items():
+            node = len(self.ids)
+            self.ids.append(doc_id)
+            self.files.append(meta.get("file", ""))
+            self.lines.append(int(meta.get("line", 0)))
+            self.end_lines.append(int(meta.get("end_line", meta.get("line", 0))))
+            refs_by_node.append((meta.get("refs") or "").split())
+            if meta.get("name"):
+                nodes_by_name.setdefault(meta["name"], []).append(node)
+
+        edges = set()
+        for source, names in enumerate(refs_by_node):
+            for name in names:
+                for target in nodes_by_name.get(name, ()):
+                    if target != source:
+                        edges.add((source, target))
+        edges = sorted(edges)
+
+        n_nodes = len(self.ids)
+        self.callee_offsets, self.callees = _csr(n_nodes, edges)
+        self.caller_offsets, self.callers = _csr(n_nodes, sorted((t, s) for s, t in edges))
+        # A name defined k times splits its edge weight k ways
+        self.ambiguity = array('i', [1] * n_nodes)
+        for nodes in nodes_by_name.values():
+            for node in nodes:
+                self.ambiguity[node] = len(nodes)
+
+        # Per-file definitions sorted by start line, for locating a finding's enclosing symbol
+        self._by_file = {}
+        for node in sorted(range(n_nodes), key=lambda i: (self.files[i], self.lines[i])):
+            self._by_file.setdefault(self.files[node], []).append(node)
+        self._starts_by_file = {f: [self.lines[n] for n in nodes] for f, nodes in self._by_file.items()}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _resolve_file(self, file_path):
+        """Maps a scanner path (often absolute) onto an indexed relative path."""
+        if file_path in self._by_file:
+            return file_path
+        normalized = file_path.replace("\\", "/")
+        best = None
+        for indexed in self._by_file:
+            if normalized.endswith("/" + indexed) and (best is None or len(indexed) > len(best)):
+                best = indexed
+        return best
+
+    def enclosing(self, file_path, line):
+        """Returns the innermost definition containing a 0-based line, or None."""
+        indexed = self._resolve_file(file_path)
+        if indexed is None:
+            return None
+        nodes = self._by_file[indexed]
+        best = None
+        for node in reversed(nodes[:bisect.bisect_right(self._starts_by_file[indexed], line)]):
+            if self.end_lines[node] >= line and (
+                    best is None or self.end_lines[node] - self.lines[node] < self.end_lines[best] - self.lines[best]):
+                best = node
+        return best
+
+    def _neighbours(self, node):
+        for i in range(self.callee_offsets[node], self.callee_offsets[node + 1]):
+            yield self.callees[i], CALLEE_WEIGHT
+        for i in range(self.caller_offsets[node], self.caller_offsets[node + 1]):
+            yield self.callers[i], CALLER_WEIGHT
+
+    def related(self, locations, n_results=5):
+        """
+        Ranks the definitions most relevant to a list of (file_path, 0-based line) locations:
+        callees and callers of the definitions enclosing those lines, decaying per hop.
+        Returns doc ids, best first. The enclosing definitions themselves are excluded.
+        """
+        seeds = set()
+        for file_path, line in locations:
+            node = self.enclosing(file_path, line)
+            if node is not None:
+                seeds.add(node)
+        if not seeds:
+            return []
+
+        scores = {}
+        frontier = {node: 1.0 for node in seeds}
+        visited = set(seeds)
+        for _ in range(MAX_HOPS):
+            next_frontier = {}
+            for node, weight in frontier.items():
+                for neighbour, edge_weight in self._neighbours(node):
+                    if neighbour in seeds:
+                        continue
+                    score = weight * edge_weight / self.ambiguity[neighbour]
+                    if self.files[neighbour] == self.files[node]:
+                        score *= SAME_FILE_WEIGHT
+                    scores[neighbour] = scores.get(neighbour, 0.0) + score
+                    if neighbour not in visited:
+                        next_frontier[neighbour] = max(next_frontier.get(neighbour, 0.0), score * HOP_DECAY)
+            visited.update(next_frontier)
+            frontier = next_frontier
+
+        top = heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+        return [self.ids[node] for node, _ in top]
@@ -0,0 +1,25 @@
+"""
+Shared test setup. The API modules import each other by bare name, so the api/
+directory goes on the import path. Run from the api/ directory:
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """The database module on a fresh, migrated SQLite file."""
+    import database
+    monkeypatch.setattr(database, "DATABASE_URL", None)
+    monkeypatch.setattr(database, "SQLITE_PATH", str(tmp_path / "vouch.db"))
+    database.close_pool()
+    database._clear_caches()
+    database._cache_sync.update(at=None, since=None, seen={})
+    database.init_db()
+    yield database
+    database.close_pool()
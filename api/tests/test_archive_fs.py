@@ -0,0 +1,89 @@
+import os
+import stat
+import zipfile
+
+import pytest
+
+import archive_fs
+from archive_fs import ArchiveFS, is_scan_target
+
+
+def _zip(tmp_path, members, symlinks=()):
+    zip_path = tmp_path / "upload.zip"
+    with zipfile.ZipFile(zip_path, "w") as zf:
+        for name, content in members.items():
+            zf.writestr(name, content)
+        for name, link_target in symlinks:
+            info = zipfile.ZipInfo(name)
+            info.external_attr = (stat.S_IFLNK | 0o777) << 16
+            zf.writestr(info, link_target)
+    return str(zip_path)
+
+
+def _extracted(dest):
+    return sorted(
+        os.path.relpath(os.path.join(d, f), dest).replace(os.sep, "/") for d, _, files in os.walk(dest) for f in files
+    )
+
+
+def test_is_scan_target_skips_dependencies_assets_and_large_files(monkeypatch):
+    monkeypatch.setattr(archive_fs, "MAX_SCAN_FILE_BYTES", 100)
+    assert is_scan_target("src/app.py", 10)
+    assert not is_scan_target("node_modules/x/index.js", 10)
+    assert not is_scan_target("web/.git/config", 10)
+    assert not is_scan_target("static/logo.PNG", 10)
+    assert not is_scan_target("dist/app.min.js", 10)
+    assert not is_scan_target("src/huge.py", 101)
+    assert is_scan_target("package-lock.json", 10_000)
+
+
+def test_extract_scan_targets_writes_only_scan_targets(tmp_path):
+    zip_path = _zip(tmp_path, {
+        "app/main.py": "print(1)\n",
+        "app/vendor/lib.py": "x = 1\n",
+        "app/img/logo.png": "png",
+        "package.json": "{}",
+    })
+    dest = str(tmp_path / "out")
+    with ArchiveFS(zip_path) as archive:
+        assert archive.files() == ["app/main.py", "app/vendor/lib.py", "app/img/logo.png", "package.json"]
+        assert archive.extract_scan_targets(dest) == (2, 11)
+    assert _extracted(dest) == ["app/main.py", "package.json"]
+
+
+@pytest.mark.parametrize("name", ["../evil.py", "app/../../evil.py", "/tmp/evil.py"])
+def test_extract_scan_targets_rejects_path_traversal(tmp_path, name):
+    zip_path = _zip(tmp_path, {"ok.py": "", name: "pwned"})
+    dest = tmp_path / "a" / "out"
+    with ArchiveFS(zip_path) as archive:
+        with pytest.raises(ValueError):
+            archive.extract_scan_targets(str(dest))
+    assert not (tmp_path / "a" / "evil.py").exists() and not (tmp_path / "evil.py").exists()
+
+
+def test_extract_scan_targets_skips_symlink_members(tmp_path):
+    zip_path = _zip(tmp_path, {"app.py": "x = 1\n"}, symlinks=[("secrets.py", "/etc/passwd")])
+    dest = tmp_path / "out"
+    with ArchiveFS(zip_path) as archive:
+        assert archive.extract_scan_targets(str(dest)) == (1, 6)
+    assert _extracted(str(dest)) == ["app.py"]
+
+
+def test_extract_scan_targets_checks_the_real_destination(tmp_path):
+    # A symlink inside the destination must not redirect writes outside of it
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    dest = tmp_path / "out"
+    dest.mkdir()
+    os.symlink(outside, dest / "app")
+    zip_path = _zip(tmp_path, {"app/main.py": "print(1)\n"})
+    with ArchiveFS(zip_path) as archive:
+        with pytest.raises(ValueError):
+            archive.extract_scan_targets(str(dest))
+    assert list(outside.iterdir()) == []
+
+    # A destination reached through a symlink (e.g. a tmpfs mount) is fine
+    os.symlink(outside, tmp_path / "linked")
+    with ArchiveFS(zip_path) as archive:
+        assert archive.extract_scan_targets(str(tmp_path / "linked" / "scan")) == (1, 9)
+    assert (outside / "scan" / "app" / "main.py").read_text() == "print(1)\n"
@@ -0,0 +1,33 @@
+import time
+
+import pytest
+from fastapi import HTTPException
+
+main = pytest.importorskip("main", reason="the scan pipeline dependencies are not installed")
+jwt = pytest.importorskip("jwt")
+
+SECRET = "test-secret-with-enough-bytes-for-hs256"
+
+
+@pytest.fixture
+def hs256(monkeypatch):
+    monkeypatch.setattr(main, "SUPABASE_JWT_SECRET", SECRET)
+    monkeypatch.setattr(main, "SUPABASE_ES256_KEY", None)
+    main._verified_tokens.clear()
+    yield
+    main._verified_tokens.clear()
+
+
+def test_cached_token_stops_validating_when_it_expires(hs256):
+    expires_at = int(time.time()) + 1
+    token = jwt.encode({"sub": "user-1", "exp": expires_at}, SECRET, algorithm="HS256")
+    assert main.verify_supabase_token(token) == "user-1"
+    # A cache entry that outlives the token (e.g. after a wall-clock adjustment) must not be honored
+    digest = next(iter(main._verified_tokens._data))
+    main._verified_tokens.set(digest, main._verified_tokens.get(digest), ttl=3600)
+    assert main.verify_supabase_token(token) == "user-1"
+
+    time.sleep(max(0, expires_at - time.time()) + 0.1)
+    with pytest.raises(HTTPException) as raised:
+        main.verify_supabase_token(token)
+    assert raised.value.status_code == 401
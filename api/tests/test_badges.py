@@ -0,0 +1,13 @@
+from badges import etag_matches, get_badge
+
+
+def test_etag_matches_lists_weak_tags_and_wildcard():
+    _, etag = get_badge(87)
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"stale", W/{etag}', etag)
+    assert etag_matches(f'W/"a,b" ,{etag}', etag)
+    assert etag_matches(" * ", etag)
+    assert not etag_matches('"stale"', etag)
+    assert not etag_matches(etag.strip('"'), etag)
+    assert not etag_matches(None, etag) and not etag_matches("", etag)
+    assert get_badge(150) == get_badge(100)
@@ -0,0 +1,162 @@
+import threading
+import time
+
+import pytest
+
+import database
+from database import PostgresPool, SQLitePool
+
+
+class FakePgConnection:
+    """Just enough of a psycopg2 connection for the pool: close, rollback and SELECT 1."""
+
+    def __init__(self):
+        self.closed = 0
+        self.rollbacks = 0
+        self.fail_ping = False
+
+    def close(self):
+        self.closed = 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def cursor(self):
+        conn = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql):
+                if conn.fail_ping:
+                    raise database.psycopg2.OperationalError("server closed the connection")
+        return Cursor()
+
+
+@pytest.fixture
+def pg_connections(monkeypatch):
+    opened = []
+
+    def connect(dsn):
+        opened.append(FakePgConnection())
+        return opened[-1]
+
+    monkeypatch.setattr(database.psycopg2, "connect", connect)
+    return opened
+
+
+def test_postgres_pool_reuses_idle_connections(pg_connections):
+    pool = PostgresPool("postgresql://test", min_size=1, max_size=2, timeout=0.1)
+    assert len(pg_connections) == 1
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    assert conn.rollbacks == 1  # Returned connections never keep a transaction open
+    stats = pool.stats()
+    assert (stats["open"], stats["in_use"], stats["created"], stats["acquired"]) == (1, 1, 1, 2)
+
+
+def test_postgres_pool_is_bounded_and_times_out(pg_connections):
+    pool = PostgresPool("postgresql://test", min_size=0, max_size=2, timeout=0.05)
+    held = [pool.acquire(), pool.acquire()]
+    with pytest.raises(TimeoutError):
+        pool.acquire()
+    assert pool.stats()["timeouts"] == 1
+    pool.release(held.pop())
+    assert pool.acquire() is not None
+    assert len(pg_connections) == 2
+
+
+def test_postgres_pool_discards_broken_and_unhealthy_connections(pg_connections, monkeypatch):
+    monkeypatch.setattr(database, "DB_POOL_HEALTHCHECK_AFTER", 0)
+    pool = PostgresPool("postgresql://test", min_size=0, max_size=2, timeout=0.1)
+    first = pool.acquire()
+    pool.release(first, broken=True)
+    assert first.closed and pool.stats()["discarded"] == 1
+
+    second = pool.acquire()
+    pool.release(second)
+    second.fail_ping = True
+    third = pool.acquire()
+    assert third is not second and second.closed
+    assert pool.stats()["health_check_failures"] == 1
+
+
+def test_sqlite_pool_keeps_one_connection_per_thread(tmp_path):
+    pool = SQLitePool(str(tmp_path / "pool.db"))
+    conn = pool.acquire()
+    nested = pool.acquire()
+    assert nested is conn
+    pool.release(nested)
+    pool.release(conn)
+    assert pool.acquire() is conn
+    pool.release(conn)
+
+    other = []
+
+    def borrow():
+        c = pool.acquire()
+        other.append(c)
+        pool.release(c)
+    thread = threading.Thread(target=borrow)
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+    assert pool.stats()["created"] == 2
+    pool.close()
+
+
+def test_sqlite_pool_rolls_back_uncommitted_work_on_release(tmp_path):
+    pool = SQLitePool(str(tmp_path / "pool.db"))
+    conn = pool.acquire(write=True)
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.commit()
+    pool.release(conn, write=True)
+
+    conn = pool.acquire(write=True)
+    conn.execute("INSERT INTO t VALUES (1)")
+    pool.release(conn, write=True)
+    conn = pool.acquire()
+    assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    pool.release(conn)
+    pool.close()
+
+
+def test_sqlite_connections_use_wal_and_the_configured_pragmas(tmp_path):
+    pool = SQLitePool(str(tmp_path / "pool.db"))
+    conn = pool.acquire()
+    pragma = lambda name: conn.execute(f"PRAGMA {name}").fetchone()[0]
+    assert pragma("journal_mode") == "wal"
+    assert pragma("synchronous") == 1  # NORMAL
+    assert pragma("temp_store") == 2  # MEMORY
+    assert pragma("cache_size") == -65536
+    assert pragma("busy_timeout") == database.SQLITE_BUSY_TIMEOUT * 1000
+    pool.release(conn)
+    pool.close()
+
+
+def test_writer_queue_is_reentrant_and_serves_writers_in_arrival_order():
+    queue = database._WriterQueue()
+    queue.acquire()
+    queue.acquire()  # Nested write in the same thread
+    order, threads = [], []
+    for i in range(4):
+        def write(i=i):
+            queue.acquire()
+            order.append(i)
+            queue.release()
+        threads.append(threading.Thread(target=write))
+        threads[-1].start()
+        while queue.waiting() != i + 2:  # The holder plus every writer started so far
+            time.sleep(0.001)
+    queue.release()
+    assert order == []
+    queue.release()
+    for thread in threads:
+        thread.join()
+    assert order == [0, 1, 2, 3]
+    assert queue.waiting() == 0
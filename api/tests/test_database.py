@@ -0,0 +1,320 @@
+import threading
+
+import pytest
+
+
+def _user(db, uid, installation_id):
+    db.get_or_create_user(uid)
+    db.link_github_installation(uid, installation_id)
+    return uid
+
+
+def _scan(db, user_id, score, repo=None, installation_id="42"):
+    return db.save_scan("github_pr", "python", {"score": score, "summary": "", "issues": []},
+                        user_id=user_id, installation_id=installation_id, repo=repo)
+
+
+def test_delete_scan_restores_installation_and_repo_badges(db):
+    user_id = _user(db, "user-1", "42")
+    _scan(db, user_id, 70, "acme/api")
+    _scan(db, user_id, 80, "acme/web")
+    latest_api = _scan(db, user_id, 90, "acme/api")
+
+    assert db.delete_scan(latest_api)
+    assert db.get_latest_score_by_installation("42") == 80
+    assert db.get_latest_score_by_installation("42", "acme/api") == 70
+    assert db.get_latest_score_by_installation("42", "acme/web") == 80
+
+
+def test_delete_last_scan_of_repo_removes_its_badge(db):
+    user_id = _user(db, "user-1", "42")
+    _scan(db, user_id, 60, "acme/api")
+    only_web = _scan(db, user_id, 85, "acme/web")
+
+    assert db.delete_scan(only_web)
+    assert db.get_latest_score_by_installation("42") == 60
+    # No scan left for the repository: the badge shows the default score
+    assert db.get_latest_score_by_installation("42", "acme/web") == 100
+    assert not db.delete_scan(only_web)
+
+
+def _issue(description, how_to_fix):
+    return {"title": "SQL injection", "severity": "HIGH", "file": "app.py",
+            "description": description, "how_to_fix": how_to_fix, "fixed_code_snippet": None}
+
+
+def _text_hashes(db):
+    with db._connection() as conn:
+        return {row[0] for row in conn.execute("SELECT hash FROM issue_texts")}
+
+
+def test_delete_scan_drops_archived_texts_only_it_references(db):
+    shared, first_only, second_only = "Query built by concatenation", "Use parameters", "Use the ORM"
+    first = db.save_scan("code_snippet", "python", {"score": 50, "issues": [_issue(shared, first_only)]})
+    second = db.save_scan("code_snippet", "python", {"score": 60, "issues": [_issue(shared, second_only)]})
+    assert db.archive_old_scans(older_than_days=0) == 2
+    assert len(_text_hashes(db)) == 3
+
+    assert db.delete_scan(first)
+    assert len(_text_hashes(db)) == 2
+    issue = db.get_scan_by_id(second)["issues"][0]
+    assert (issue["description"], issue["how_to_fix"]) == (shared, second_only)
+
+    assert db.delete_scan(second)
+    assert _text_hashes(db) == set()
+
+
+def test_create_job_shares_active_duplicates(db):
+    job_id, created = db.create_job("snippet_scan", {"code": "x"}, user_id="u", lane="snippet", dedup_key="k")
+    assert created
+    assert db.create_job("snippet_scan", {"code": "x"}, user_id="u", lane="snippet", dedup_key="k") == (job_id, False)
+
+    job = db.claim_job("w1", lane="snippet")
+    assert db.finish_job(job["id"], "w1", result={"score": 100})
+    new_id, created = db.create_job("snippet_scan", {"code": "x"}, user_id="u", lane="snippet", dedup_key="k")
+    assert created and new_id != job_id
+
+
+def test_create_job_retries_when_the_winning_duplicate_finished(db, monkeypatch):
+    # Between our INSERT and the duplicate lookup, a concurrent submission with the same key
+    # is queued (so our insert is ignored) and then finishes (so the lookup finds nothing)
+    connection = db._connection
+
+    class RacingCursor:
+        def __init__(self, cur):
+            self.cur, self.inserts = cur, 0
+
+        def execute(self, sql, params=()):
+            if sql.lstrip().startswith("INSERT"):
+                self.inserts += 1
+                if self.inserts == 1:
+                    self.cur.execute(sql, ("winner",) + tuple(params[1:]))
+            elif self.inserts == 1:
+                self.cur.execute("UPDATE jobs SET status = 'done' WHERE id = 'winner'")
+            return self.cur.execute(sql, params)
+
+        def __getattr__(self, name):
+            return getattr(self.cur, name)
+
+    class RacingConnection:
+        def __init__(self, conn):
+            self.conn = conn
+
+        def cursor(self):
+            return RacingCursor(self.conn.cursor())
+
+        def __getattr__(self, name):
+            return getattr(self.conn, name)
+
+    @db.contextmanager
+    def racing_connection(write=False):
+        with connection(write=write) as conn:
+            yield RacingConnection(conn)
+
+    monkeypatch.setattr(db, "_connection", racing_connection)
+    job_id, created = db.create_job("snippet_scan", {"code": "x"}, dedup_key="k")
+    assert created and job_id != "winner"
+    assert db.get_job(job_id)["status"] == "queued"
+    assert db.get_job("winner")["status"] == "done"
+
+
+def test_claim_job_by_id_claims_only_queued_jobs(db):
+    job_id, _ = db.create_job("snippet_scan", {"code": "x"}, user_id="u", lane="snippet")
+    job = db.claim_job_by_id(job_id, "inline-1")
+    assert (job["status"], job["worker_id"], job["attempts"], job["payload"]) == ("running", "inline-1", 1, {"code": "x"})
+    assert db.claim_job_by_id(job_id, "inline-2") is None
+    assert db.claim_job("w1", lane="snippet") is None
+
+
+def test_sqlite_pool_closes_the_connections_of_exited_threads(db):
+    db.get_job("warm")
+    before = db.get_pool_stats()["open"]
+    threads = [threading.Thread(target=db.get_job, args=("missing",)) for _ in range(50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = db.get_pool_stats()
+    assert stats["open"] == before
+    assert stats["closed"] >= 50
+
+
+def _write_from_another_process(db, sql, params, cache, key):
+    """A write as another API or worker process makes it: logged, but this process's caches untouched."""
+    with db._connection(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        cur.execute(*db._invalidation_statement(cache, key))
+        conn.commit()
+
+
+def test_caches_drop_entries_written_by_other_processes(db, monkeypatch):
+    monkeypatch.setattr(db, "CACHE_SYNC_INTERVAL", 0)
+    db.get_or_create_user("u1")
+    assert db.get_ignored_findings("u1", "repo") == frozenset()
+    assert db.get_latest_score_by_installation("42") == 100
+
+    _write_from_another_process(db, "UPDATE users SET tier = 'pro' WHERE id = ?", ("u1",), "user", "u1")
+    _write_from_another_process(
+        db, "INSERT INTO ignored_findings (user_id, repo_name, file_path, snippet_hash, created_at) VALUES (?, ?, ?, ?, ?)",
+        ("u1", "repo", "a.py", "h", "2026-01-01T00:00:00+00:00"), "ignored", ["u1", "repo"]
+    )
+    _write_from_another_process(
+        db, "INSERT INTO latest_scores (installation_id, repo, score, scan_id, updated_at) VALUES (?, ?, ?, ?, ?)",
+        ("42", "", 55, "s", "2026-01-01T00:00:00+00:00"), "latest_score", ["42", ""]
+    )
+
+    assert db.get_or_create_user("u1")["tier"] == "pro"
+    assert db.get_ignored_findings("u1", "repo") == frozenset({("a.py", "h")})
+    assert db.get_latest_score_by_installation("42") == 55
+
+
+def test_peeks_miss_until_the_caches_are_synced(db, monkeypatch):
+    monkeypatch.setattr(db, "CACHE_SYNC_INTERVAL", 3600)
+    db.get_or_create_user("u1")
+    assert db.peek_user("u1")["id"] == "u1"
+    db._cache_sync["at"] -= 3600
+    assert db.peek_user("u1") is None
+    db.get_or_create_user("u1")
+    assert db.peek_user("u1") is not None
+
+
+def test_ignored_findings_are_cached_until_a_finding_is_ignored(db, monkeypatch):
+    monkeypatch.setattr(db, "CACHE_SYNC_INTERVAL", 3600)
+    assert db.ignore_findings("u1", "acme/api", [("a.py", "h1"), ("b.py", "h2"), ("a.py", "h1")])
+    assert db.get_ignored_findings("u1", "acme/api") == frozenset({("a.py", "h1"), ("b.py", "h2")})
+
+    # Served from the cache: a row written behind its back is not seen yet
+    hits = db._ignored_cache.hits
+    with db._connection(write=True) as conn:
+        conn.execute("INSERT INTO ignored_findings (user_id, repo_name, file_path, snippet_hash, created_at) "
+                     "VALUES ('u1', 'acme/api', 'c.py', 'h3', '2026-01-01T00:00:00+00:00')")
+        conn.commit()
+    assert not db.is_finding_ignored("u1", "acme/api", "c.py", "h3")
+    assert db._ignored_cache.hits == hits + 1
+
+    assert db.ignore_findings("u1", "acme/api", [("d.py", "h4")])
+    assert db.get_ignored_findings("u1", "acme/api") == frozenset({("a.py", "h1"), ("b.py", "h2"), ("c.py", "h3"), ("d.py", "h4")})
+    assert db.get_ignored_findings("u1", "acme/web") == frozenset()
+
+
+def _count(db, sql, params=()):
+    with db._connection() as conn:
+        return conn.execute(sql, params).fetchone()[0]
+
+
+def test_save_scan_writes_the_scan_its_issues_and_the_counter_together(db):
+    db.get_or_create_user("u1")
+    issues = [_issue(f"Finding {i}", "Fix it") for i in range(25)]
+    scan_id = db.save_scan("code_snippet", "python", {"score": 40, "issues": issues}, user_id="u1")
+    assert _count(db, "SELECT COUNT(*) FROM issues WHERE scan_id = ?", (scan_id,)) == 25
+    assert db.get_or_create_user("u1")["scan_count"] == 1
+    assert [issue["description"] for issue in db.get_scan_by_id(scan_id)["issues"]] == [f"Finding {i}" for i in range(25)]
+
+
+def test_save_scan_rolls_everything_back_when_an_issue_fails(db):
+    db.get_or_create_user("u1")
+    issues = [_issue("Fine", "Fix it"), dict(_issue("Broken", "Fix it"), title=["not", "bindable"])]
+    assert db.save_scan("code_snippet", "python", {"score": 40, "issues": issues}, user_id="u1") == ""
+    assert _count(db, "SELECT COUNT(*) FROM scans") == 0
+    assert _count(db, "SELECT COUNT(*) FROM issues") == 0
+    assert db.get_or_create_user("u1")["scan_count"] == 0
+
+
+def test_scan_pages_do_not_skip_or_repeat_scans_with_equal_timestamps(db):
+    scan_ids = {_scan(db, None, score) for score in range(7)}
+    with db._connection(write=True) as conn:
+        conn.execute("UPDATE scans SET created_at = '2026-03-01T12:00:00+00:00'")
+        conn.commit()
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        scans, cursor = db.get_all_scans(limit=3, cursor=cursor, fields=["score"])
+        seen.extend(scan["id"] for scan in scans)
+        pages += 1
+        assert all(set(scan) == {"id", "score"} for scan in scans)
+        if cursor is None:
+            break
+    assert pages == 3
+    assert len(seen) == len(set(seen)) == 7 and set(seen) == scan_ids
+
+
+def test_scan_fields_and_cursors_are_validated(db):
+    with pytest.raises(ValueError):
+        db.get_all_scans(fields=["score", "password"])
+    with pytest.raises(ValueError):
+        db.get_all_scans(cursor=db.encode_cursor("2026-03-01"))
+    with pytest.raises(ValueError):
+        db.get_all_scans(cursor="not a cursor!")
+
+
+def test_scan_issues_are_projected_and_paged(db):
+    scan_id = db.save_scan("code_snippet", "python", {"score": 40, "issues": [_issue(f"Finding {i}", "Fix") for i in range(5)]})
+    scan = db.get_scan_by_id(scan_id, fields=["score", "issues"], issue_fields=["description"], issue_limit=2)
+    assert set(scan) == {"id", "score", "issues", "next_issue_cursor"}
+    described = [issue["description"] for issue in scan["issues"]]
+    while scan["next_issue_cursor"]:
+        scan = db.get_scan_by_id(scan_id, issue_fields=["description"], issue_limit=2, issue_cursor=scan["next_issue_cursor"])
+        described.extend(issue["description"] for issue in scan["issues"])
+    assert described == [f"Finding {i}" for i in range(5)]
+    assert db.get_scan_by_id(scan_id, fields=["score"]) == {"id": scan_id, "score": 40}
+
+
+def test_api_key_cache_follows_key_rotation_and_tier_changes(db, monkeypatch):
+    monkeypatch.setattr(db, "CACHE_SYNC_INTERVAL", 3600)
+    old_key = db.generate_api_key("u1")
+    assert db.get_user_by_api_key(old_key)["tier"] == "free"
+    assert db.peek_user_by_api_key(old_key)["id"] == "u1"
+    assert db.get_or_create_user("u1")["tier"] == "free" and db.peek_user("u1") is not None
+
+    assert db.update_subscription("u1", "pro", "cus_1", "sub_1")
+    assert db.peek_user_by_api_key(old_key) is None and db.peek_user("u1") is None
+    assert db.get_user_by_api_key(old_key)["tier"] == "pro"
+    assert db.get_or_create_user("u1")["tier"] == "pro"
+
+    new_key = db.generate_api_key("u1")
+    assert db.get_user_by_api_key(old_key) is None
+    assert db.get_user_by_api_key(new_key)["id"] == "u1"
+
+
+def test_unknown_api_keys_are_cached_as_invalid(db, monkeypatch):
+    monkeypatch.setattr(db, "CACHE_SYNC_INTERVAL", 3600)
+    assert db.get_user_by_api_key("vouch_unknown") is None
+    assert db.peek_user_by_api_key("vouch_unknown") == {}
+    assert db.peek_user_by_api_key("vouch_never_seen") is None
+
+
+def test_scan_analytics_are_read_from_the_daily_rollups(db):
+    db.get_or_create_user("u1")
+    for score, repo, severities in ((80, "acme/api", ["HIGH"]), (40, "acme/api", ["critical", "LOW"]), (90, "acme/web", [])):
+        issues = [dict(_issue("Finding", "Fix"), severity=severity) for severity in severities]
+        assert db.save_scan("github_pr", "python", {"score": score, "issues": issues}, user_id="u1", repo=repo)
+
+    today = db.datetime.now(db.timezone.utc).date().isoformat()
+    api = db.get_scan_analytics("u1", repo="acme/api")
+    assert api == [{"day": today, "repo": "acme/api", "scans": 2, "avg_score": 60.0, "min_score": 40, "last_score": 40,
+                    "issues": {"critical": 1, "high": 1, "medium": 0, "low": 1}}]
+    assert [(row["repo"], row["scans"]) for row in db.get_scan_analytics("u1")] == [("acme/api", 2), ("acme/web", 1)]
+    assert db.get_scan_analytics("u2") == []
+
+    # Scans are stored with UTC ISO-8601 timestamps, so they sort chronologically as text
+    scans, _ = db.get_all_scans(user_id="u1")
+    stamps = [scan["created_at"] for scan in scans]
+    assert stamps == sorted(stamps, reverse=True) and all(s.endswith("+00:00") for s in stamps)
+
+
+def test_concurrent_writers_queue_instead_of_failing(db):
+    db.get_or_create_user("u1")
+    results = []
+
+    def scan_repeatedly():
+        for _ in range(10):
+            results.append(db.save_scan("code_snippet", "python", {"score": 50, "issues": [_issue("x", "y")]}, user_id="u1"))
+    threads = [threading.Thread(target=scan_repeatedly) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 80 and all(results)
+    assert db.get_or_create_user("u1")["scan_count"] == 80
+    assert _count(db, "SELECT COUNT(*) FROM issues") == 80
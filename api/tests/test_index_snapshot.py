@@ -0,0 +1,55 @@
+import struct
+
+import pytest
+
+import index_snapshot
+from index_snapshot import IndexSnapshot, write_snapshot
+
+
+def _namespaces():
+    yield "a", "1/acme/api", {"app.py": "h1", "db.py": "h2"}, iter([
+        ("app.py:main", "def main():\n    return run()\n", {"file": "app.py", "name": "main"}),
+        ("db.py:connect", "def connect(): ...", {"file": "db.py", "name": "connect"}),
+    ])
+    yield "b", "1/acme/web", {}, iter([])
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "index.vidx")
+    manifest = write_snapshot(path, _namespaces())
+    assert manifest["namespaces"]["a"]["symbols"] == 2
+
+    snapshot = IndexSnapshot(path)
+    try:
+        assert snapshot.namespace_name("a") == "1/acme/api"
+        assert snapshot.file_hashes("a") == {"app.py": "h1", "db.py": "h2"}
+        assert snapshot.file_hashes("b") == {} and snapshot.file_hashes("missing") == {}
+        assert list(snapshot.symbols("a", exclude_files={"db.py"})) == [
+            ("app.py:main", "def main():\n    return run()\n", {"file": "app.py", "name": "main"})
+        ]
+        assert list(snapshot.symbols("b")) == [] and list(snapshot.symbols("missing")) == []
+    finally:
+        snapshot.close()
+
+
+def test_snapshot_tables_are_streamed_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(index_snapshot, "_CHUNK_SIZE", 7)
+    symbols = [(f"f.py:s{i}", f"def s{i}(): pass", {"file": "f.py", "name": f"s{i}"}) for i in range(500)]
+    path = str(tmp_path / "index.vidx")
+    write_snapshot(path, iter([("a", "ns", {"f.py": "h"}, iter(symbols))]))
+    snapshot = IndexSnapshot(path)
+    try:
+        assert list(snapshot.symbols("a")) == symbols
+        assert snapshot.file_hashes("a") == {"f.py": "h"}
+    finally:
+        snapshot.close()
+
+
+def test_snapshot_of_another_format_version_is_rejected(tmp_path):
+    path = tmp_path / "index.vidx"
+    write_snapshot(str(path), _namespaces())
+    data = bytearray(path.read_bytes())
+    struct.pack_into("<I", data, 8, 1)
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError, match="version 1"):
+        IndexSnapshot(str(path))
@@ -0,0 +1,102 @@
+import pytest
+
+pytest.importorskip("chromadb")
+from indexer import CodeIndexer, _namespace_key, fcntl  # noqa: E402
+from symbol_extractor import parse_source  # noqa: E402
+
+needs_tree_sitter = pytest.mark.skipif(
+    parse_source("probe.py", b"") is None, reason="tree_sitter_languages is not installed"
+)
+
+NAMESPACE = "42/acme/api"
+
+
+def _names(result):
+    return [meta["name"] for meta in result["metadatas"][0]]
+
+
+def _generation(indexer):
+    return indexer.registry.get(ids=[_namespace_key(NAMESPACE)], include=["metadatas"])["metadatas"][0]["generation"]
+
+
+@needs_tree_sitter
+def test_other_process_reloads_namespace_after_a_write(tmp_path):
+    # Two indexers on one directory stand in for two job worker processes
+    writer, reader = CodeIndexer(db_path=str(tmp_path)), CodeIndexer(db_path=str(tmp_path))
+    assert reader.query_context("load_user", namespace=NAMESPACE)["ids"] == [[]]
+
+    writer.index_changed_files([("users.py", "def load_user(uid):\n    return db.get(uid)\n", None)], namespace=NAMESPACE)
+    assert _names(reader.query_context("load_user", namespace=NAMESPACE)) == ["load_user"]
+
+    writer.index_changed_files([("users.py", "def fetch_user(uid):\n    return db.get(uid)\n", None)], namespace=NAMESPACE)
+    assert _names(reader.query_context("fetch_user", namespace=NAMESPACE)) == ["fetch_user"]
+    assert reader.query_context("load", namespace=NAMESPACE)["ids"] == [[]]
+
+    writer.evict_namespace_key(_namespace_key(NAMESPACE))
+    assert reader.query_context("fetch_user", namespace=NAMESPACE)["ids"] == [[]]
+
+
+@needs_tree_sitter
+def test_unchanged_files_keep_the_generation(tmp_path):
+    indexer = CodeIndexer(db_path=str(tmp_path))
+    files = [("users.py", "def load_user(uid):\n    return uid\n", None)]
+    indexer.index_changed_files(files, namespace=NAMESPACE)
+    generation = _generation(indexer)
+    assert indexer.index_changed_files(files, namespace=NAMESPACE) == []
+    assert _generation(indexer) == generation
+
+
+@needs_tree_sitter
+def test_editing_one_function_leaves_the_other_symbols_untouched(tmp_path):
+    indexer = CodeIndexer(db_path=str(tmp_path))
+    old = "def first():\n    return 1\n\n\ndef second():\n    return 2\n\n\ndef third():\n    return 3\n"
+    indexer.index_changed_files([("nums.py", old, None)], namespace=NAMESPACE)
+    shard = indexer._get_shard(NAMESPACE)
+    before = shard.symbols.get(include=["documents", "metadatas"])
+
+    written = []
+    for method in ("add", "upsert", "update", "delete"):
+        original = getattr(shard.symbols, method)
+
+        def record(*args, _method=method, _original=original, **kwargs):
+            written.append((_method, kwargs.get("ids")))
+            return _original(*args, **kwargs)
+        setattr(shard.symbols, method, record)
+
+    new = old.replace("return 2", "return 22")
+    assert indexer.index_changed_files([("nums.py", new, None)], namespace=NAMESPACE) == ["nums.py"]
+    assert written == [("upsert", ["nums.py:second"])]
+    after = shard.symbols.get(include=["documents", "metadatas"])
+    unchanged = {i for i in before["ids"] if i != "nums.py:second"}
+    assert {i: (d, m) for i, d, m in zip(before["ids"], before["documents"], before["metadatas"]) if i in unchanged} == \
+        {i: (d, m) for i, d, m in zip(after["ids"], after["documents"], after["metadatas"]) if i in unchanged}
+
+
+@needs_tree_sitter
+def test_export_snapshot_merges_local_changes_without_creating_collections(tmp_path):
+    base = CodeIndexer(db_path=str(tmp_path / "base"))
+    base.index_changed_files([("a.py", "def old_a():\n    return 1\n", None)], namespace=NAMESPACE)
+    base.index_changed_files([("b.py", "def only_b():\n    return 2\n", None)], namespace="42/acme/web")
+    base.export_snapshot(str(tmp_path / "base.vidx"))
+
+    worker = CodeIndexer(db_path=str(tmp_path / "worker"), snapshot_path=str(tmp_path / "base.vidx"))
+    worker.index_changed_files([("a.py", "def new_a():\n    return 1\n", None)], namespace=NAMESPACE)
+    collections = len(worker.client.list_collections())
+    worker.export_snapshot(str(tmp_path / "merged.vidx"))
+    assert len(worker.client.list_collections()) == collections
+
+    merged = CodeIndexer(db_path=str(tmp_path / "fresh"), snapshot_path=str(tmp_path / "merged.vidx"))
+    assert _names(merged.query_context("new_a", namespace=NAMESPACE)) == ["new_a"]
+    assert merged.query_context("old_a", namespace=NAMESPACE)["ids"] == [[]]
+    assert _names(merged.query_context("only_b", namespace="42/acme/web")) == ["only_b"]
+
+
+@pytest.mark.skipif(fcntl is None, reason="no cross-process file lock on this platform")
+def test_write_lock_excludes_other_writers(tmp_path):
+    first, second = CodeIndexer(db_path=str(tmp_path)), CodeIndexer(db_path=str(tmp_path))
+    with first._write_lock():
+        with first._write_lock():  # Reentrant
+            with second._write_lock(blocking=False) as locked:
+                assert not locked
+    with second._write_lock(blocking=False) as locked:
+        assert locked
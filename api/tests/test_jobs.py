@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+jobs = pytest.importorskip("jobs", reason="the scan pipeline dependencies are not installed")
+main = pytest.importorskip("main", reason="the scan pipeline dependencies are not installed")
+
+
+@pytest.fixture
+def snippet_handler(monkeypatch):
+    calls = []
+
+    async def handler(payload, user_id):
+        calls.append((payload, user_id))
+        return {"score": 90}
+
+    monkeypatch.setitem(jobs.HANDLERS, "snippet_scan", handler)
+    return calls
+
+
+def test_run_inline_runs_a_queued_job_once(db, snippet_handler):
+    job_id, _ = db.create_job("snippet_scan", {"code": "x"}, user_id="u", lane="snippet")
+    assert asyncio.run(jobs.run_inline(job_id))
+    assert snippet_handler == [({"code": "x"}, "u")]
+    job = db.get_job(job_id)
+    assert (job["status"], job["result"]) == ("done", {"score": 90})
+    assert not asyncio.run(jobs.run_inline(job_id))
+    assert len(snippet_handler) == 1
+
+
+def test_job_outcome_of_a_pruned_job_is_not_found(db):
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(main._job_outcome("pruned", True, "Scan failed"))
+    assert raised.value.status_code == 404
+
+
+def test_running_jobs_does_not_grow_open_connections(db, snippet_handler):
+    def run(count):
+        for _ in range(count):
+            job_id, _ = db.create_job("snippet_scan", {"code": "x"}, user_id="u", lane="snippet")
+            jobs.run_job(db.claim_job_by_id(job_id, "w"), "w")
+
+    run(1)
+    before = db.get_pool_stats()["open"]
+    run(20)
+    assert db.get_pool_stats()["open"] == before
+    assert len(snippet_handler) == 21
+    assert jobs.heartbeats.active() == {}
@@ -0,0 +1,60 @@
+import hashlib
+import os
+import zipfile
+
+from archive_fs import ArchiveFS
+from manifest import build_manifest
+
+FILES = {
+    "app/main.py": b"import os\r\nprint(os.getcwd())\r\n",
+    "app/ui/App.TSX": b"export const App = () => null;\n",
+    "README.md": b"# demo\n",
+    "data/blob.dat": b"\x00\x01binary",
+    "node_modules/left-pad/index.js": b"module.exports = 1;\n",
+    ".git/config": b"[core]\n",
+    "logo.png": b"\x89PNG",
+}
+
+
+def _manifest(tmp_path):
+    zip_path = tmp_path / "repo.zip"
+    with zipfile.ZipFile(zip_path, "w") as zf:
+        for name, content in FILES.items():
+            zf.writestr(name, content)
+    dest = tmp_path / "repo"
+    with ArchiveFS(str(zip_path)) as archive:
+        archive.extract_scan_targets(str(dest))
+    return build_manifest(str(dest))
+
+
+def test_manifest_lists_extracted_scan_targets(tmp_path):
+    manifest = _manifest(tmp_path)
+    assert sorted(manifest.paths()) == ["README.md", "app/main.py", "app/ui/App.TSX", "data/blob.dat"]
+    assert "node_modules/left-pad/index.js" not in manifest
+    assert manifest.total_bytes == sum(len(FILES[path]) for path in manifest.paths())
+
+
+def test_manifest_entries_carry_hash_binary_flag_and_language(tmp_path):
+    manifest = _manifest(tmp_path)
+    main = manifest.get("app/main.py")
+    assert main.sha256 == hashlib.sha256(FILES["app/main.py"]).hexdigest()
+    assert (main.extension, main.language, main.binary) == (".py", "python", False)
+    assert manifest.get("app/ui/App.TSX").extension == ".tsx"
+    assert manifest.get("README.md").language is None
+    assert manifest.get("data/blob.dat").binary
+    assert [entry.path for entry in manifest.text_files()].count("data/blob.dat") == 0
+
+    text = manifest.read_text("app/main.py")
+    assert text == "import os\nprint(os.getcwd())\n"
+    assert manifest.text_sha256("app/main.py", text) == hashlib.sha256(text.encode()).hexdigest()
+    assert manifest.text_sha256("README.md", manifest.read_text("README.md")) == manifest.get("README.md").sha256
+
+
+def test_manifest_does_not_follow_symlinks(tmp_path):
+    (tmp_path / "outside.py").write_text("secret = 1\n")
+    root = tmp_path / "repo"
+    root.mkdir()
+    (root / "a.py").write_text("x = 1\n")
+    os.symlink(tmp_path / "outside.py", root / "link.py")
+    os.symlink(tmp_path, root / "parent")
+    assert build_manifest(str(root)).paths() == ["a.py"]
@@ -0,0 +1,101 @@
+import sqlite3
+
+import pytest
+
+import migrations
+from migrations import HOT_QUERIES, MIGRATIONS, apply_migrations, check_query_plans
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "vouch.db"))
+    yield conn
+    conn.close()
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def test_apply_migrations_is_idempotent(conn):
+    assert apply_migrations(conn, postgres=False) == [version for version, _, _ in MIGRATIONS]
+    assert apply_migrations(conn, postgres=False) == []
+    versions = [row[0] for row in conn.execute("SELECT version FROM schema_migrations ORDER BY version")]
+    assert versions == [version for version, _, _ in MIGRATIONS]
+
+
+def test_hot_queries_use_their_indexes(conn):
+    apply_migrations(conn, postgres=False)
+    plans = check_query_plans(conn, postgres=False)
+    assert set(plans) == set(HOT_QUERIES)
+    for name, (uses_index, plan) in plans.items():
+        assert uses_index, f"{name} does not use {HOT_QUERIES[name][2]}:\n{plan}"
+
+
+def test_failed_migration_leaves_no_partial_schema(conn, monkeypatch):
+    apply_migrations(conn, postgres=False)
+    version = MIGRATIONS[-1][0] + 1
+    broken = lambda postgres: ["ALTER TABLE jobs ADD COLUMN probe TEXT", "ALTER TABLE missing ADD COLUMN x TEXT"]
+    monkeypatch.setattr(migrations, "MIGRATIONS", MIGRATIONS + [(version, "broken", broken)])
+
+    with pytest.raises(sqlite3.OperationalError):
+        apply_migrations(conn, postgres=False)
+    assert "probe" not in _columns(conn, "jobs")
+    assert version not in {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+    assert conn.isolation_level == ""
+
+    # Once fixed, the same version applies cleanly
+    fixed = lambda postgres: ["ALTER TABLE jobs ADD COLUMN probe TEXT"]
+    monkeypatch.setattr(migrations, "MIGRATIONS", MIGRATIONS + [(version, "fixed", fixed)])
+    assert apply_migrations(conn, postgres=False) == [version]
+    assert "probe" in _columns(conn, "jobs")
+
+
+def test_migrations_take_the_write_lock(tmp_path):
+    path = str(tmp_path / "vouch.db")
+    first = sqlite3.connect(path)
+    apply_migrations(first, postgres=False)
+    first.execute("BEGIN IMMEDIATE")
+
+    second = sqlite3.connect(path, timeout=0.1)
+    with pytest.raises(sqlite3.OperationalError, match="locked"):
+        apply_migrations(second, postgres=False)
+    first.rollback()
+    assert apply_migrations(second, postgres=False) == []
+    first.close()
+    second.close()
+
+
+def test_archive_text_references_are_backfilled(conn, monkeypatch):
+    import scan_archive
+    monkeypatch.setattr(migrations, "MIGRATIONS", [m for m in MIGRATIONS if m[0] < 11])
+    apply_migrations(conn, postgres=False)
+    issues = [{"id": 1, "title": "XSS", "description": "Unescaped output", "how_to_fix": "Escape it"}]
+    blob, texts = scan_archive.pack_issues(issues, "zlib")
+    conn.execute("INSERT INTO scans (id, scan_type, language, score, summary, created_at) "
+                 "VALUES ('s1', 'code_snippet', 'python', 50, '', '2020-01-01')")
+    conn.execute("INSERT INTO scan_archive VALUES ('s1', 'zlib', 1, ?, '2020-01-01')", (blob,))
+    conn.commit()
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", MIGRATIONS)
+    assert 11 in apply_migrations(conn, postgres=False)
+    assert set(conn.execute("SELECT scan_id, hash FROM scan_archive_texts")) == {("s1", h) for h in texts}
+
+
+def test_daily_rollups_are_backfilled_from_existing_scans(conn, monkeypatch):
+    monkeypatch.setattr(migrations, "MIGRATIONS", [m for m in MIGRATIONS if m[0] < 5])
+    apply_migrations(conn, postgres=False)
+    conn.execute("INSERT INTO users (id, created_at) VALUES ('u1', '2026-01-01T00:00:00+00:00')")
+    for scan_id, score, created_at in (("s1", 80, "2026-03-01T08:00:00+00:00"), ("s2", 40, "2026-03-01T23:30:00+00:00"),
+                                       ("s3", 90, "2026-03-02T00:10:00+00:00")):
+        conn.execute("INSERT INTO scans (id, user_id, scan_type, language, score, summary, created_at) "
+                     "VALUES (?, 'u1', 'code_snippet', 'python', ?, '', ?)", (scan_id, score, created_at))
+    conn.executemany("INSERT INTO issues (scan_id, title, severity) VALUES (?, 'x', ?)",
+                     [("s1", "high"), ("s2", "CRITICAL"), ("s2", "LOW")])
+    conn.commit()
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", MIGRATIONS)
+    apply_migrations(conn, postgres=False)
+    rows = conn.execute("SELECT day, scan_count, score_sum, min_score, last_score, critical_issues, high_issues, "
+                        "low_issues FROM scan_rollups_daily ORDER BY day").fetchall()
+    assert rows == [("2026-03-01", 2, 120, 40, 40, 1, 1, 1), ("2026-03-02", 1, 90, 90, 90, 0, 0, 0)]
@@ -0,0 +1,77 @@
+from search_index import BM25Index, tokenize
+
+
+def _index(*docs):
+    index = BM25Index()
+    for doc_id, content, file_path, name in docs:
+        index.add_document(doc_id, content, {"file": file_path, "name": name}, name=name)
+    return index
+
+
+def test_tokenize_splits_identifiers_and_drops_stop_words():
+    tokens = tokenize("def getUserById(user_id): return self.db")
+    assert "getuserbyid" in tokens
+    assert {"get", "user", "by", "id", "user_id", "db"} <= set(tokens)
+    assert "def" not in tokens and "return" not in tokens and "self" not in tokens
+
+
+def test_query_ranks_name_match_above_body_mention():
+    index = _index(
+        ("a.py:load_user", "def load_user(uid):\n    return query(uid)", "a.py", "load_user"),
+        ("b.py:render", "def render(page):\n    user = load_user(page.uid)", "b.py", "render"),
+        ("c.py:hash_password", "def hash_password(pw):\n    return bcrypt(pw)", "c.py", "hash_password"),
+    )
+    hits = index.query("load_user(request.uid)", n_results=3)
+    assert [doc_id for doc_id, _, _, _ in hits] == ["a.py:load_user", "b.py:render"]
+    assert hits[0][1] > hits[1][1] > 0
+    assert hits[0][3] == {"file": "a.py", "name": "load_user"}
+
+
+def test_rare_terms_outweigh_common_ones():
+    index = _index(
+        ("x:1", "token token session", "x.py", None),
+        ("y:1", "session cookie", "y.py", None),
+        ("z:1", "session header", "z.py", None),
+    )
+    assert index.query("token session", n_results=1)[0][0] == "x:1"
+    assert index.query("cookie session", n_results=1)[0][0] == "y:1"
+
+
+def test_add_document_replaces_existing_id():
+    index = _index(("a.py:f", "alpha", "a.py", None))
+    index.add_document("a.py:f", "beta", {"file": "a.py"})
+    assert len(index) == 1
+    assert index.query("alpha") == []
+    assert index.query("beta")[0][0] == "a.py:f"
+    assert index.total_length == 1
+
+
+def test_remove_file_drops_its_documents_and_postings():
+    index = _index(
+        ("a.py:f", "sanitize input", "a.py", "f"),
+        ("a.py:g", "escape output", "a.py", "g"),
+        ("b.py:h", "sanitize output", "b.py", "h"),
+    )
+    index.remove_file("a.py")
+    assert len(index) == 1
+    assert "a.py" not in index.file_docs
+    assert "escape" not in index.postings
+    assert [doc_id for doc_id, _, _, _ in index.query("sanitize escape")] == ["b.py:h"]
+    assert index.total_length == index.doc_lengths["b.py:h"]
+
+    index.remove_file("a.py")  # Already gone
+    assert len(index) == 1
+
+
+def test_update_metadata_keeps_postings():
+    index = _index(("a.py:f", "verify signature", "a.py", "f"))
+    index.update_metadata("a.py:f", {"file": "a.py", "name": "f", "line": 40})
+    doc_id, _, content, meta = index.query("signature")[0]
+    assert (doc_id, content, meta["line"]) == ("a.py:f", "verify signature", 40)
+
+    index.update_metadata("missing", {"file": "a.py"})
+    assert "missing" not in index.documents
+
+
+def test_empty_index_returns_no_hits():
+    assert BM25Index().query("anything") == []
@@ -0,0 +1,164 @@
+import difflib
+
+import pytest
+
+from symbol_extractor import (
+    _hunk_edits, changed_rows, definitions_from_tree, definitions_in_rows, extract_definitions, parse_patch_hunks,
+    parse_source, reparse_incremental, tree_edits, update_definitions
+)
+
+needs_tree_sitter = pytest.mark.skipif(
+    parse_source("probe.py", b"") is None, reason="tree_sitter_languages is not installed"
+)
+
+OLD_SOURCE = '''import os
+
+
+def load_config(path):
+    with open(path) as f:
+        return f.read()
+
+
+class Store:
+    def __init__(self, url):
+        self.url = url
+
+    def get(self, key):
+        return fetch(self.url, key)
+
+    def put(self, key, value):
+        return send(self.url, key, value)
+
+
+def helper(x):
+    return x * 2
+
+
+def main():
+    store = Store(os.environ["URL"])
+    return store.get(load_config("k"))
+'''
+
+# Three separate hunks: an edited line, an inserted method and a replaced function
+NEW_SOURCE = '''import os
+
+
+def load_config(path, encoding="utf-8"):
+    with open(path) as f:
+        return f.read()
+
+
+class Store:
+    def __init__(self, url):
+        self.url = url
+
+    def get(self, key):
+        return fetch(self.url, key)
+
+    def delete(self, key):
+        return send(self.url, key, None)
+
+    def put(self, key, value):
+        return send(self.url, key, value)
+
+
+def helper(x):
+    return x * 2
+
+
+def main(argv=None):
+    store = Store(os.environ.get("URL", "sqlite://"))
+    store.delete("stale")
+    return store.get(load_config("k"))
+'''
+
+
+def _patch(old, new):
+    return "".join(difflib.unified_diff(old.splitlines(keepends=True), new.splitlines(keepends=True), n=1))
+
+
+def _fresh(source):
+    data = source.encode()
+    tree = parse_source("store.py", data)
+    return tree.root_node.sexp(), definitions_from_tree("store.py", data, tree)
+
+
+def _incremental(old, new, patch):
+    old_bytes, new_bytes = old.encode(), new.encode()
+    tree = reparse_incremental("store.py", old_bytes, parse_source("store.py", old_bytes), new_bytes, patch)
+    return tree.root_node.sexp(), definitions_from_tree("store.py", new_bytes, tree)
+
+
+def test_parse_patch_hunks_defaults_missing_lengths_to_one():
+    patch = "@@ -3 +3,2 @@ def f():\n-a\n+b\n+c\n@@ -10,4 +11,0 @@\n"
+    assert parse_patch_hunks(patch) == [(3, 1, 3, 2), (10, 4, 11, 0)]
+    assert parse_patch_hunks(None) == []
+
+
+def test_hunk_edits_reject_patch_for_another_revision():
+    patch = _patch(OLD_SOURCE, NEW_SOURCE)
+    assert len(_hunk_edits(OLD_SOURCE.encode(), NEW_SOURCE.encode(), parse_patch_hunks(patch))) == 3
+    other_base = OLD_SOURCE.replace("x * 2", "x * 3").encode()
+    assert _hunk_edits(other_base, NEW_SOURCE.encode(), parse_patch_hunks(patch)) is None
+
+
+@needs_tree_sitter
+def test_multi_hunk_patch_reparse_matches_fresh_parse():
+    incremental = _incremental(OLD_SOURCE, NEW_SOURCE, _patch(OLD_SOURCE, NEW_SOURCE))
+    assert incremental == _fresh(NEW_SOURCE)
+    names = [d["metadata"]["name"] for d in incremental[1]]
+    assert names == ["load_config", "Store", "__init__", "get", "delete", "put", "helper", "main"]
+
+
+@needs_tree_sitter
+def test_insert_and_delete_only_hunks_match_fresh_parse():
+    # Pure insertion (old length 0) and pure deletion (new length 0)
+    inserted = OLD_SOURCE.replace("def helper(x):", "def added():\n    return helper(1)\n\n\ndef helper(x):")
+    assert _incremental(OLD_SOURCE, inserted, _patch(OLD_SOURCE, inserted)) == _fresh(inserted)
+    removed = OLD_SOURCE.replace("def helper(x):\n    return x * 2\n\n\n", "")
+    assert _incremental(OLD_SOURCE, removed, _patch(OLD_SOURCE, removed)) == _fresh(removed)
+
+
+@needs_tree_sitter
+def test_stale_patch_falls_back_to_span_edit():
+    other_base = OLD_SOURCE.replace("x * 2", "x * 3")
+    patch = _patch(OLD_SOURCE, NEW_SOURCE)
+    assert _incremental(other_base, NEW_SOURCE, patch) == _fresh(NEW_SOURCE)
+    assert _incremental(OLD_SOURCE, NEW_SOURCE, None) == _fresh(NEW_SOURCE)
+
+
+@needs_tree_sitter
+def test_definitions_carry_lines_and_references():
+    definitions = {d["metadata"]["name"]: d for d in extract_definitions("store.py", NEW_SOURCE)}
+    assert definitions["delete"]["id"] == "store.py:delete"
+    assert definitions["delete"]["metadata"]["line"] == 15
+    assert definitions["delete"]["metadata"]["refs"] == "send"
+    assert definitions["main"]["metadata"]["refs"].split() == ["Store", "delete", "get", "load_config"]
+
+
+def _updated(old, new, patch):
+    old_bytes, new_bytes = old.encode(), new.encode()
+    edits = tree_edits(old_bytes, new_bytes, patch)
+    tree = reparse_incremental("store.py", old_bytes, parse_source("store.py", old_bytes), new_bytes, edits=edits)
+    rows = changed_rows(edits)
+    changed = definitions_in_rows("store.py", new_bytes, tree, rows)
+    return changed, update_definitions("store.py", extract_definitions("store.py", old), changed, rows)
+
+
+@needs_tree_sitter
+def test_updating_the_changed_rows_matches_a_full_extraction():
+    inserted = OLD_SOURCE.replace("def helper(x):", "def added():\n    return helper(1)\n\n\ndef helper(x):")
+    removed = OLD_SOURCE.replace("def helper(x):\n    return x * 2\n\n\n", "")
+    for new in (NEW_SOURCE, inserted, removed):
+        for patch in (_patch(OLD_SOURCE, new), None):
+            assert _updated(OLD_SOURCE, new, patch)[1] == extract_definitions("store.py", new)
+
+
+@needs_tree_sitter
+def test_only_definitions_around_the_edit_are_extracted_again():
+    new = OLD_SOURCE.replace("return x * 2", "return x * 3")
+    changed, _ = _updated(OLD_SOURCE, new, None)
+    assert [d["metadata"]["name"] for d in changed] == ["helper"]
+    edited = OLD_SOURCE.replace("return fetch(self.url, key)", "return fetch(self.url, key, cache(key))")
+    changed, _ = _updated(OLD_SOURCE, edited, None)
+    assert [(d["metadata"]["name"], d["metadata"]["refs"]) for d in changed] == [("Store", ""), ("get", "cache fetch")]
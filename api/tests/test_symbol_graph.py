@@ -0,0 +1,86 @@
+import pytest
+
+from symbol_graph import CALLER_WEIGHT, HOP_DECAY, SAME_FILE_WEIGHT, SymbolGraph
+
+
+def _doc(file_path, name, line, end_line, refs=""):
+    return f"{file_path}:{name}", ("", {"file": file_path, "name": name, "line": line, "end_line": end_line, "refs": refs})
+
+
+def _graph(*docs):
+    return SymbolGraph(dict(docs))
+
+
+@pytest.fixture
+def graph():
+    # handler -> validate -> escape, handler -> save -> connect, other -> handler
+    return _graph(
+        _doc("a.py", "handler", 0, 10, "validate save"),
+        _doc("a.py", "validate", 12, 20, "escape"),
+        _doc("b.py", "save", 0, 5, "connect"),
+        _doc("b.py", "connect", 7, 9),
+        _doc("c.py", "escape", 0, 3),
+        _doc("c.py", "other", 5, 8, "handler"),
+    )
+
+
+def test_related_ranks_callees_callers_and_second_hop(graph):
+    related = graph.related([("a.py", 3)], n_results=10)
+    # Callee in another file, then caller, then same-file callee, then two-hop neighbours
+    assert related[:3] == ["b.py:save", "c.py:other", "a.py:validate"]
+    assert set(related[3:]) == {"c.py:escape", "b.py:connect"}
+    assert "a.py:handler" not in related
+
+
+def test_related_respects_n_results(graph):
+    assert graph.related([("a.py", 3)], n_results=1) == ["b.py:save"]
+
+
+def test_related_without_enclosing_definition_is_empty(graph):
+    assert graph.related([("a.py", 11)]) == []
+    assert graph.related([("unknown.py", 1)]) == []
+
+
+def test_scanner_paths_resolve_to_indexed_files(graph):
+    assert graph.related([("/tmp/scan/extracted/a.py", 3)], n_results=1) == ["b.py:save"]
+
+
+def test_enclosing_picks_innermost_definition():
+    graph = _graph(
+        _doc("m.py", "Service", 0, 30),
+        _doc("m.py", "run", 4, 12),
+        _doc("m.py", "stop", 14, 20),
+    )
+    assert graph.ids[graph.enclosing("m.py", 6)] == "m.py:run"
+    assert graph.ids[graph.enclosing("m.py", 13)] == "m.py:Service"
+    assert graph.enclosing("m.py", 31) is None
+
+
+def test_ambiguous_names_split_their_weight():
+    graph = _graph(
+        _doc("a.py", "main", 0, 5, "parse helper"),
+        _doc("b.py", "parse", 0, 5),
+        _doc("c.py", "parse", 0, 5),
+        _doc("d.py", "helper", 0, 5),
+    )
+    ids = graph.related([("a.py", 1)], n_results=3)
+    assert ids[0] == "d.py:helper"
+    assert set(ids[1:]) == {"b.py:parse", "c.py:parse"}
+
+
+def test_hop_decay_and_same_file_weight_order_results():
+    # seed -> mid -> deep (two hops forward) and caller -> seed (one hop backwards)
+    def graph(caller_file):
+        return _graph(
+            _doc("a.py", "seed", 0, 5, "mid"),
+            _doc("b.py", "mid", 0, 5, "deep"),
+            _doc("c.py", "deep", 0, 5),
+            _doc(caller_file, "caller", 10, 15, "seed"),
+        )
+
+    # CALLER_WEIGHT beats CALLEE_WEIGHT * HOP_DECAY...
+    assert CALLER_WEIGHT > HOP_DECAY
+    assert graph("d.py").related([("a.py", 1)]) == ["b.py:mid", "d.py:caller", "c.py:deep"]
+    # ...until the caller is in the finding's own file
+    assert CALLER_WEIGHT * SAME_FILE_WEIGHT < HOP_DECAY
+    assert graph("a.py").related([("a.py", 1)]) == ["b.py:mid", "c.py:deep", "a.py:caller"]
@@ -0,0 +1,36 @@
+from ttl_cache import TTLCache
+
+
+def test_entries_expire_after_their_ttl():
+    cache = TTLCache(maxsize=4, ttl=60)
+    cache.set("fresh", 1)
+    cache.set("expired", 2, ttl=0)
+    assert cache.get("fresh") == 1
+    assert cache.get("expired", "default") == "default"
+    assert len(cache) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_invalidation():
+    cache = TTLCache()
+    cache.set("k1", {"id": "u1", "tier": "free"})
+    cache.set("k2", {"id": "u1", "tier": "free"})
+    cache.set("k3", {"id": "u2", "tier": "pro"})
+    cache.invalidate("k3")
+    cache.invalidate("missing")
+    assert cache.get("k3") is None
+    cache.invalidate_where(lambda user: user["id"] == "u1")
+    assert len(cache) == 0
+    cache.set("k1", None)
+    cache.clear()
+    assert cache.stats() == {"size": 0, "maxsize": 1024, "hits": 0, "misses": 1}
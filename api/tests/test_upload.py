@@ -0,0 +1,50 @@
+import hashlib
+import io
+import zipfile
+
+import pytest
+from fastapi import HTTPException
+
+main = pytest.importorskip("main", reason="the scan pipeline dependencies are not installed")
+
+
+class EndlessUpload:
+    """An upload that never ends; counts the bytes handed out."""
+
+    def __init__(self):
+        self.sent = 0
+
+    def read(self, size):
+        self.sent += size
+        return b"\0" * size
+
+
+def _zip_bytes():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr("app/main.py", "print('hello')\n")
+    return buffer.getvalue()
+
+
+def test_spool_upload_returns_the_sha256_of_the_archive(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "UPLOAD_CHUNK_SIZE", 16)
+    data = _zip_bytes()
+    zip_path = tmp_path / "upload.zip"
+    assert main._spool_upload(io.BytesIO(data), str(zip_path), str(tmp_path / "out")) == hashlib.sha256(data).hexdigest()
+    assert zip_path.read_bytes() == data
+
+
+def test_spool_upload_stops_reading_past_the_size_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "MAX_UPLOAD_SIZE_MB", 1)
+    monkeypatch.setattr(main, "UPLOAD_CHUNK_SIZE", 64 * 1024)
+    source, zip_path = EndlessUpload(), tmp_path / "upload.zip"
+    with pytest.raises(HTTPException) as error:
+        main._spool_upload(source, str(zip_path), str(tmp_path / "out"))
+    assert error.value.status_code == 400
+    assert source.sent == 1024 * 1024 + 64 * 1024
+    assert zip_path.stat().st_size <= 1024 * 1024
+
+
+def test_spool_upload_rejects_files_that_are_not_zips(tmp_path):
+    with pytest.raises(zipfile.BadZipFile):
+        main._spool_upload(io.BytesIO(b"not a zip"), str(tmp_path / "upload.zip"), str(tmp_path / "out"))